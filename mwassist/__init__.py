@@ -1,2 +0,0 @@
-from mwassist import gui
-from mwassist import sparam
@@ -0,0 +1,330 @@
+'''
+Benchmarks of the load, statistics and plot paths
+
+Generates synthetic touchstone lots in a temporary directory and times
+parsing, loading, interpolation, averaging and offscreen (Agg) plotting on
+them, recording the peak memory of each step.  Results are written as JSON
+so runs before and after e.g. a scikit-rf or matplotlib upgrade can be
+compared:
+
+    python -m mwassist.benchmark --lots 200x201x2 50x1601x4 -o before.json
+    python -m mwassist.benchmark --lots 200x201x2 50x1601x4 -o after.json --compare before.json
+
+@author: khershberger
+'''
+
+import argparse
+import collections
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import skrf
+
+from mwassist.sparam import touchstone
+from mwassist.sparam.cache import touchstoneCache
+from mwassist.sparam.loader import touchstoneLoader
+from mwassist.sparam.stats import (
+    calcNetworkSummary,
+    commonFrequency,
+    polarMean,
+    stackNetworks
+    )
+
+
+lotSpec = collections.namedtuple('lotSpec', ['devices', 'points', 'ports'])
+
+
+def parseLotSpec(text):
+    """
+    Parses 'DEVICESxPOINTSxPORTS', e.g. '200x201x2'
+    """
+    try:
+        devices, points, ports = (int(v) for v in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid lot {:s}, expected DEVICESxPOINTSxPORTS'.format(text))
+    return lotSpec(devices, points, ports)
+
+
+def syntheticS(nPoints, nports, rng, fStart=1e9, fStop=10e9):
+    """
+    S-parameters of a matched, lossy line-like device with random per-device
+    variation: returns (f, s) with s of shape (nPoints, nports, nports)
+    """
+    f = np.linspace(fStart, fStop, nPoints)
+    delay = 0.5e-9 * (1 + 0.02*rng.standard_normal())
+    loss = 10**((-1.0 - 0.5*f/fStop + 0.1*rng.standard_normal()) / 20)
+
+    s = np.empty((nPoints, nports, nports), dtype=complex)
+    transmission = loss * np.exp(-2j*np.pi*f*delay)
+    reflection = 0.1 * (1 + 0.2*rng.standard_normal((nPoints, nports))) * np.exp(2j*np.pi*rng.random(nports))
+    for row in range(nports):
+        for col in range(nports):
+            s[:, row, col] = reflection[:, row] if row == col else transmission
+    s *= 1 + 0.01*(rng.standard_normal(s.shape) + 1j*rng.standard_normal(s.shape))
+    return f, s
+
+
+def writeTouchstone(filename, f, s):
+    """
+    Writes a touchstone v1 file in RI format
+    """
+    return touchstone.writeTouchstone(filename, f, s, comments='Synthetic benchmark data', precision=8)
+
+
+def writeSyntheticLot(directory, spec, seed=0, mixedGrid=True):
+    """
+    Writes spec.devices touchstone files into directory and returns their
+    names.  With mixedGrid every other device is written on a grid with one
+    point less so the interpolation path is exercised.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    filelist = []
+    for k in range(spec.devices):
+        nPoints = spec.points - 1 if mixedGrid and k % 2 == 1 and spec.points > 2 else spec.points
+        f, s = syntheticS(nPoints, spec.ports, rng)
+        filename = os.path.join(directory, 'dev{:05d}.s{:d}p'.format(k, spec.ports))
+        writeTouchstone(filename, f, s)
+        filelist.append(filename)
+    return filelist
+
+
+def measure(fn, repeat=3, memory=True):
+    """
+    Times fn() repeat times and, with memory=True, runs it once more under
+    tracemalloc for its peak allocation.  Returns (result of the last call,
+    dictionary of measurements).
+    """
+    times = []
+    result = None
+    for k in range(repeat):
+        result = None
+        gc.collect()
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+
+    measurement = {'times':  times,
+                   'min':    min(times),
+                   'median': float(np.median(times))}
+
+    if memory:
+        result = None
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = fn()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        measurement['peakBytes'] = peak
+
+    return result, measurement
+
+
+def plotAgg(networks, mode, nports):
+    """
+    Draws all traces plus the mean in dB on an offscreen Agg figure the way
+    sparamPlot does for the given render mode ('collection', 'density' or
+    'skrf').  Returns the number of artists drawn.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from mwassist.sparam.render import densityRenderer, lotTraces, traceRenderer, traceValues
+
+    fig = Figure(figsize=(12, 9), dpi=100)
+    canvas = FigureCanvasAgg(fig)
+    axes = [[fig.add_subplot(nports, nports, row*nports+col+1) for col in range(nports)]
+            for row in range(nports)]
+
+    mean = polarMean(stackNetworks(networks, commonFrequency(networks)))
+    scale = networks[0].frequency.multiplier
+
+    if mode == 'skrf':
+        for net in networks:
+            for row in range(nports):
+                for col in range(nports):
+                    net.plot_s_db(row, col, ax=axes[row][col], show_legend=False)
+    else:
+        groups = lotTraces(networks, scale, 'db')
+        for row in range(nports):
+            for col in range(nports):
+                renderer = densityRenderer(axes[row][col]) if mode == 'density' else traceRenderer(axes[row][col])
+                renderer.setTraces([(x, Y[:, :, row, col]) for x, Y in groups])
+
+    fStats = commonFrequency(networks)
+    for row in range(nports):
+        for col in range(nports):
+            axes[row][col].plot(fStats.f / scale, traceValues(mean[:, row, col], 'db'), linewidth=3)
+
+    canvas.draw()
+    return sum(len(ax.get_children()) for ax in fig.axes)
+
+
+def runLot(spec, directory, repeat=3, memory=True, benchmarks=None, skrfLimit=50):
+    """
+    Runs all benchmarks on one synthetic lot.  Returns a list of result
+    dictionaries.
+    """
+    logger = logging.getLogger(__name__)
+    results = []
+
+    def record(name, fn, counters=None):
+        if benchmarks is not None and name not in benchmarks:
+            return None
+        logger.info('{:s} {:s}'.format(name, str(tuple(spec))))
+        result, measurement = measure(fn, repeat=repeat, memory=memory)
+        entry = collections.OrderedDict([('name', name), ('lot', spec._asdict())])
+        entry.update(measurement)
+        if counters is not None:
+            entry['counters'] = counters(result)
+        results.append(entry)
+        return result
+
+    t0 = time.perf_counter()
+    filelist = writeSyntheticLot(directory, spec)
+    logger.info('Wrote {:d} files in {:.2f} s'.format(len(filelist), time.perf_counter()-t0))
+    nBytes = sum(os.path.getsize(fname) for fname in filelist)
+
+    record('parse_fast', lambda: [touchstone.readTouchstoneArrays(fname) for fname in filelist],
+           counters=lambda r: {'files': len(filelist), 'bytes': nBytes})
+    record('parse_skrf', lambda: [skrf.Network(fname) for fname in filelist[:skrfLimit]],
+           counters=lambda r: {'files': len(r)})
+    record('load_parallel', lambda: touchstoneLoader(filelist).run(),
+           counters=lambda r: {'files': len(r)})
+
+    cacheDir = os.path.join(directory, 'cache')
+    def loadCached():
+        return touchstoneLoader(filelist, cache=touchstoneCache(cacheDir)).run()
+    touchstoneLoader(filelist, cache=touchstoneCache(cacheDir)).run()      # Populate
+    record('load_cached', loadCached, counters=lambda r: {'files': len(r)})
+
+    networks = touchstoneLoader(filelist).run()
+
+    fStats = commonFrequency(networks)
+    allS = record('interpolate', lambda: stackNetworks(networks, fStats),
+                  counters=lambda r: {'points': int(r.shape[1]) if r is not None else 0})
+    if allS is None:
+        allS = stackNetworks(networks, fStats)
+
+    record('average', lambda: polarMean(allS))
+    record('summary', lambda: calcNetworkSummary(networks))
+
+    nports = spec.ports
+    record('plot_collection', lambda: plotAgg(networks, 'collection', nports),
+           counters=lambda r: {'artists': r})
+    record('plot_density', lambda: plotAgg(networks, 'density', nports),
+           counters=lambda r: {'artists': r})
+    record('plot_skrf', lambda: plotAgg(networks[:skrfLimit], 'skrf', nports),
+           counters=lambda r: {'artists': r, 'devices': min(len(networks), skrfLimit)})
+
+    return results
+
+
+def environment():
+    import matplotlib
+    return collections.OrderedDict([
+        ('python',     platform.python_version()),
+        ('platform',   platform.platform()),
+        ('cpus',       os.cpu_count()),
+        ('numpy',      np.__version__),
+        ('skrf',       skrf.__version__),
+        ('matplotlib', matplotlib.__version__),
+        ])
+
+
+def peakRss():
+    """
+    Peak resident set size of this process in bytes, None where unavailable
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def compare(results, baseline):
+    """
+    Prints the median time of every benchmark relative to a baseline run
+    """
+    def key(entry):
+        return (entry['name'], tuple(sorted(entry['lot'].items())))
+    before = {key(entry): entry for entry in baseline['results']}
+
+    print('{:<18s} {:>16s} {:>10s} {:>10s} {:>8s}'.format('benchmark', 'lot', 'before', 'after', 'ratio'))
+    for entry in results['results']:
+        lot = '{devices}x{points}x{ports}'.format(**entry['lot'])
+        old = before.get(key(entry))
+        if old is None:
+            print('{:<18s} {:>16s} {:>10s} {:>10.4f}'.format(entry['name'], lot, '-', entry['median']))
+        else:
+            print('{:<18s} {:>16s} {:>10.4f} {:>10.4f} {:>8.2f}'.format(
+                entry['name'], lot, old['median'], entry['median'], entry['median'] / old['median']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m mwassist.benchmark',
+                                     description='Times load, statistics and plot paths on synthetic lots.')
+    parser.add_argument('--lots', nargs='+', type=parseLotSpec, default=[parseLotSpec('200x201x2'),
+                                                                          parseLotSpec('50x1601x4')],
+                        help='Lots as DEVICESxPOINTSxPORTS (default: 200x201x2 50x1601x4)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Timed runs per benchmark (default: 3)')
+    parser.add_argument('-b', '--benchmarks', nargs='+', default=None,
+                        help='Only run these benchmarks, e.g. parse_fast summary')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc peak memory run')
+    parser.add_argument('-o', '--output', default=None, help='JSON output file (default: stdout)')
+    parser.add_argument('--compare', default=None, help='JSON file of an earlier run to compare against')
+    parser.add_argument('--keep', default=None, help='Write the lots to this directory and keep them')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(levelname)s: %(message)s')
+
+    baseDir = args.keep if args.keep is not None else tempfile.mkdtemp(prefix='mwassist-bench-')
+    results = collections.OrderedDict([
+        ('version',     1),
+        ('timestamp',   datetime.datetime.now().isoformat()),
+        ('environment', environment()),
+        ('repeat',      args.repeat),
+        ('results',     []),
+        ])
+    try:
+        for spec in args.lots:
+            directory = os.path.join(baseDir, '{:d}x{:d}x{:d}'.format(*spec))
+            results['results'] += runLot(spec, directory, repeat=args.repeat,
+                                         memory=not args.no_memory, benchmarks=args.benchmarks)
+    finally:
+        if args.keep is None:
+            shutil.rmtree(baseDir, ignore_errors=True)
+    results['peakRssBytes'] = peakRss()
+
+    text = json.dumps(results, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as fh:
+            fh.write(text)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as fh:
+            compare(results, json.load(fh))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,305 @@
+'''
+Headless batch statistics
+
+Computes the statistical summary of a lot of touchstone files without
+starting Qt or Jupyter, e.g. for nightly pipelines:
+
+    mwassist -o results --outputs touchstone csv png "lot42/*.s2p"
+
+Inputs are glob patterns of .sNp files or lot store directories.  Neither
+this module nor the statistics code imports PyQt, qtconsole or IPython, and
+matplotlib is only imported when PNG output is requested.
+
+@author: khershberger
+'''
+
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from mwassist.sparam.cache import touchstoneCache
+from mwassist.sparam.derived import derivedQuantities
+from mwassist.sparam.export import (
+    writeBundle,
+    writeGroupsTouchstone,
+    writeSummaryTouchstone
+    )
+from mwassist.sparam.loader import touchstoneLoader
+from mwassist.sparam.lotstore import lotStore
+from mwassist.sparam.stats import (
+    averagingModes,
+    calcNetworkSummary,
+    calcRobustSummary,
+    groupedStatistics,
+    parseGroupKey,
+    specMask
+    )
+
+
+outputFormats = ('touchstone', 'csv', 'png', 'bundle')
+
+
+def parseSpec(text):
+    """
+    Parses a spec given as 'S21,fStart,fStop,lower,upper' with frequencies
+    in Hz.  Either limit may be left empty, e.g. 'S11,1e9,2e9,,-10'.
+    """
+    fields = text.split(',')
+    if len(fields) != 5 or len(fields[0]) != 3 or fields[0][0].upper() != 'S':
+        raise argparse.ArgumentTypeError('Invalid spec {:s}, expected Sij,fStart,fStop,lower,upper'.format(text))
+
+    try:
+        row = int(fields[0][1])
+        col = int(fields[0][2])
+        fStart = float(fields[1])
+        fStop = float(fields[2])
+        lower = float(fields[3]) if fields[3].strip() else None
+        upper = float(fields[4]) if fields[4].strip() else None
+    except ValueError:
+        raise argparse.ArgumentTypeError('Invalid spec {:s}'.format(text))
+
+    return specMask(row, col, fStart, fStop, lower=lower, upper=upper)
+
+
+def isLotStore(path):
+    return os.path.isdir(path) and os.path.isfile(os.path.join(path, 'index.json'))
+
+
+def expandInputs(patterns):
+    """
+    Expands the glob patterns given on the command line.  Returns (files,
+    stores) with duplicates removed and the file order kept.
+    """
+    files = []
+    stores = []
+    seen = set()
+    for pattern in patterns:
+        if isLotStore(pattern):
+            stores.append(pattern)
+            continue
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if len(matches) == 0:
+            logging.getLogger().warning('No files match {:s}'.format(pattern))
+        for fname in matches:
+            if os.path.isfile(fname) and fname not in seen:
+                seen.add(fname)
+                files.append(fname)
+
+    return files, stores
+
+
+def writeCsv(summary, outputDir, name):
+    """
+    Writes all statistics into one CSV file with a column per S-parameter,
+    quantity and statistic, e.g. S21_db_p95 or, for derived quantities of
+    the whole device, k_min
+    """
+    keys = ['mean', 'std', 'min', 'max'] + [summary.percentileKey(p) for p in summary.percentiles]
+    phaseKeys = keys + [key for key in ('circvar',) if key in summary.phase]
+    nports = summary.mean.nports
+
+    header = ['frequency_hz']
+    columns = [summary.frequency.f]
+    for row in range(nports):
+        for col in range(nports):
+            for quantity, values, valueKeys in (('db', summary.db, keys), ('phase', summary.phase, phaseKeys)):
+                for key in valueKeys:
+                    header.append('S{:d}{:d}_{:s}_{:s}'.format(row+1, col+1, quantity, key))
+                    columns.append(values[key][:, row, col])
+
+    for quantity, values in summary.derived.items():
+        size = values['mean'].shape[-1]
+        for row in range(size):
+            for col in range(size):
+                prefix = '' if size == 1 else 'S{:d}{:d}_'.format(row+1, col+1)
+                for key in keys:
+                    header.append('{:s}{:s}_{:s}'.format(prefix, quantity, key))
+                    columns.append(values[key][:, row, col])
+
+    filename = os.path.join(outputDir, name + '_stats.csv')
+    np.savetxt(filename, np.column_stack(columns), delimiter=',',
+               header=','.join(header), comments='', fmt='%.10g')
+    return [filename]
+
+
+def writeYield(summary, names, outputDir, name):
+    filename = os.path.join(outputDir, name + '_yield.csv')
+    with open(filename, 'w') as fh:
+        fh.write('name,passed\n')
+        for deviceName, passed in zip(names, summary.passed):
+            fh.write('{:s},{:d}\n'.format(deviceName, int(passed)))
+    return [filename]
+
+
+def writeOutliers(robust, names, outputDir, name):
+    filename = os.path.join(outputDir, name + '_outliers.csv')
+    with open(filename, 'w') as fh:
+        fh.write('name,flagged_fraction,max_score,outlier\n')
+        for deviceName, fraction, score, outlier in zip(names, robust.fractions, robust.scores, robust.outliers):
+            fh.write('{:s},{:.6g},{:.6g},{:d}\n'.format(deviceName, fraction, score, int(outlier)))
+    return [filename]
+
+
+def writePng(summary, outputDir, name, dpi=100):
+    """
+    Plots mean, outer percentile band and min/max of every S-parameter in
+    dB.  Uses the Agg canvas directly so no GUI backend is needed.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    nports = summary.mean.nports
+    x = summary.frequency.f / summary.frequency.multiplier
+    unit = summary.frequency.unit
+
+    fig = Figure(figsize=(3*nports+1, 2.5*nports+1))
+    FigureCanvasAgg(fig)
+
+    pKeys = [summary.percentileKey(p) for p in sorted(summary.percentiles)]
+    for row in range(nports):
+        for col in range(nports):
+            ax = fig.add_subplot(nports, nports, row*nports + col + 1)
+            if len(pKeys) >= 2:
+                ax.fill_between(x, summary.db[pKeys[0]][:, row, col], summary.db[pKeys[-1]][:, row, col],
+                                color='C0', alpha=0.3, linewidth=0,
+                                label='{:s}-{:s}'.format(pKeys[0], pKeys[-1]))
+            ax.plot(x, summary.db['min'][:, row, col], color='C0', linestyle=':', linewidth=0.8)
+            ax.plot(x, summary.db['max'][:, row, col], color='C0', linestyle=':', linewidth=0.8)
+            ax.plot(x, summary.db['mean'][:, row, col], color='k', linewidth=1.5, label='Mean')
+            ax.set_title('S{:d}{:d}'.format(row+1, col+1))
+            ax.set_xlabel('Frequency ({:s})'.format(unit))
+            ax.set_ylabel('dB')
+            ax.grid(True)
+
+    fig.suptitle('{:s} ({:d} devices)'.format(name, summary.count))
+    fig.tight_layout()
+
+    filename = os.path.join(outputDir, name + '.png')
+    fig.savefig(filename, dpi=dpi)
+    return [filename]
+
+
+def buildParser():
+    parser = argparse.ArgumentParser(prog='mwassist',
+                                     description='Computes statistics over a lot of touchstone files.')
+    parser.add_argument('inputs', nargs='+',
+                        help='Glob patterns of .sNp files (quote them) or lot store directories')
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help='Directory for the output files (default: current directory)')
+    parser.add_argument('-n', '--name', default='lot',
+                        help='Prefix of the output file names (default: lot)')
+    parser.add_argument('--outputs', nargs='+', choices=outputFormats, default=['touchstone', 'csv'],
+                        help='Outputs to write (default: touchstone csv)')
+    parser.add_argument('-p', '--percentiles', nargs='+', type=float, default=[5, 50, 95],
+                        help='Percentiles to compute (default: 5 50 95)')
+    parser.add_argument('--spec', action='append', type=parseSpec, default=[],
+                        help='Pass/fail spec Sij,fStart,fStop,lower,upper in Hz and dB; may be repeated')
+    parser.add_argument('-d', '--derived', nargs='+', choices=list(derivedQuantities), default=[],
+                        help='Derived quantities added to the CSV output, e.g. groupdelay k mag')
+    parser.add_argument('--outliers', type=float, nargs='?', const=3.5, default=None, metavar='THRESHOLD',
+                        help='Flag outliers by robust z-score (default threshold 3.5) and write <name>_outliers.csv')
+    parser.add_argument('--averaging', choices=averagingModes, default='polar',
+                        help='Phase averaging: unwrapped across the lot (polar, default) or circular mean and '
+                             'variance, independent of the device order (circular)')
+    parser.add_argument('-g', '--group-by', default=None,
+                        help='Also write per-group mean/std to <name>_groups.csv; a regex on the file name '
+                             'whose first group is the key, comment:NAME or attr:NAME (lot stores)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='Number of parser processes (default: number of CPUs)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not use the persistent touchstone cache')
+    parser.add_argument('--max-memory', type=float, default=256,
+                        help='Memory budget of the statistics in MB (default: 256)')
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='More output, may be repeated')
+    return parser
+
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+
+    level = logging.WARNING if args.verbose == 0 else logging.INFO if args.verbose == 1 else logging.DEBUG
+    logging.basicConfig(level=level, format='%(levelname)s: %(message)s')
+    logger = logging.getLogger()
+
+    files, stores = expandInputs(args.inputs)
+    if len(stores) > 0 and (len(files) > 0 or len(stores) > 1):
+        logger.error('A lot store must be the only input')
+        return 2
+
+    tStart = time.perf_counter()
+
+    if len(stores) > 0:
+        data = lotStore(stores[0])
+        names = data.names
+    else:
+        if len(files) == 0:
+            logger.error('No input files')
+            return 2
+
+        nErrors = [0]
+        def onError(fname, message):
+            nErrors[0] += 1
+            logger.error('Unable to load {:s}: {:s}'.format(fname, message))
+
+        cache = None if args.no_cache else touchstoneCache()
+        data = touchstoneLoader(files, maxWorkers=args.workers, cache=cache).run(error=onError)
+        if len(data) == 0:
+            logger.error('None of the {:d} files could be loaded'.format(len(files)))
+            return 1
+        names = [net.name for net in data]
+
+    logger.info('Loaded {:d} devices in {:.2f} s'.format(len(names), time.perf_counter()-tStart))
+
+    try:
+        summary = calcNetworkSummary(data, percentiles=args.percentiles, specs=args.spec,
+                                     maxBytes=int(args.max_memory*1024**2), quantities=args.derived,
+                                     averaging=args.averaging)
+    except ValueError as e:
+        logger.error(str(e))
+        return 1
+
+    groups = None
+    if args.group_by is not None:
+        groups = groupedStatistics(data, parseGroupKey(args.group_by), maxBytes=int(args.max_memory*1024**2))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    written = []
+    if 'touchstone' in args.outputs:
+        written += writeSummaryTouchstone(summary, args.output_dir, args.name)
+        if groups is not None:
+            written += writeGroupsTouchstone(groups, args.output_dir, args.name + '_group')
+    if 'csv' in args.outputs:
+        written += writeCsv(summary, args.output_dir, args.name)
+    if 'png' in args.outputs:
+        written += writePng(summary, args.output_dir, args.name)
+    if 'bundle' in args.outputs:
+        written.append(writeBundle(os.path.join(args.output_dir, args.name), summary, groups, names))
+    if args.outliers is not None:
+        robust = calcRobustSummary(data, threshold=args.outliers, maxBytes=int(args.max_memory*1024**2),
+                                   averaging=args.averaging)
+        written += writeOutliers(robust, names, args.output_dir, args.name)
+        print('Outliers: {:d} of {:d}'.format(int(np.count_nonzero(robust.outliers)), robust.count))
+    if groups is not None:
+        filename = os.path.join(args.output_dir, args.name + '_groups.csv')
+        groups.toCsv(filename)
+        written.append(filename)
+    if summary.passed is not None:
+        written += writeYield(summary, names, args.output_dir, args.name)
+        print('Yield: {:.1f}% ({:d} of {:d})'.format(100*summary.yieldFraction,
+                                                     int(np.count_nonzero(summary.passed)), summary.count))
+
+    for filename in written:
+        logger.info('Wrote {:s}'.format(filename))
+    logger.info('Done in {:.2f} s'.format(time.perf_counter()-tStart))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+'''
+Jupyter console widget running an in-process or an out-of-process kernel
+
+Kept separate from gui.py since importing qtconsole and IPython takes about
+a second; the main window only imports this module when the console is
+first shown.
+
+The in-process kernel shares all objects with the GUI but blocks it while
+executing.  The out-of-process kernel runs in parallel with the GUI and
+survives crashes of either side; it receives variables pickled and the
+loaded lot through shared memory (see mwassist.kernel), and pull_vars()
+brings results back.
+
+@author: khershberger
+'''
+
+import ast
+import logging
+import os
+
+from qtconsole.rich_jupyter_widget import RichJupyterWidget
+from qtconsole.inprocess import QtInProcessKernelManager
+from qtconsole.manager import QtKernelManager
+
+from mwassist.kernel import attachedLot, packVariables, sharedLot, unpackVariables
+
+
+class ConsoleWidget(RichJupyterWidget):
+    def __init__(self, *args, customBanner=None,  myWidget=None, external=False, **kwargs):
+        super(ConsoleWidget, self).__init__(*args, **kwargs)
+        self.logger = logging.getLogger(__name__)
+
+        if customBanner is not None:
+            self.banner = customBanner
+
+        # Turn down logging level
+        logging.getLogger('ipykernel').setLevel(logging.WARNING)
+        #logging.getLogger('traitlets').setLevel(logging.WARNING)
+
+        self.font_size = 6
+        self.external = external
+        self.sharedLots = {}    # kernel.sharedLot pushed under each variable name
+        self.pendingPulls = {}  # Callback of each pull_vars() request by message id
+        
+        if external:
+            # The kernel must be able to import mwassist from wherever it runs
+            env = dict(os.environ)
+            root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            env['PYTHONPATH'] = os.pathsep.join([root] + [p for p in [env.get('PYTHONPATH')] if p])
+            kernelManager = QtKernelManager()
+            kernelManager.start_kernel(env=env)
+            kernelClient = kernelManager.client()
+            kernelClient.start_channels()   # Needed before the widget connects to them
+            self.kernel_manager = kernelManager
+            self.kernel_client = kernelClient
+            self.kernel_client.shell_channel.message_received.connect(self.onShellMessage)
+            self.logger.info('Started out-of-process kernel')
+        else:
+            self.kernel_manager = QtInProcessKernelManager()
+            self.kernel_manager.start_kernel(show_banner=False)
+            self.kernel_manager.kernel.gui = 'qt'
+            self.kernel_client = self._kernel_manager.client()
+            self.kernel_client.start_channels()
+            self.kernel_manager.kernel.shell.push({'widget':self,'myWidget':myWidget})
+
+        self.exit_requested.connect(self.shutdown)
+
+    def shutdown(self):
+        self.kernel_client.stop_channels()
+        self.kernel_manager.shutdown_kernel()
+        for lot in self.sharedLots.values():
+            lot.close()
+        self.sharedLots = {}
+
+    def push_vars(self, variableDict):
+        """
+        Given a dictionary containing name / value pairs, push those variables
+        to the Jupyter console widget.  An out-of-process kernel receives
+        copies of the picklable ones.
+        """
+        if not self.external:
+            self.kernel_manager.kernel.shell.push(variableDict)
+            return
+        
+        text, skipped = packVariables(variableDict)
+        if len(skipped) > 0:
+            self.logger.debug('Not pushed to the out-of-process kernel: {:s}'.format(', '.join(skipped)))
+        self.kernel_client.execute('from mwassist.kernel import unpackVariables as _unpack\n'
+                                   'get_ipython().push(_unpack({!r}))\n'
+                                   'del _unpack'.format(text),
+                                   silent=True)
+
+    def pull_vars(self, names, callback):
+        """
+        Calls callback with a dictionary of the named kernel variables.
+        Variables that do not exist (or cannot be pickled by an
+        out-of-process kernel) are left out.  With an out-of-process kernel
+        the callback runs once the kernel answered, i.e. not before the
+        code currently executing has finished.
+        """
+        if not self.external:
+            namespace = self.kernel_manager.kernel.shell.user_ns
+            callback({name: namespace[name] for name in names if name in namespace})
+            return
+        
+        expression = ('__import__(\'mwassist.kernel\', fromlist=[\'packVariables\']).packVariables('
+                      '{{_n: _v for _n, _v in globals().items() if _n in {!r}}})[0]'.format(list(names)))
+        msgId = self.kernel_client.execute('', silent=True, user_expressions={'vars': expression})
+        self.pendingPulls[msgId] = callback
+
+    def onShellMessage(self, msg):
+        callback = self.pendingPulls.pop(msg['parent_header'].get('msg_id'), None)
+        if callback is None or msg['msg_type'] != 'execute_reply':
+            return
+        try:
+            result = msg['content'].get('user_expressions', {}).get('vars', {})
+            if result.get('status') != 'ok':
+                self.logger.error('pull_vars failed: {:s}'.format(str(result.get('evalue', result))))
+                return
+            callback(unpackVariables(ast.literal_eval(result['data']['text/plain'])))
+        except Exception:
+            self.logger.exception('ConsoleWidget.onShellMessage(): Exception occured')
+
+    def push_lot(self, networks, name='lot'):
+        """
+        Makes a list of networks available in the kernel as variable name,
+        a mwassist.kernel.attachedLot mapping the data in shared memory.
+        The data is copied once into shared memory; the kernel reads it
+        without any further copy.
+        """
+        previous = self.sharedLots.pop(name, None)
+        lot = sharedLot(networks, name)
+        self.sharedLots[name] = lot
+        if self.external:
+            self.kernel_client.execute('from mwassist.kernel import attachedLot as _attach\n'
+                                       '{:s} = _attach({!r})\n'
+                                       'del _attach'.format(name, lot.descriptor),
+                                       silent=True)
+        else:
+            self.kernel_manager.kernel.shell.push({name: attachedLot(lot.descriptor)})
+        if previous is not None:
+            previous.close()    # The kernel keeps its mapping until it drops it
+        self.logger.info('Shared {:s} with the console'.format(repr(lot)))
+
+    def clear(self):
+        """
+        Clears the terminal
+        """
+        self._control.clear()
+
+        # self.kernel_manager
+
+    def print_text(self, text):
+        """
+        Prints some plain text to the console
+        """
+        self._append_plain_text(text)
+
+    def execute_command(self, command):
+        """
+        Execute a command in the frame of the console widget
+        """
+        self._execute(command, False)
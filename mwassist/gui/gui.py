@@ -5,7 +5,15 @@ Tutorial from:
 @author: khershberger
 '''
 
+import time
+_tImport = time.perf_counter()
+
+import argparse
+import collections
+import importlib
+import json
 import logging
+import os
 import sys
 import traceback
 from PyQt5.QtWidgets import (
@@ -16,6 +24,7 @@ from PyQt5.QtWidgets import (
     QDockWidget,
     QFileDialog,
     QHBoxLayout,
+    QLabel,
     QMessageBox,
     QPlainTextEdit,
     QStyle,
@@ -31,80 +40,190 @@ from PyQt5.QtGui import (
     QStandardItemModel)
 from PyQt5.QtCore import (
     Qt,
-    QCoreApplication)
+    QCoreApplication,
+    QThread,
+    QTimer)
 # from PyQt5 import QtCore
 
-from qtconsole.qt import QtGui
-from qtconsole.rich_jupyter_widget import RichJupyterWidget
-from qtconsole.inprocess import QtInProcessKernelManager
-from IPython.lib import guisupport
+from mwassist.instrument import tracer
+from mwassist.gui.profiler import profilerWidget
 
-import mwassist.sparam.sparam
+# qtconsole/IPython (mwassist.gui.console) and matplotlib/skrf
+# (mwassist.sparam.sparam) are imported on demand, see MDAMainWindow
 
 __version__ = '0.2.0'
 
-class loggingAdapter(logging.Handler):
-    def __init__(self, parent, widget):
-        super().__init__()
-        self.widget = widget
 
-    def emit(self, record):
-        msg = self.format(record)
-        self.widget.appendPlainText(msg)
+# Default levels of the mwassist subsystems and of chatty third party loggers.
+# Override with setLogLevels() or the MWASSIST_LOG_LEVELS environment
+# variable, e.g. MWASSIST_LOG_LEVELS="mwassist.sparam=DEBUG,matplotlib=INFO"
+defaultLogLevels = collections.OrderedDict([
+    ('',            logging.INFO),
+    ('mwassist',    logging.INFO),
+    ('matplotlib',  logging.WARNING),
+    ('PIL',         logging.WARNING),
+    ('ipykernel',   logging.WARNING),
+    ('traitlets',   logging.WARNING),
+    ])
+
+
+def parseLogLevels(text):
+    """
+    Parses 'name=LEVEL,name=LEVEL' into a dictionary for setLogLevels()
+    """
+    levels = collections.OrderedDict()
+    for item in text.split(','):
+        if '=' not in item:
+            continue
+        name, level = item.split('=', 1)
+        levels[name.strip()] = level.strip()
+    return levels
 
-class ConsoleWidget(RichJupyterWidget):
-    def __init__(self, *args, customBanner=None,  myWidget=None, **kwargs):
-        super(ConsoleWidget, self).__init__(*args, **kwargs)
 
-        if customBanner is not None:
-            self.banner = customBanner
+def setLogLevels(levels):
+    """
+    Sets the level of each named logger, e.g.
+
+        setLogLevels({'mwassist.sparam.render': 'DEBUG', 'mwassist.sparam.loader': logging.WARNING})
 
-        self.font_size = 6
-        self.kernel_manager = QtInProcessKernelManager()
-        self.kernel_manager.start_kernel(show_banner=False)
-        self.kernel_manager.kernel.gui = 'qt'
-        self.kernel_client = self._kernel_manager.client()
-        self.kernel_client.start_channels()
+    An empty name refers to the root logger.  Levels may be numbers or names.
+    """
+    for name, level in levels.items():
+        if isinstance(level, str):
+            level = logging.getLevelName(level.upper())
+            if not isinstance(level, int):
+                logging.getLogger(__name__).warning('Unknown log level for {:s}'.format(name))
+                continue
+        logging.getLogger(name if name else None).setLevel(level)
 
-        def stop():
-            self.kernel_client.stop_channels()
-            self.kernel_manager.shutdown_kernel()
-        self.exit_requested.connect(stop)
+
+class loggingAdapter(logging.Handler):
+    """
+    Shows log records in a QPlainTextEdit without blocking the caller.
+
+    emit() only appends the record to a bounded queue, so it is cheap and
+    safe to call from any thread.  A timer in the GUI thread formats the
+    queued records and appends them to the widget as one block every
+    interval ms.  The widget keeps at most maxLines lines.  If more than
+    maxQueued records arrive between two flushes the oldest are dropped and
+    the number dropped is shown instead.
+    """
+    def __init__(self, parent, widget, interval=100, maxLines=5000, maxQueued=10000):
+        super().__init__()
+        self.widget = widget
+        self.widget.setMaximumBlockCount(maxLines)
         
-        self.kernel_manager.kernel.shell.push({'widget':self,'myWidget':myWidget})
+        self.queue = collections.deque(maxlen=maxQueued)
+        self.nDropped = 0
+        
+        self.timer = QTimer(parent)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.flushToWidget)
+        self.timer.start()
 
-    def push_vars(self, variableDict):
-        """
-        Given a dictionary containing name / value pairs, push those variables
-        to the Jupyter console widget
-        """
-        self.kernel_manager.kernel.shell.push(variableDict)
+    def emit(self, record):
+        # Called with self.lock held
+        if len(self.queue) == self.queue.maxlen:
+            self.nDropped += 1
+        self.queue.append(record)
 
-    def clear(self):
+    def flushToWidget(self):
         """
-        Clears the terminal
+        Appends all queued records to the widget.  Must run in the GUI thread.
         """
-        self._control.clear()
+        self.acquire()
+        try:
+            records = list(self.queue)
+            self.queue.clear()
+            nDropped = self.nDropped
+            self.nDropped = 0
+        finally:
+            self.release()
+        
+        if len(records) == 0:
+            return
+        
+        lines = []
+        if nDropped > 0:
+            lines.append('... {:d} log messages dropped ...'.format(nDropped))
+        for record in records:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        self.widget.appendPlainText('\n'.join(lines))
+
+    def close(self):
+        try:
+            self.timer.stop()
+        except RuntimeError:
+            pass            # Timer already deleted along with the window
+        super().close()
 
-        # self.kernel_manager
 
-    def print_text(self, text):
-        """
-        Prints some plain text to the console
-        """
-        self._append_plain_text(text)
+class startupTimer(object):
+    """
+    Records startup milestones in seconds since gui.py was imported.
 
-    def execute_command(self, command):
-        """
-        Execute a command in the frame of the console widget
-        """
-        self._execute(command, False)
+    Functions added to callbacks are called as callback(name, seconds) for
+    every milestone, which main(['--startup-time']) uses to report startup
+    regressions.
+    """
+    def __init__(self, tStart=None):
+        self.tStart = tStart if tStart is not None else time.perf_counter()
+        self.marks = collections.OrderedDict()
+        self.callbacks = []
+
+    def mark(self, name):
+        elapsed = time.perf_counter() - self.tStart
+        self.marks[name] = elapsed
+        logging.getLogger().debug('Startup: {:s} after {:.3f} s'.format(name, elapsed))
+        for callback in self.callbacks:
+            callback(name, elapsed)
+
+
+class importThread(QThread):
+    """
+    Imports modules in the background so their import cost is paid while
+    the main window is already showing
+    """
+    def __init__(self, modules, parent=None):
+        super().__init__(parent)
+        self.modules = modules
+
+    def run(self):
+        for name in self.modules:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                logging.exception('importThread.run(): Unable to import {:s}'.format(name))
 
 
 class MDAMainWindow(QMainWindow):
-    def __init__(self):
+    """
+    Main window.  With lazy=True (the default) the window is shown before
+    matplotlib and skrf are imported, which then happens in a background
+    thread, and the Jupyter console is only started when its dock is first
+    shown.  lazy=False builds everything up front.  With
+    externalKernel=True the console runs its kernel in a separate process.
+    """
+    # Imported by importThread when starting lazily.  Only modules that
+    # neither use Qt nor select the matplotlib backend are safe off the GUI
+    # thread; mwassist.sparam.sparam does both and is imported by
+    # createSparamDock().
+    lazyModules = ['numpy', 'skrf', 'matplotlib.figure', 'mwassist.sparam.stats', 'mwassist.sparam.loader']
+
+    def __init__(self, lazy=True, timer=None, externalKernel=False):
         super().__init__()
 
+        self.lazy = lazy
+        self.externalKernel = externalKernel
+        self.timer = timer if timer is not None else startupTimer(_tImport)
+        self.sparamDock = None
+        self.console = None
+        self.consoleVars = {'setLogLevels': setLogLevels, 'tracer': tracer}
+        self.importThread = None
+
         self.initUI()
 
     def initUI(self):
@@ -114,6 +233,8 @@ class MDAMainWindow(QMainWindow):
         openAction = QAction('&Open', self)
         #openAction.triggered.connect(self.processTrigger) 
         file.addAction(openAction)
+        file.addAction(QAction('Open &lot store', self))
+        file.addAction(QAction('Share lot with &console', self))
         file.triggered[QAction].connect(self.processTrigger)
         # Aabout Menu
         a = bar.addAction('&About')
@@ -124,15 +245,16 @@ class MDAMainWindow(QMainWindow):
         # Create Log Widget
         self.logTextEdit = QPlainTextEdit()
         self.logTextEdit.setReadOnly(True)
-        logAdapter = loggingAdapter(self, self.logTextEdit)
+        self.logAdapter = loggingAdapter(self, self.logTextEdit)
         
         formatter = logging.Formatter('%(asctime)s - %(name)s - %(funcName)s - %(levelname)s - %(message)s')
-        logAdapter.setFormatter(formatter)
+        self.logAdapter.setFormatter(formatter)
         
         # Setup logging
+        setLogLevels(defaultLogLevels)
+        setLogLevels(parseLogLevels(os.environ.get('MWASSIST_LOG_LEVELS', '')))
         logger = logging.getLogger() 
-        logger.setLevel(logging.DEBUG)
-        logger.addHandler(logAdapter)
+        logger.addHandler(self.logAdapter)
         logger.debug('Log adapter hopefully attached')
         
         # Create dock for log window
@@ -143,32 +265,28 @@ class MDAMainWindow(QMainWindow):
 
         ### Create main dock
         
-        # Create textEdit linked to Jupyter widget
-        logging.info('Creating sparam widget')
-        self.sparamDock = mwassist.sparam.sparam.sparamPlot()
-        bar.addMenu(self.sparamDock.menuOptionsCreate())
-                
-        # Create the docs
+        # The sparam widget is filled in by createSparamDock()
         self.dockMain = QDockWidget('Empty main widget', self)
-        self.dockMain.setWidget(self.sparamDock)
+        self.dockMain.setWidget(QLabel('Loading...', alignment=Qt.AlignCenter))
         self.dockMain.setFloating(False)
         self.addDockWidget(Qt.RightDockWidgetArea, self.dockMain)
 
         ### Jupyter Dock
         
-        # Create Jupyter widget
-        logging.info('Creating JupyterWidget')
-        # Turn down logging level
-        logging.getLogger('ipykernel').setLevel(logging.WARNING)
-        #logging.getLogger('traitlets').setLevel(logging.WARNING)
-        jupyterWidgetConsole = ConsoleWidget(myWidget=self)
-
-        # Create the docs
+        # The console is filled in by createConsole()
         self.dockJupyter = QDockWidget('Jupyter console', self)
-        self.dockJupyter.setWidget(jupyterWidgetConsole)
+        self.dockJupyter.setWidget(QLabel('Starting Jupyter console...', alignment=Qt.AlignCenter))
         self.dockJupyter.setFloating(False)
         self.addDockWidget(Qt.BottomDockWidgetArea, self.dockJupyter)
 
+        ### Profiler Dock
+        
+        self.profiler = profilerWidget(self)
+        self.dockProfiler = QDockWidget('Profiler', self)
+        self.dockProfiler.setWidget(self.profiler)
+        self.dockProfiler.setFloating(False)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.dockProfiler)
+
         # Now we construct the central Widget & it's layout
         mainWidget = QWidget(self)
                 
@@ -178,12 +296,90 @@ class MDAMainWindow(QMainWindow):
 
         # Tabbify overlapping docks
         self.tabifyDockWidget(self.dockLog, self.dockJupyter)
+        self.tabifyDockWidget(self.dockJupyter, self.dockProfiler)
 
         # Set mainWidget to be central widget
         self.setCentralWidget(mainWidget)
         self.setGeometry(150, 150, 1400, 1000)
         self.setWindowTitle('Microwave Assistant')
+        self.dockLog.raise_()
+        self.dockJupyter.visibilityChanged.connect(self.onJupyterVisibilityChanged)
         self.show()
+        self.timer.mark('window shown')
+
+        if self.lazy:
+            self.importThread = importThread(self.lazyModules, self)
+            self.importThread.finished.connect(self.createSparamDock)
+            self.importThread.start()
+        else:
+            self.createSparamDock()
+            self.createConsole()
+
+    def createSparamDock(self):
+        """
+        Builds the sparam widget.  Runs in the GUI thread, which imports
+        mwassist.sparam.sparam and with it selects the Qt5Agg backend, and
+        imports matplotlib and skrf if the background import has not done
+        so yet.
+        """
+        if self.sparamDock is not None:
+            return self.sparamDock
+        
+        logging.info('Creating sparam widget')
+        import mwassist.sparam.sparam
+        self.timer.mark('sparam imported')
+        
+        self.sparamDock = mwassist.sparam.sparam.sparamPlot()
+        self.menuBar().addMenu(self.sparamDock.menuOptionsCreate())
+        self.dockMain.setWidget(self.sparamDock)
+        self.timer.mark('ready')
+        return self.sparamDock
+
+    def createConsole(self):
+        """
+        Starts the in-process Jupyter kernel and console
+        """
+        if self.console is not None:
+            return self.console
+        
+        logging.info('Creating JupyterWidget')
+        from mwassist.gui.console import ConsoleWidget
+        self.console = ConsoleWidget(myWidget=self, external=self.externalKernel)
+        self.console.push_vars(self.consoleVars)
+        self.dockJupyter.setWidget(self.console)
+        self.timer.mark('console ready')
+        return self.console
+
+    def pushConsoleVars(self, variableDict):
+        """
+        Makes variables available in the Jupyter console, now or once it
+        has been started
+        """
+        self.consoleVars.update(variableDict)
+        if self.console is not None:
+            self.console.push_vars(variableDict)
+
+    def shareLotWithConsole(self):
+        """
+        Makes the plotted lot available in the console as variable lot,
+        through shared memory so an out-of-process kernel need not copy it
+        """
+        if self.sparamDock is None or len(self.sparamDock.data) == 0:
+            logging.warning('No lot loaded')
+            return
+        self.createConsole().push_lot(self.sparamDock.data)
+        self.dockJupyter.raise_()
+
+    def closeEvent(self, event):
+        # Stops an out-of-process kernel and frees the shared memory
+        if self.console is not None:
+            self.console.shutdown()
+        super().closeEvent(event)
+
+    def onJupyterVisibilityChanged(self, visible):
+        if visible and self.console is None:
+            # Let the dock finish showing before blocking on the kernel
+            QTimer.singleShot(0, self.createConsole)
 
     def processTrigger(self, q):
         try:
@@ -195,8 +391,15 @@ class MDAMainWindow(QMainWindow):
                 filelist = QFileDialog.getOpenFileNames(self, 'Open file', 
                                                      '','S2P Files (*.S2P)')
                 logging.info(filelist[0])
-                self.sparamDock.loadData(filelist[0])
-                self.sparamDock.plotData()
+                self.createSparamDock().loadData(filelist[0])
+            
+            elif q.text() == 'Open &lot store':
+                path = QFileDialog.getExistingDirectory(self, 'Open lot store')
+                if path:
+                    self.createSparamDock().loadStore(path)
+            
+            elif q.text() == 'Share lot with &console':
+                self.shareLotWithConsole()
                 
             
         except Exception as e:
@@ -241,9 +444,28 @@ class dialogAbout(QMessageBox):
         self.show()
         
 
-def main():
-    app = QApplication(sys.argv)
-    guiMain = MDAMainWindow()
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='mwassist-gui')
+    parser.add_argument('--eager', action='store_true',
+                        help='Build the plot and Jupyter console before showing the window')
+    parser.add_argument('--external-kernel', action='store_true',
+                        help='Run the Jupyter console kernel in a separate process')
+    parser.add_argument('--startup-time', action='store_true',
+                        help='Print startup milestones as JSON and exit once the window is ready')
+    args, qtArgs = parser.parse_known_args(argv if argv is not None else sys.argv[1:])
+
+    timer = startupTimer(_tImport)
+    if args.startup_time:
+        finalMark = 'console ready' if args.eager else 'ready'
+        def report(name, elapsed):
+            if name == finalMark:
+                print(json.dumps(timer.marks))
+                QTimer.singleShot(0, QApplication.quit)
+        timer.callbacks.append(report)
+
+    app = QApplication(sys.argv[:1] + qtArgs)
+    timer.mark('application created')
+    guiMain = MDAMainWindow(lazy=not args.eager, timer=timer, externalKernel=args.external_kernel)
     try:
         retval = app.exec_()
     except:     # This doesn't seem to actually work.
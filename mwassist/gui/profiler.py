@@ -0,0 +1,107 @@
+'''
+Profiler panel
+
+Shows the spans and counters recorded by mwassist.instrument, refreshed
+while the panel is visible, and exports them as a Chrome trace for
+chrome://tracing or https://ui.perfetto.dev
+
+@author: khershberger
+'''
+
+import logging
+
+from PyQt5.QtWidgets import (
+    QCheckBox,
+    QFileDialog,
+    QHBoxLayout,
+    QPushButton,
+    QTreeWidget,
+    QTreeWidgetItem,
+    QVBoxLayout,
+    QWidget)
+from PyQt5.QtCore import QTimer
+
+from mwassist.instrument import tracer
+
+
+class profilerWidget(QWidget):
+    columns = ['Name', 'Count', 'Total (ms)', 'Mean (ms)', 'Max (ms)', 'Last (ms)', 'Values']
+
+    def __init__(self, parent=None, buffer=None, interval=1000):
+        super().__init__(parent)
+        self.logger = logging.getLogger(__name__)
+        self.buffer = buffer if buffer is not None else tracer
+
+        self.tree = QTreeWidget(self)
+        self.tree.setColumnCount(len(self.columns))
+        self.tree.setHeaderLabels(self.columns)
+        self.tree.setRootIsDecorated(False)
+        self.tree.setSortingEnabled(True)
+
+        self.enabledBox = QCheckBox('Enabled', self)
+        self.enabledBox.setChecked(self.buffer.enabled)
+        self.enabledBox.toggled.connect(self.setEnabledTracing)
+        clearButton = QPushButton('Clear', self)
+        clearButton.clicked.connect(self.clear)
+        exportButton = QPushButton('Export Chrome trace...', self)
+        exportButton.clicked.connect(self.exportChromeTrace)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.enabledBox)
+        buttons.addStretch(1)
+        buttons.addWidget(clearButton)
+        buttons.addWidget(exportButton)
+
+        layout = QVBoxLayout()
+        layout.addLayout(buttons)
+        layout.addWidget(self.tree)
+        self.setLayout(layout)
+
+        # Only refresh while shown, the summary walks the whole buffer
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def setEnabledTracing(self, enabled):
+        self.buffer.enabled = enabled
+
+    def clear(self):
+        self.buffer.clear()
+        self.refresh()
+
+    def refresh(self):
+        summary = self.buffer.summary()
+
+        self.tree.setSortingEnabled(False)
+        self.tree.clear()
+        for name, entry in summary.items():
+            fields = [name, str(entry['count'])]
+            if entry['count'] > 0:
+                fields += ['{:.1f}'.format(1e3*entry[key]) for key in ('total', 'mean', 'max', 'last')]
+            else:
+                fields += [''] * 4
+            fields.append(', '.join('{:s}={:s}'.format(str(k), str(v)) for k, v in sorted(entry['values'].items())))
+            self.tree.addTopLevelItem(QTreeWidgetItem(fields))
+        self.tree.setSortingEnabled(True)
+
+        for column in range(len(self.columns) - 1):
+            self.tree.resizeColumnToContents(column)
+
+    def exportChromeTrace(self):
+        try:
+            filename = QFileDialog.getSaveFileName(self, 'Export Chrome trace', 'trace.json',
+                                                   'Chrome trace (*.json);;All files (*.*)')
+            if filename[0] != '':
+                self.buffer.saveChromeTrace(filename[0])
+                self.logger.info('Wrote {:d} events to {:s}'.format(len(self.buffer), filename[0]))
+        except Exception:
+            self.logger.exception('profilerWidget.exportChromeTrace(): Exception occured')
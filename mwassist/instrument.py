@@ -0,0 +1,194 @@
+'''
+Lightweight instrumentation
+
+Timing spans and counter samples are appended to a fixed-size ring buffer
+(a collections.deque, so recording is a single append and safe from any
+thread).  The buffer can be summarized per span name or exported in the
+Chrome trace event format, which chrome://tracing and https://ui.perfetto.dev
+open directly.  No Qt is used here so the headless code can be instrumented
+as well.
+
+    from mwassist.instrument import span, tracer
+
+    with span('calcNetworkStatistics', devices=len(networks)):
+        ...
+    tracer.saveChromeTrace('trace.json')
+
+@author: khershberger
+'''
+
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+
+class traceBuffer(object):
+    """
+    Ring buffer of the last capacity spans and counter samples.
+
+    Events are stored as tuples (kind, name, start, duration, threadId,
+    args) with times in seconds of time.perf_counter().  kind is 'X' for
+    spans and 'C' for counters, as in the Chrome trace format.
+    """
+    def __init__(self, capacity=20000):
+        self.events = collections.deque(maxlen=capacity)
+        self.enabled = True
+        self.tStart = time.perf_counter()
+
+    def __len__(self):
+        return len(self.events)
+
+    def span(self, name, **args):
+        """
+        Context manager timing the enclosed block
+        """
+        if not self.enabled:
+            return _nullSpan
+        return _span(self, name, args)
+
+    def traced(self, name=None):
+        """
+        Decorator timing every call of a function
+        """
+        def decorator(fn):
+            spanName = name if name is not None else fn.__name__
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.events.append(('X', spanName, start, time.perf_counter() - start,
+                                        threading.get_ident(), None))
+            return wrapper
+        return decorator
+
+    def counter(self, name, **values):
+        """
+        Records counter values, e.g. counter('plot', artists=120, traces=4000)
+        """
+        if self.enabled:
+            self.events.append(('C', name, time.perf_counter(), 0.0, threading.get_ident(), values))
+
+    def clear(self):
+        self.events.clear()
+
+    def snapshot(self):
+        return list(self.events)
+
+    def summary(self):
+        """
+        Returns {name: {'count', 'total', 'mean', 'max', 'last', 'values'}}
+        with the span times in seconds and the latest counter values recorded
+        under each name
+        """
+        result = collections.OrderedDict()
+        for kind, name, start, duration, threadId, args in self.snapshot():
+            entry = result.get(name)
+            if entry is None:
+                entry = {'count': 0, 'total': 0.0, 'mean': 0.0, 'max': 0.0, 'last': 0.0, 'values': {}}
+                result[name] = entry
+            if kind == 'C':
+                entry['values'].update(args)
+                continue
+            entry['count'] += 1
+            entry['total'] += duration
+            entry['max'] = max(entry['max'], duration)
+            entry['last'] = duration
+            if args:
+                entry['values'].update(args)
+        for entry in result.values():
+            if entry['count'] > 0:
+                entry['mean'] = entry['total'] / entry['count']
+        return result
+
+    def toChromeTrace(self):
+        """
+        Returns the buffer as a Chrome trace event dictionary
+        """
+        pid = os.getpid()
+        threadNames = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        traceEvents = []
+        threadIds = set()
+        for kind, name, start, duration, threadId, args in self.snapshot():
+            event = {'name': name,
+                     'ph':   kind,
+                     'ts':   (start - self.tStart) * 1e6,
+                     'pid':  pid,
+                     'tid':  threadId}
+            if kind == 'X':
+                event['dur'] = duration * 1e6
+                event['cat'] = 'span'
+            if args:
+                event['args'] = args
+            traceEvents.append(event)
+            threadIds.add(threadId)
+
+        for threadId in threadIds:
+            traceEvents.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': threadId,
+                                'args': {'name': threadNames.get(threadId, str(threadId))}})
+
+        return {'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}
+
+    def saveChromeTrace(self, filename):
+        with open(filename, 'w') as fh:
+            json.dump(self.toChromeTrace(), fh)
+
+
+class _span(object):
+    __slots__ = ('buffer', 'name', 'args', 'start')
+
+    def __init__(self, buffer, name, args):
+        self.buffer = buffer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def set(self, **values):
+        """
+        Attaches counter values to the span, e.g. once they are known
+        """
+        self.args.update(values)
+
+    def __exit__(self, excType, excValue, tb):
+        self.buffer.events.append(('X', self.name, self.start, time.perf_counter() - self.start,
+                                   threading.get_ident(), self.args))
+        return False
+
+
+class _noSpan(object):
+    def __enter__(self):
+        return self
+
+    def set(self, **values):
+        pass
+
+    def __exit__(self, excType, excValue, tb):
+        return False
+
+
+_nullSpan = _noSpan()
+
+# Process wide buffer used by the mwassist modules
+tracer = traceBuffer()
+
+
+def span(name, **args):
+    return tracer.span(name, **args)
+
+
+def traced(name=None):
+    return tracer.traced(name)
+
+
+def counter(name, **values):
+    tracer.counter(name, **values)
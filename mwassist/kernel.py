@@ -0,0 +1,254 @@
+'''
+Data exchange with an out-of-process console kernel
+
+The Jupyter console can run its kernel in a separate process so long
+computations neither freeze nor crash the GUI.  Such a kernel cannot see
+the GUI's objects, so
+
+    sharedLot           copies the S-parameters of a lot once into shared
+                        memory, one block per frequency grid, and owns
+                        the blocks
+    attachedLot         maps the blocks described by sharedLot.descriptor
+                        into numpy arrays without copying, in any process
+    packVariables()     pickle plain variables into a string that can be
+    unpackVariables()   sent over the kernel's message channels
+
+Nothing here uses Qt, so the kernel side only needs numpy and skrf.
+
+@author: khershberger
+'''
+
+import base64
+import collections
+import logging
+import pickle
+
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import skrf
+
+
+_ownedBlocks = set()    # Names of the blocks created by this process
+
+
+def openSharedMemory(name):
+    """
+    Attaches to an existing shared memory block without registering it with
+    this process' resource tracker, which would otherwise unlink the block
+    when this process exits although the GUI still owns it
+    """
+    if name in _ownedBlocks:
+        return shared_memory.SharedMemory(name=name)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def blockArrays(buffer, shape):
+    """
+    The (n, n_freq, nports, nports) S-parameters and (n, n_freq, nports)
+    port impedances stored back to back in a shared memory buffer
+    """
+    s = np.ndarray(shape, dtype=complex, buffer=buffer)
+    z0 = np.ndarray(shape[:3], dtype=complex, buffer=buffer, offset=s.nbytes)
+    return s, z0
+
+
+class sharedLot(object):
+    """
+    The S-parameters of a list of networks in shared memory, grouped by
+    frequency grid.
+
+    descriptor is a JSON-serializable dictionary from which attachedLot
+    maps the same memory in another process.  The blocks exist until
+    close() is called by the owner.
+    """
+    def __init__(self, networks, name='lot'):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.blocks = []
+
+        groups = collections.OrderedDict()
+        for k, net in enumerate(networks):
+            groups.setdefault((net.nports, net.frequency.f.tobytes()), []).append(k)
+
+        self.descriptor = {
+            'name': name,
+            'names': [str(net.name) for net in networks],
+            'comments': [getattr(net, 'comments', '') or '' for net in networks],
+            'blocks': [],
+            }
+        try:
+            for indices in groups.values():
+                first = networks[indices[0]]
+                shape = (len(indices),) + first.s.shape
+                nbytes = 16 * (int(np.prod(shape)) + int(np.prod(shape[:3])))
+                shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+                self.blocks.append(shm)
+                _ownedBlocks.add(shm.name)
+
+                s, z0 = blockArrays(shm.buf, shape)
+                for row, k in enumerate(indices):
+                    s[row] = networks[k].s
+                    z0[row] = networks[k].z0
+                del s, z0       # Release the buffer so close() works
+
+                self.descriptor['blocks'].append({
+                    'shm': shm.name,
+                    'shape': list(shape),
+                    'indices': indices,
+                    'f': first.frequency.f.tolist(),
+                    'unit': first.frequency.unit,
+                    })
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return len(self.descriptor['names'])
+
+    def __repr__(self):
+        return 'sharedLot({:s}: {:d} devices, {:d} blocks, {:.1f} MB)'.format(
+            self.name, len(self), len(self.blocks), self.nbytes / 1024**2)
+
+    @property
+    def nbytes(self):
+        return sum(shm.size for shm in self.blocks)
+
+    def close(self):
+        """
+        Releases and removes the shared memory.  Processes that attached
+        keep their mapping until they drop it.
+        """
+        for shm in self.blocks:
+            try:
+                shm.close()
+                shm.unlink()
+            except (BufferError, FileNotFoundError):
+                self.logger.warning('Unable to release shared memory {:s}'.format(shm.name))
+            _ownedBlocks.discard(shm.name)
+        self.blocks = []
+
+
+class attachedLot(object):
+    """
+    Read-only view of a sharedLot in the current process.
+
+    blocks holds one (frequency, indices, s, z0) tuple per frequency grid,
+    s being (n, n_freq, nports, nports) and indices the positions of its
+    devices in the lot.  A lot measured on a single grid also provides
+    frequency, s and chunks() like a lotstore.lotStore, so it can be passed
+    to the functions of mwassist.sparam.stats directly.
+    """
+    def __init__(self, descriptor):
+        self.descriptor = descriptor
+        self.name = descriptor['name']
+        self.devices = [{'name': name, 'comments': comments}
+                        for name, comments in zip(descriptor['names'], descriptor['comments'])]
+        self.blocks = []
+        self._shm = []
+        self._location = {}     # Device index -> (block, row)
+
+        for b, block in enumerate(descriptor['blocks']):
+            shm = openSharedMemory(block['shm'])
+            self._shm.append(shm)
+            s, z0 = blockArrays(shm.buf, tuple(block['shape']))
+            s.flags.writeable = False
+            z0.flags.writeable = False
+
+            frequency = skrf.Frequency.from_f(np.array(block['f']), unit='hz')
+            frequency.unit = block['unit']
+            self.blocks.append((frequency, block['indices'], s, z0))
+            for row, k in enumerate(block['indices']):
+                self._location[k] = (b, row)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __reduce__(self):
+        # Pickled (e.g. by pull_vars()) as a reference to the shared memory
+        return (attachedLot, (self.descriptor,))
+
+    def __repr__(self):
+        return 'attachedLot({:s}: {:d} devices, {:d} frequency grids)'.format(
+            self.name, len(self), len(self.blocks))
+
+    @property
+    def names(self):
+        return [device['name'] for device in self.devices]
+
+    @property
+    def nports(self):
+        return max((s.shape[2] for frequency, indices, s, z0 in self.blocks), default=0)
+
+    def attribute(self, key, default=None):
+        return [device.get(key, default) for device in self.devices]
+
+    def singleBlock(self):
+        if len(self.blocks) != 1:
+            raise ValueError('Lot {:s} has {:d} frequency grids, use blocks or networks()'.format(
+                self.name, len(self.blocks)))
+        return self.blocks[0]
+
+    @property
+    def frequency(self):
+        return self.singleBlock()[0]
+
+    @property
+    def s(self):
+        return self.singleBlock()[2]
+
+    def chunks(self, maxBytes=64*1024**2):
+        """
+        Yields (start, s) blocks of consecutive devices holding at most
+        maxBytes of data each
+        """
+        s = self.s
+        bytesPerDevice = max(s[0:1].nbytes, 1)
+        step = max(int(maxBytes // bytesPerDevice), 1)
+        for start in range(0, len(self), step):
+            yield start, s[start:start+step]
+
+    def network(self, k):
+        """
+        Builds a skrf Network of a single device (which copies its data)
+        """
+        b, row = self._location[k]
+        frequency, indices, s, z0 = self.blocks[b]
+        net           = skrf.network.Network()
+        net.frequency = frequency
+        net.s         = s[row]
+        net.z0        = z0[row]
+        net.name      = self.devices[k]['name']
+        net.comments  = self.devices[k]['comments']
+        return net
+
+    def networks(self):
+        return [self.network(k) for k in range(len(self))]
+
+
+def packVariables(variables):
+    """
+    Pickles the picklable entries of a dictionary into an ASCII string.
+    Returns (text, skipped), skipped being the names left out.
+    """
+    values = {}
+    skipped = []
+    for name, value in variables.items():
+        try:
+            values[name] = pickle.dumps(value)
+        except Exception:
+            skipped.append(name)
+    return base64.b64encode(pickle.dumps(values)).decode('ascii'), skipped
+
+
+def unpackVariables(text):
+    """
+    Returns the dictionary packed by packVariables()
+    """
+    return {name: pickle.loads(value) for name, value in pickle.loads(base64.b64decode(text)).items()}
@@ -0,0 +1,201 @@
+'''
+Persistent on-disk cache of parsed touchstone files
+
+Parsed frequency/S/z0 arrays are stored as uncompressed .npz files named by
+the SHA-1 of the touchstone file contents.  A JSON index maps file paths to
+(size, mtime, hash) so unchanged files are found without re-reading them,
+and records the size and last access time of each entry for LRU eviction.
+
+@author: khershberger
+'''
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+
+def defaultCacheDirectory():
+    """
+    Cache location, overridable through the MWASSIST_CACHE environment variable
+    """
+    directory = os.environ.get('MWASSIST_CACHE')
+    if directory is None:
+        directory = os.path.join(os.path.expanduser('~'), '.cache', 'mwassist', 'touchstone')
+    return directory
+
+
+class touchstoneCache(object):
+    """
+    Size-bounded LRU cache of parsed touchstone files.
+
+    get() and put() exchange the same dictionaries of arrays as
+    loader.readTouchstoneArrays().  The index is only written by save(), so
+    a loader should call it once after a batch of files.
+    """
+    indexVersion = 1
+
+    def __init__(self, directory=None, maxBytes=2*1024**3):
+        self.logger = logging.getLogger(__name__)
+
+        self.directory = directory if directory is not None else defaultCacheDirectory()
+        self.maxBytes = maxBytes
+        self._lock = threading.RLock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.load()
+
+    @property
+    def indexPath(self):
+        return os.path.join(self.directory, 'index.json')
+
+    def entryPath(self, contentHash):
+        return os.path.join(self.directory, contentHash + '.npz')
+
+    def load(self):
+        with self._lock:
+            self.files = {}
+            self.entries = {}
+            try:
+                with open(self.indexPath, 'r') as fh:
+                    index = json.load(fh)
+                if index.get('version') == self.indexVersion:
+                    self.files = index['files']
+                    self.entries = index['entries']
+            except (IOError, ValueError, KeyError):
+                pass
+
+    def save(self):
+        with self._lock:
+            index = {'version': self.indexVersion,
+                     'files':   self.files,
+                     'entries': self.entries}
+            tmp = self.indexPath + '.tmp'
+            try:
+                with open(tmp, 'w') as fh:
+                    json.dump(index, fh)
+                os.replace(tmp, self.indexPath)
+            except (IOError, OSError):
+                self.logger.exception('Unable to write cache index')
+
+    @staticmethod
+    def contentHash(filename):
+        sha = hashlib.sha1()
+        with open(filename, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def lookupHash(self, filename):
+        """
+        Returns the content hash of filename.  The file is only read if its
+        size or modification time differ from the indexed values.
+        """
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+
+        with self._lock:
+            record = self.files.get(path)
+            if record is not None and record['size'] == st.st_size and record['mtime'] == st.st_mtime_ns:
+                return record['hash']
+
+        contentHash = self.contentHash(path)
+        with self._lock:
+            self.files[path] = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'hash': contentHash}
+        return contentHash
+
+    def get(self, filename):
+        """
+        Returns the cached arrays of filename or None if it is not cached
+        """
+        try:
+            contentHash = self.lookupHash(filename)
+        except (IOError, OSError):
+            return None
+
+        with self._lock:
+            entry = self.entries.get(contentHash)
+            if entry is None:
+                return None
+            entry['atime'] = time.time()
+
+        try:
+            with np.load(self.entryPath(contentHash), allow_pickle=False) as data:
+                arrays = {'filename': filename,
+                          'f':        data['f'],
+                          'unit':     str(data['unit']),
+                          's':        data['s'],
+                          'z0':       data['z0'],
+                          'comments': str(data['comments'])}
+        except (IOError, OSError, ValueError, KeyError):
+            self.logger.warning('Dropping unreadable cache entry for {:s}'.format(filename))
+            self.remove(contentHash)
+            return None
+
+        return arrays
+
+    def put(self, filename, arrays):
+        """
+        Stores the arrays parsed from filename
+        """
+        try:
+            contentHash = self.lookupHash(filename)
+            path = self.entryPath(contentHash)
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as fh:
+                np.savez(fh,
+                         f=arrays['f'],
+                         unit=np.array(arrays['unit']),
+                         s=arrays['s'],
+                         z0=arrays['z0'],
+                         comments=np.array(arrays.get('comments') or ''))
+            os.replace(tmp, path)
+        except (IOError, OSError):
+            self.logger.exception('Unable to cache {:s}'.format(filename))
+            return
+
+        with self._lock:
+            self.entries[contentHash] = {'bytes': os.path.getsize(path), 'atime': time.time()}
+            self.evict()
+
+    def remove(self, contentHash):
+        with self._lock:
+            self.entries.pop(contentHash, None)
+            try:
+                os.remove(self.entryPath(contentHash))
+            except OSError:
+                pass
+
+    @property
+    def totalBytes(self):
+        with self._lock:
+            return sum(entry['bytes'] for entry in self.entries.values())
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits in maxBytes
+        """
+        with self._lock:
+            total = self.totalBytes
+            if total <= self.maxBytes:
+                return
+            for contentHash, entry in sorted(self.entries.items(), key=lambda item: item[1]['atime']):
+                if total <= self.maxBytes:
+                    break
+                total -= entry['bytes']
+                self.remove(contentHash)
+
+            # Forget paths pointing at evicted entries
+            self.files = {path: record for path, record in self.files.items()
+                          if record['hash'] in self.entries}
+
+    def clear(self):
+        with self._lock:
+            for contentHash in list(self.entries):
+                self.remove(contentHash)
+            self.files = {}
+            self.save()
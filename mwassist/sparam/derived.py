@@ -0,0 +1,133 @@
+'''
+Quantities derived from S-parameters
+
+Every function works on a whole lot at once: s is a stacked (..., n_freq,
+nports, nports) array such as (n_networks, n_freq, nports, nports), f the
+frequency in Hz.  Per-element quantities return an array of the same
+shape, device quantities (stability and gain, two-ports only) return
+(..., n_freq, 1, 1) so both can be plotted on the usual grid of axes.
+
+@author: khershberger
+'''
+
+import collections
+
+import numpy as np
+
+
+def groupDelay(s, f):
+    """
+    Group delay in ns, -d(phase)/d(omega) of the unwrapped phase
+    """
+    if s.shape[-3] < 2:
+        return np.zeros(s.shape)
+    phase = np.unwrap(np.angle(s), axis=-3)
+    return -1e9 * np.gradient(phase, 2*np.pi*f, axis=-3)
+
+
+def vswr(s, f=None):
+    """
+    Voltage standing wave ratio, NaN where |S| >= 1
+    """
+    mag = np.abs(s)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(mag < 1, (1 + mag) / (1 - mag), np.nan)
+
+
+def returnLoss(s, f=None):
+    """
+    Return loss in dB, i.e. -20*log10(|S|)
+    """
+    mag = np.abs(s)
+    np.maximum(mag, np.finfo(float).tiny, out=mag)
+    return -20 * np.log10(mag)
+
+
+def twoPortTerms(s):
+    if s.shape[-1] != 2:
+        raise ValueError('Stability and gain require two-port networks, got {:d} ports'.format(s.shape[-1]))
+    s11 = s[..., 0, 0]
+    s12 = s[..., 0, 1]
+    s21 = s[..., 1, 0]
+    s22 = s[..., 1, 1]
+    return s11, s12, s21, s22, s11*s22 - s12*s21
+
+
+def rollettK(s, f=None):
+    """
+    Rollett stability factor K
+    """
+    s11, s12, s21, s22, delta = twoPortTerms(s)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = (1 - np.abs(s11)**2 - np.abs(s22)**2 + np.abs(delta)**2) / (2*np.abs(s12*s21))
+    return k[..., None, None]
+
+
+def deltaMagnitude(s, f=None):
+    """
+    |Delta| = |S11*S22 - S12*S21|
+    """
+    return np.abs(twoPortTerms(s)[4])[..., None, None]
+
+
+def muFactor(s, f=None):
+    """
+    Edwards-Sinsky stability factor mu (unconditionally stable if > 1)
+    """
+    s11, s12, s21, s22, delta = twoPortTerms(s)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mu = (1 - np.abs(s11)**2) / (np.abs(s22 - delta*np.conj(s11)) + np.abs(s12*s21))
+    return mu[..., None, None]
+
+
+def maxGain(s, f=None):
+    """
+    Maximum available gain in dB where the network is unconditionally
+    stable (K > 1 and |Delta| < 1), maximum stable gain elsewhere.  Unlike
+    skrf's Network.max_gain, K > 1 alone does not give MAG.
+    """
+    s11, s12, s21, s22, delta = twoPortTerms(s)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = (1 - np.abs(s11)**2 - np.abs(s22)**2 + np.abs(delta)**2) / (2*np.abs(s12*s21))
+        msg = np.abs(s21) / np.abs(s12)
+        stable = (k > 1) & (np.abs(delta) < 1)
+        gain = np.where(stable, msg * (k - np.sqrt(np.where(stable, k**2 - 1, 0))), msg)
+        return (10 * np.log10(gain))[..., None, None]
+
+
+class derivedQuantity(object):
+    def __init__(self, label, axisLabel, function, perElement=True):
+        self.label = label              # Menu text
+        self.axisLabel = axisLabel      # y axis label
+        self.function = function
+        self.perElement = perElement    # False for quantities of the whole device
+
+    def __call__(self, s, f):
+        return self.function(s, f)
+
+
+# Formats offered in addition to 'db', 'phase' and 'smith'
+derivedQuantities = collections.OrderedDict([
+    ('groupdelay', derivedQuantity('Group delay', 'Group delay (ns)', groupDelay)),
+    ('vswr',       derivedQuantity('VSWR', 'VSWR', vswr)),
+    ('returnloss', derivedQuantity('Return loss', 'Return loss (dB)', returnLoss)),
+    ('k',          derivedQuantity('Rollett K', 'K', rollettK, perElement=False)),
+    ('delta',      derivedQuantity('|Delta|', '|Delta|', deltaMagnitude, perElement=False)),
+    ('mu',         derivedQuantity('mu', 'mu', muFactor, perElement=False)),
+    ('mag',        derivedQuantity('MAG/MSG', 'MAG/MSG (dB)', maxGain, perElement=False)),
+    ])
+
+
+def isDerived(fmt):
+    return fmt in derivedQuantities
+
+
+def derivedValues(s, f, fmt):
+    """
+    Computes the derived quantity fmt (a key of derivedQuantities), with
+    non-finite values replaced by NaN
+    """
+    values = derivedQuantities[fmt](np.asarray(s), np.asarray(f, dtype=float))
+    # Poles such as K at |S12*S21| = 0 would break the axis limits
+    values[~np.isfinite(values)] = np.nan
+    return values
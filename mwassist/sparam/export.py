@@ -0,0 +1,140 @@
+'''
+Bulk export of statistics results
+
+Writes the networks of a statistics summary and of grouped statistics as
+touchstone files with touchstone.writeTouchstone(), and everything
+including the std, derived quantities and yield into a single compressed
+.npz bundle that loadBundle() reads back.  Nothing here uses Qt, so the
+GUI runs exportResults() as a background job and the CLI calls it
+directly.
+
+@author: khershberger
+'''
+
+import logging
+import os
+import re
+
+import numpy as np
+
+from mwassist.sparam.touchstone import writeTouchstone
+
+
+exportFormats = ('touchstone', 'bundle')
+
+
+def safeName(key):
+    """
+    Turns a group key into something usable in a file name
+    """
+    return re.sub(r'[^\w.+-]+', '_', str(key)).strip('_') or 'none'
+
+
+def summaryKeys(summary):
+    return ['mean'] + [summary.percentileKey(p) for p in summary.percentiles]
+
+
+def writeSummaryTouchstone(summary, directory, name, fmt='ri', precision=9):
+    """
+    Writes the mean and every percentile as <name>_<key>.sNp.  Returns the
+    file names.
+    """
+    unit = summary.frequency.unit
+    written = []
+    for key in summaryKeys(summary):
+        net = summary.mean if key == 'mean' else summary.network(key)
+        written.append(writeTouchstone(os.path.join(directory, '{:s}_{:s}'.format(name, key)),
+                                       summary.frequency.f, net.s, unit=unit, fmt=fmt,
+                                       comments='{:s} of {:d} devices'.format(key, summary.count),
+                                       precision=precision))
+    return written
+
+
+def writeGroupsTouchstone(groups, directory, name, fmt='ri', precision=9):
+    """
+    Writes the mean of every group as <name>_<group>.sNp
+    """
+    unit = groups.frequency.unit
+    written = []
+    for g in range(len(groups)):
+        comments = 'Mean of group {} ({:d} devices)'.format(groups.keys[g], int(groups.counts[g]))
+        written.append(writeTouchstone(os.path.join(directory, '{:s}_{:s}'.format(name, safeName(groups.keys[g]))),
+                                       groups.frequency.f, groups.mean[g], unit=unit, fmt=fmt,
+                                       comments=comments, precision=precision))
+    return written
+
+
+def bundleArrays(summary=None, groups=None, names=None):
+    """
+    Flattens a summary and grouped statistics into a dictionary of arrays,
+    e.g. 'db/p95', 'phase/std', 'derived/k/mean' or 'groups/db/mean'
+    """
+    arrays = {}
+    if summary is not None:
+        arrays['frequency'] = summary.frequency.f
+        arrays['unit'] = np.array(summary.frequency.unit)
+        arrays['count'] = np.array(summary.count)
+        arrays['percentiles'] = np.array(summary.percentiles, dtype=float)
+        arrays['mean'] = summary.mean.s
+        for quantity, values in (('db', summary.db), ('phase', summary.phase)):
+            for key, value in values.items():
+                arrays['{:s}/{:s}'.format(quantity, key)] = value
+        for quantity, values in summary.derived.items():
+            for key, value in values.items():
+                arrays['derived/{:s}/{:s}'.format(quantity, key)] = value
+        if summary.passed is not None:
+            arrays['passed'] = summary.passed
+        if names is not None:
+            arrays['names'] = np.array([str(n) for n in names])
+
+    if groups is not None:
+        arrays['groups/frequency'] = groups.frequency.f
+        arrays['groups/keys'] = np.array([str(k) for k in groups.keys])
+        arrays['groups/counts'] = np.asarray(groups.counts)
+        arrays['groups/mean'] = groups.mean
+        for quantity, values in (('db', groups.db), ('phase', groups.phase)):
+            for key, value in values.items():
+                arrays['groups/{:s}/{:s}'.format(quantity, key)] = value
+
+    return arrays
+
+
+def writeBundle(filename, summary=None, groups=None, names=None):
+    """
+    Writes statistics into one compressed .npz file.  Returns the file name.
+    """
+    if not filename.endswith('.npz'):
+        filename += '.npz'
+    np.savez_compressed(filename, **bundleArrays(summary, groups, names))
+    return filename
+
+
+def loadBundle(filename):
+    """
+    Reads a bundle written by writeBundle() into a dictionary of arrays
+    """
+    with np.load(filename, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+
+def exportResults(directory, name, summary=None, groups=None, names=None,
+                  outputs=exportFormats, fmt='ri', precision=9):
+    """
+    Writes the requested outputs ('touchstone' and/or 'bundle') of a
+    summary and/or grouped statistics into directory.  Returns the list of
+    files written.
+    """
+    logger = logging.getLogger(__name__)
+    os.makedirs(directory, exist_ok=True)
+
+    written = []
+    if 'touchstone' in outputs:
+        if summary is not None:
+            written += writeSummaryTouchstone(summary, directory, name, fmt=fmt, precision=precision)
+        if groups is not None:
+            written += writeGroupsTouchstone(groups, directory, name + '_group', fmt=fmt, precision=precision)
+    if 'bundle' in outputs:
+        written.append(writeBundle(os.path.join(directory, name), summary, groups, names))
+
+    logger.debug('Exported {:d} files to {:s}'.format(len(written), directory))
+    return written
@@ -0,0 +1,212 @@
+'''
+Background jobs for the sparam widget
+
+Long running work (loading, statistics, preparing trace data, saving) is run
+on a QThreadPool so the Qt event loop never blocks.  Results are posted back
+to the GUI thread through signals, which is where anything touching Qt
+widgets or matplotlib artists must happen.
+
+@author: khershberger
+'''
+
+import logging
+import threading
+import traceback
+
+from PyQt5.QtCore import (
+    QObject,
+    QRunnable,
+    QThreadPool,
+    pyqtSignal
+    )
+
+
+class jobSignals(QObject):
+    finished = pyqtSignal(object, object)       # job, result
+    failed   = pyqtSignal(object, str)          # job, traceback
+    progress = pyqtSignal(object, int, int, str)
+
+
+class job(QRunnable):
+    """
+    A unit of work run by jobScheduler.
+
+    fn is called as fn(job, *args, **kwargs) in a pool thread.  It may poll
+    job.cancelled, register cleanup through job.onCancel() and report
+    progress through job.reportProgress().
+    """
+    def __init__(self, key, fn, args, kwargs):
+        super().__init__()
+        self.setAutoDelete(False)
+
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = jobSignals()
+        self.discarded = False      # Result is no longer wanted
+        self.started = False
+        self.onResult = None
+        self.onError = None
+        self.onProgress = None
+
+        self._cancelEvent = threading.Event()
+        self._cancelCallbacks = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'job({:s})'.format(str(self.key))
+
+    @property
+    def cancelled(self):
+        return self._cancelEvent.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._cancelEvent.set()
+            callbacks = list(self._cancelCallbacks)
+        for callback in callbacks:
+            callback()
+
+    def onCancel(self, callback):
+        """
+        Registers a function called when the job is cancelled, e.g. the
+        cancel() method of a touchstoneLoader doing the actual work
+        """
+        with self._lock:
+            self._cancelCallbacks.append(callback)
+            cancelled = self.cancelled
+        if cancelled:
+            callback()
+
+    def reportProgress(self, nDone, nTotal, message=''):
+        self.signals.progress.emit(self, nDone, nTotal, message)
+
+    def run(self):
+        self.started = True
+        if self.cancelled:
+            self.signals.finished.emit(self, None)
+            return
+        try:
+            result = self.fn(self, *self.args, **self.kwargs)
+        except Exception:
+            self.signals.failed.emit(self, traceback.format_exc())
+        else:
+            self.signals.finished.emit(self, result)
+
+
+class jobScheduler(QObject):
+    """
+    Runs jobs on a QThreadPool and hands their results to callbacks in the
+    thread owning the scheduler (the GUI thread).
+
+    Jobs are identified by a key such as 'statistics'.  Submitting a job
+    replaces any job of the same key still queued or running: the older job
+    is cancelled and its result discarded, so a burst of identical requests
+    (e.g. several format changes in a row) only delivers the last one.
+    Callbacks are never called for discarded jobs.
+
+    With synchronous=True (or submit(..., synchronous=True)) jobs run inline,
+    which is useful from scripts and the console.
+    """
+    def __init__(self, parent=None, maxThreads=None, synchronous=False):
+        super().__init__(parent)
+        self.logger = logging.getLogger(__name__)
+
+        self.pool = QThreadPool(self)
+        if maxThreads is not None:
+            self.pool.setMaxThreadCount(maxThreads)
+        self.synchronous = synchronous
+        self.jobs = {}      # Latest job of each key
+        self.active = set() # Every job not yet finished, keeps them alive while in the pool
+
+    def submit(self, key, fn, *args, onResult=None, onError=None, onProgress=None,
+               synchronous=None, **kwargs):
+        """
+        Runs fn(job, *args, **kwargs) in the background.  onResult(result)
+        is called with its return value, onError(message) if it raised and
+        onProgress(nDone, nTotal, message) for job.reportProgress().
+        Returns the job.
+        """
+        self.discard(key)
+
+        newJob = job(key, fn, args, kwargs)
+        newJob.onResult = onResult
+        newJob.onError = onError
+        newJob.onProgress = onProgress
+        newJob.signals.finished.connect(self.onJobFinished)
+        newJob.signals.failed.connect(self.onJobFailed)
+        newJob.signals.progress.connect(self.onJobProgress)
+        self.jobs[key] = newJob
+        self.active.add(newJob)
+
+        if synchronous if synchronous is not None else self.synchronous:
+            newJob.run()
+        else:
+            self.pool.start(newJob)
+        return newJob
+
+    def cancel(self, key=None):
+        """
+        Cancels the job of key (all jobs if key is None).  The job still
+        delivers whatever result it returns after noticing the cancellation,
+        e.g. the files loaded so far.
+        """
+        keys = list(self.jobs) if key is None else [key]
+        for k in keys:
+            if k in self.jobs:
+                self.jobs[k].cancel()
+
+    def discard(self, key=None):
+        """
+        Cancels the job of key (all jobs if key is None) and drops its result
+        """
+        keys = list(self.jobs) if key is None else [key]
+        for k in keys:
+            oldJob = self.jobs.pop(k, None)
+            if oldJob is None:
+                continue
+            oldJob.discarded = True
+            oldJob.cancel()
+            if not oldJob.started and self.pool.tryTake(oldJob):
+                self.active.discard(oldJob)
+                self.logger.debug('Dropped queued {:s}'.format(repr(oldJob)))
+
+    def isRunning(self, key=None):
+        if key is None:
+            return len(self.jobs) > 0
+        return key in self.jobs
+
+    def waitForDone(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+    def finishJob(self, doneJob):
+        """
+        Forgets a finished job.  Returns False if its result is to be dropped.
+        """
+        self.active.discard(doneJob)
+        if doneJob.discarded or self.jobs.get(doneJob.key) is not doneJob:
+            return False
+        del self.jobs[doneJob.key]
+        return True
+
+    def onJobFinished(self, doneJob, result):
+        if not self.finishJob(doneJob):
+            return
+        if doneJob.onResult is not None:
+            try:
+                doneJob.onResult(result)
+            except Exception:
+                self.logger.exception('Result handler of {:s} failed'.format(repr(doneJob)))
+
+    def onJobFailed(self, doneJob, message):
+        if not self.finishJob(doneJob):
+            return
+        self.logger.error('{:s} failed:\n{:s}'.format(repr(doneJob), message))
+        if doneJob.onError is not None:
+            doneJob.onError(message)
+
+    def onJobProgress(self, progressJob, nDone, nTotal, message):
+        if progressJob.discarded or progressJob.onProgress is None:
+            return
+        progressJob.onProgress(nDone, nTotal, message)
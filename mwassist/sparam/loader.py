@@ -0,0 +1,180 @@
+'''
+Parallel loading of touchstone SNP files
+
+Files are parsed in worker processes and shipped back as plain numpy arrays
+which are much cheaper to pickle than full skrf Network objects.  This module
+must not import any Qt code since it is imported by the worker processes.
+
+@author: khershberger
+'''
+
+import concurrent.futures
+import logging
+import multiprocessing
+import threading
+
+import skrf
+
+from mwassist.instrument import span
+from mwassist.sparam import touchstone
+from mwassist.sparam.touchstone import networkFromArrays
+
+
+def readTouchstoneArrays(filename):
+    """
+    Parses a single touchstone file and returns a dictionary of numpy arrays.
+
+    This is the function executed inside the worker processes.  The fast
+    touchstone parser is used where possible, anything it does not handle
+    (e.g. touchstone v2) falls back to skrf.
+    """
+    try:
+        return touchstone.readTouchstoneArrays(filename)
+    except ValueError:
+        pass
+
+    spnet = skrf.network.Network()
+    spnet.read_touchstone(filename)
+
+    return {'filename': filename,
+            'f':        spnet.frequency.f,
+            'unit':     spnet.frequency.unit,
+            's':        spnet.s,
+            'z0':       spnet.z0,
+            'comments': spnet.comments}
+
+
+class touchstoneLoader(object):
+    """
+    Loads a list of touchstone files in parallel using a process pool.
+
+    run() blocks until all files are parsed or the load is cancelled, so it
+    is meant to be called from a worker thread.  Progress and per-file errors
+    are reported through optional callbacks:
+
+        progress(nDone, nTotal, filename)
+        error(filename, message)
+
+    Small lists are parsed in the calling thread since starting the pool
+    costs more than it saves.  If a cache.touchstoneCache is given, cached
+    files are not parsed at all and newly parsed files are added to it.
+    """
+    def __init__(self, filelist, maxWorkers=None, serialThreshold=4, cache=None):
+        self.logger = logging.getLogger(__name__)
+
+        self.filelist = list(filelist)
+        self.maxWorkers = maxWorkers
+        self.serialThreshold = serialThreshold
+        self.cache = cache
+        self._cancelEvent = threading.Event()
+
+    def cancel(self):
+        """
+        Requests cancellation.  Everything still queued is dropped and the
+        load returns without waiting for files already being parsed.
+        """
+        self._cancelEvent.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelEvent.is_set()
+
+    def iterArrays(self, progress=None, error=None):
+        """
+        Parses all files and yields (index, arrays) for every file parsed
+        successfully, in order of completion.  index refers to the original
+        file list.  Nothing is kept after it has been yielded, so this can
+        stream lots that do not fit in memory.
+        """
+        nTotal = len(self.filelist)
+        nDone = 0
+
+        def handleResult(idx, future):
+            fname = self.filelist[idx]
+            try:
+                arrays = future.result()
+                if self.cache is not None:
+                    self.cache.put(fname, arrays)
+            except Exception as e:
+                arrays = None
+                if error is not None:
+                    error(fname, str(e))
+            if progress is not None:
+                progress(nDone, nTotal, fname)
+            return arrays
+
+        # Take whatever we can from the cache first
+        pending = list(enumerate(self.filelist))
+        if self.cache is not None:
+            misses = []
+            for idx, fname in pending:
+                if self.cancelled:
+                    break
+                arrays = self.cache.get(fname)
+                if arrays is None:
+                    misses.append((idx, fname))
+                else:
+                    nDone += 1
+                    if progress is not None:
+                        progress(nDone, nTotal, fname)
+                    yield idx, arrays
+            pending = misses
+            if nDone > 0:
+                self.logger.debug('{:d} of {:d} files loaded from cache'.format(nDone, nTotal))
+
+        try:
+            if self.cancelled or len(pending) == 0:
+                pass
+            elif len(pending) <= self.serialThreshold or self.maxWorkers == 1:
+                for idx, fname in pending:
+                    if self.cancelled:
+                        break
+                    future = concurrent.futures.Future()
+                    try:
+                        future.set_result(readTouchstoneArrays(fname))
+                    except Exception as e:
+                        future.set_exception(e)
+                    nDone += 1
+                    arrays = handleResult(idx, future)
+                    if arrays is not None:
+                        yield idx, arrays
+            else:
+                # Forking a process with Qt and pool threads running can
+                # deadlock the child, so workers are always spawned
+                pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.maxWorkers,
+                                                              mp_context=multiprocessing.get_context('spawn'))
+                try:
+                    futures = {pool.submit(readTouchstoneArrays, fname): idx
+                               for idx, fname in pending}
+
+                    for future in concurrent.futures.as_completed(futures):
+                        if self.cancelled:
+                            break
+                        nDone += 1
+                        arrays = handleResult(futures[future], future)
+                        if arrays is not None:
+                            yield futures[future], arrays
+                finally:
+                    # A cancelled load returns without waiting for the files
+                    # still being parsed
+                    pool.shutdown(wait=not self.cancelled, cancel_futures=True)
+        finally:
+            if self.cache is not None:
+                self.cache.save()
+
+        if self.cancelled:
+            self.logger.warning('Loading cancelled after {:d} of {:d} files'.format(nDone, nTotal))
+
+    def run(self, progress=None, error=None):
+        """
+        Parses all files and returns the resulting Networks in the order of
+        the original file list.  Files that failed to parse are omitted.
+        """
+        with span('loadFiles', files=len(self.filelist)) as sp:
+            results = [None] * len(self.filelist)
+            for idx, arrays in self.iterArrays(progress=progress, error=error):
+                results[idx] = networkFromArrays(arrays)
+
+            networks = [net for net in results if net is not None]
+            sp.set(loaded=len(networks), points=sum(len(net.frequency) for net in networks))
+        return networks
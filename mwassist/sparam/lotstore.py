@@ -0,0 +1,224 @@
+'''
+Memory-mapped lot store for very large measurement sets
+
+A lot store is a directory holding
+
+    s.npy           (n_devices, n_freq, nports, nports) complex array
+    frequency.npy   frequency points in Hz
+    index.json      frequency unit, device count and per-device metadata
+
+All devices share one frequency grid.  s.npy is opened memory-mapped so
+statistics and plotting can work through it in chunks without ever loading
+the whole lot.  Converting touchstone files into a store is done once with
+createLotStore().
+
+@author: khershberger
+'''
+
+import json
+import logging
+import os
+
+import numpy as np
+import skrf
+
+from mwassist.sparam.loader import readTouchstoneArrays, touchstoneLoader
+from mwassist.sparam.stats import (
+    interpolationWeights,
+    stackMean
+    )
+
+
+class lotStore(object):
+    """
+    Read access to a lot store created by createLotStore()
+    """
+    indexVersion = 1
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+
+        with open(os.path.join(path, 'index.json'), 'r') as fh:
+            index = json.load(fh)
+        if index.get('version') != self.indexVersion:
+            raise ValueError('Unsupported lot store version in {:s}'.format(path))
+
+        self.devices = index['devices']
+        self.z0 = index['z0']
+
+        self.frequency = skrf.Frequency.from_f(np.load(os.path.join(path, 'frequency.npy')), unit='hz')
+        self.frequency.unit = index['unit']
+
+        s = np.load(os.path.join(path, 's.npy'), mmap_mode=mode)
+        self.s = s[:index['count']]
+
+    def __len__(self):
+        return self.s.shape[0]
+
+    def __repr__(self):
+        return 'lotStore({:s}: {:d} devices, {:d}-port, {:d} points)'.format(
+            self.path, len(self), self.nports, len(self.frequency))
+
+    @property
+    def nports(self):
+        return self.s.shape[2]
+
+    @property
+    def names(self):
+        return [device['name'] for device in self.devices]
+
+    def attribute(self, key, default=None):
+        """
+        Returns the given per-device attribute for all devices
+        """
+        return [device.get(key, default) for device in self.devices]
+
+    def network(self, k):
+        """
+        Builds a skrf Network of a single device
+        """
+        net           = skrf.network.Network()
+        net.frequency = self.frequency
+        net.s         = np.array(self.s[k])
+        net.z0        = self.z0
+        net.name      = self.devices[k]['name']
+        return net
+
+    def chunks(self, maxBytes=64*1024**2):
+        """
+        Yields (start, s) blocks of consecutive devices holding at most
+        maxBytes of data each
+        """
+        bytesPerDevice = max(self.s[0:1].nbytes, 1)
+        step = max(int(maxBytes // bytesPerDevice), 1)
+        for start in range(0, len(self), step):
+            yield start, self.s[start:start+step]
+
+    def mean(self, averaging='polar'):
+        """
+        Mean of the whole lot, computed one device at a time ('polar') or
+        in frequency chunks ('circular')
+        """
+        dataAvg           = skrf.network.Network()
+        dataAvg.frequency = self.frequency
+        dataAvg.s         = stackMean(self.s, averaging)
+        dataAvg.name      = 'Mean'
+        return dataAvg
+
+
+def createLotStore(path, filelist, frequency=None, dtype=complex, attributes=None,
+                   maxWorkers=None, cache=None, progress=None, error=None):
+    """
+    Converts a list of touchstone files into a lot store at path.
+
+    Files are parsed in parallel and written straight into the memory-mapped
+    array, so the lot never has to fit in memory.  All devices are
+    interpolated onto frequency (a skrf.Frequency), which defaults to the
+    grid of the first file in filelist that can be read.  The port count
+    and impedance are taken from that file as well.  Files of a different
+    port count or not covering
+    the frequency range are reported through error(filename, message) and
+    skipped.
+
+    attributes, if given, is called as attributes(filename, comments) and
+    returns a dictionary of extra per-device metadata.
+
+    Returns the opened lotStore.
+    """
+    logger = logging.getLogger(__name__)
+    filelist = list(filelist)
+    os.makedirs(path, exist_ok=True)
+
+    # The pool returns files in completion order, so the reference file is
+    # read up front to make the store independent of that order.  Files
+    # failing here are reported by the loader below.
+    reference = None
+    for fname in filelist:
+        try:
+            reference = cache.get(fname) if cache is not None else None
+            if reference is None:
+                reference = readTouchstoneArrays(fname)
+            break
+        except Exception:
+            continue
+
+    s = None
+    f = None
+    z0 = None
+    if reference is not None:
+        if frequency is None:
+            frequency = skrf.Frequency.from_f(reference['f'], unit='hz')
+            frequency.unit = reference['unit']
+        f = frequency.f
+        z0 = [float(np.real(z)) for z in reference['z0'][0]]
+        nports = reference['s'].shape[1]
+        s = np.lib.format.open_memmap(os.path.join(path, 's.npy'), mode='w+', dtype=dtype,
+                                      shape=(len(filelist), len(f), nports, nports))
+
+    loader = touchstoneLoader(filelist, maxWorkers=maxWorkers, cache=cache)
+    written = np.zeros(len(filelist), dtype=bool)
+    devices = [None] * len(filelist)
+    weightCache = {}
+
+    for idx, arrays in loader.iterArrays(progress=progress, error=error):
+        if s is None:
+            continue
+        fname = filelist[idx]
+        nports = arrays['s'].shape[1]
+
+        fNet = arrays['f']
+        if nports != s.shape[2]:
+            msg = '{:d} ports, expected {:d}'.format(nports, s.shape[2])
+        elif fNet[0] > f[0] or fNet[-1] < f[-1]:
+            msg = 'does not cover the lot frequency range'
+        else:
+            msg = None
+        if msg is not None:
+            if error is not None:
+                error(fname, msg)
+            continue
+
+        if len(fNet) == len(f) and np.array_equal(fNet, f):
+            s[idx] = arrays['s']
+        else:
+            key = fNet.tobytes()
+            if key not in weightCache:
+                i, w = interpolationWeights(fNet, f)
+                weightCache[key] = (i, i+1, w[:, None, None])
+            idxLo, idxHi, weight = weightCache[key]
+            sNet = arrays['s']
+            s[idx] = sNet[idxLo] + (sNet[idxHi] - sNet[idxLo]) * weight
+
+        device = {'filename': fname,
+                  'name':     os.path.splitext(os.path.basename(fname))[0],
+                  'comments': arrays.get('comments', '')}
+        if attributes is not None:
+            device.update(attributes(fname, device['comments']))
+        devices[idx] = device
+        written[idx] = True
+
+    if s is None:
+        raise ValueError('No files could be loaded')
+
+    # Close the gaps left by files that failed, keeping the file order
+    count = 0
+    for idx in np.flatnonzero(written):
+        if idx != count:
+            s[count] = s[idx]
+        count += 1
+    s.flush()
+    del s
+
+    np.save(os.path.join(path, 'frequency.npy'), f)
+
+    index = {'version':  lotStore.indexVersion,
+             'unit':     frequency.unit,
+             'count':    count,
+             'z0':       z0,
+             'devices':  [device for device in devices if device is not None]}
+    with open(os.path.join(path, 'index.json'), 'w') as fh:
+        json.dump(index, fh)
+
+    logger.info('Created lot store {:s} with {:d} of {:d} files'.format(path, count, len(filelist)))
+
+    return lotStore(path)
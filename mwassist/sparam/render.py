@@ -0,0 +1,663 @@
+'''
+Fast rendering of large numbers of S-parameter traces
+
+Instead of one Line2D per network per subplot, all traces of a subplot are
+drawn as a single LineCollection decimated to the pixel resolution of the
+axes, or rasterized into a density image.  The collection still holds one
+segment list per trace, so its drawing cost grows with the lot size; only
+the density image is bounded by the axes size.  Smith charts draw their grid
+from a cached bitmap and all reflection traces as one collection.  Devices
+with many ports can be shown as an overview of small density tiles on a
+single axes instead of one axes per S-parameter.  Only
+matplotlib artists are used here, no pyplot and no Qt, so this also works
+with offscreen backends.
+
+@author: khershberger
+'''
+
+import collections
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib import rcParams
+import skrf
+
+from mwassist.sparam.derived import derivedValues, isDerived
+from mwassist.sparam.stats import interpolationWeights
+
+
+def groupByFrequency(networks):
+    """
+    Groups networks sharing the same frequency grid.
+
+    Returns a list of (frequency, s) tuples where s is the stacked
+    (n_networks, n_freq, nports, nports) array of that group.
+    """
+    groups = collections.OrderedDict()
+    for net in networks:
+        key = (net.nports, net.frequency.f.tobytes())
+        groups.setdefault(key, []).append(net)
+
+    return [(nets[0].frequency, np.stack([net.s for net in nets]))
+            for nets in groups.values()]
+
+
+def traceValues(s, fmt):
+    """
+    Converts complex S-parameters into the plotted quantity ('db' or
+    'phase' in degrees) for an array of any shape.
+    """
+    if fmt == 'phase':
+        return np.degrees(np.angle(s))
+    else:
+        db = np.abs(s)
+        np.maximum(db, np.finfo(float).tiny, out=db)
+        np.log10(db, out=db)
+        db *= 20
+        return db
+
+
+def wrappedBands(lo, hi):
+    """
+    Splits a band of phases in degrees, lo <= hi but possibly beyond
+    +-180 (such as the percentiles of a statisticsSummary), into the
+    pieces that lie within -180..180 once wrapped like traceValues().
+    Returns a list of (lo, hi) pairs.
+    """
+    bands = []
+    for shift in (-360.0, 0.0, 360.0):
+        bandLo = np.clip(lo + shift, -180.0, 180.0)
+        bandHi = np.clip(hi + shift, -180.0, 180.0)
+        if np.any(bandHi > bandLo):
+            bands.append((bandLo, bandHi))
+    return bands
+
+
+def quantityValues(s, f, fmt):
+    """
+    Converts complex S-parameters into the plotted quantity, either
+    'db'/'phase' as in traceValues() or a derived.derivedQuantities format.
+    f is the frequency in Hz along axis -3 of s.
+    """
+    if isDerived(fmt):
+        return derivedValues(s, f, fmt)
+    return traceValues(s, fmt)
+
+
+def lotTraces(networks, scale, fmt):
+    """
+    Returns the plotted quantity of a list of networks as (x, Y) groups as
+    taken by traceRenderer and densityRenderer, with x being the frequency
+    divided by scale and Y (n_networks, n_freq, nports, nports), or
+    (n_networks, n_freq, 1, 1) for device quantities such as K.
+    """
+    return [(freq.f / scale, quantityValues(sGroup, freq.f, fmt))
+            for freq, sGroup in groupByFrequency(networks)]
+
+
+def lotReflections(networks):
+    """
+    Returns the S-parameters of a list of networks as Gamma-plane
+    coordinates, a list with one (n_networks, n_freq, nports, nports, 2)
+    array of (real, imag) pairs per frequency grid.  The pairs are a view of
+    the stacked complex data, so no per-trace conversion is needed.
+    """
+    return [np.ascontiguousarray(sGroup).view(np.float64).reshape(sGroup.shape + (2,))
+            for freq, sGroup in groupByFrequency(networks)]
+
+
+def decimateMinMax(x, y, nColumns):
+    """
+    Reduces traces to a min/max pair per pixel column.
+
+    y has shape (n_traces, n_points) and shares the x axis.  Returns x and y
+    with 2*nColumns points (or the inputs unchanged if they are already
+    smaller).  Each column is drawn as a vertical stroke from its minimum
+    to its maximum, so peaks are preserved at any zoom level.
+    """
+    nPoints = y.shape[-1]
+    if nPoints <= 2*nColumns or nColumns < 1:
+        return x, y
+
+    edges = np.linspace(x[0], x[-1], nColumns+1)
+    starts = np.unique(np.searchsorted(x, edges[:-1], side='left'))
+    starts = starts[starts < nPoints]
+
+    yMin = np.minimum.reduceat(y, starts, axis=-1)
+    yMax = np.maximum.reduceat(y, starts, axis=-1)
+
+    ends = np.append(starts[1:], nPoints) - 1
+    xCol = 0.5 * (x[starts] + x[ends])
+
+    xOut = np.repeat(xCol, 2)
+    yOut = np.empty(y.shape[:-1] + (2*len(starts),), dtype=y.dtype)
+    yOut[..., 0::2] = yMin
+    yOut[..., 1::2] = yMax
+
+    return xOut, yOut
+
+
+def traceColors(nTraces):
+    """
+    Colors from the default property cycle, one per trace
+    """
+    cycle = rcParams['axes.prop_cycle'].by_key().get('color', ['C0'])
+    return [cycle[k % len(cycle)] for k in range(nTraces)]
+
+
+def columnRanges(x, y, xMin, xMax, nColumns):
+    """
+    Splits xMin..xMax into nColumns equal columns and returns the range
+    each trace covers within every column it passes through.
+
+    Returns (columns, lo, hi) where columns holds the column indices and lo
+    and hi are (n_traces, len(columns)).  Traces with fewer points than
+    columns are linearly resampled first, and each range is extended to
+    meet its neighbour so that the traces stay continuous.
+    """
+    if len(x) < nColumns:
+        dx = (xMax - xMin) / nColumns
+        xc = xMin + dx * (np.arange(nColumns) + 0.5)
+        xc = xc[(xc >= x[0]) & (xc <= x[-1])]
+        if len(xc) > 0:
+            idx, weight = interpolationWeights(x, xc)
+            y = y[:, idx] + (y[:, np.minimum(idx+1, len(x)-1)] - y[:, idx]) * weight
+            x = xc
+
+    cols = ((x - xMin) / (xMax - xMin) * nColumns).astype(int)
+    np.clip(cols, 0, nColumns-1, out=cols)
+    starts = np.flatnonzero(np.r_[True, cols[1:] != cols[:-1]])
+
+    yMin = np.minimum.reduceat(y, starts, axis=-1)
+    yMax = np.maximum.reduceat(y, starts, axis=-1)
+
+    lo = yMin.copy()
+    hi = yMax.copy()
+    lo[:, 1:] = np.minimum(yMin[:, 1:], yMax[:, :-1])
+    hi[:, 1:] = np.maximum(yMax[:, 1:], yMin[:, :-1])
+
+    return cols[starts], lo, hi
+
+
+def columnHistogram(lo, hi, yMin, yMax, nBins):
+    """
+    Counts, for every column, how many traces cover each of nBins bins
+    between yMin and yMax.  lo and hi are (n_traces, n_columns), the result
+    is (n_columns, nBins).
+    """
+    nTraces, nColumns = lo.shape
+    scale = nBins / (yMax - yMin)
+
+    binLo = np.clip(np.floor((lo - yMin) * scale), 0, nBins-1).astype(int)
+    binHi = np.clip(np.floor((hi - yMin) * scale), 0, nBins-1).astype(int)
+
+    # +1 at the first bin covered and -1 after the last, then integrate
+    colIdx = np.broadcast_to(np.arange(nColumns) * (nBins+1), lo.shape)
+    valid = np.isfinite(lo) & np.isfinite(hi)
+    delta  = np.bincount((colIdx + binLo)[valid], minlength=nColumns*(nBins+1))
+    delta -= np.bincount((colIdx + binHi + 1)[valid], minlength=nColumns*(nBins+1))
+
+    counts = np.cumsum(delta.reshape(nColumns, nBins+1), axis=1)
+    return counts[:, :nBins]
+
+
+class traceRenderer(object):
+    """
+    Draws all traces of one axes as a single LineCollection.
+
+    Traces are given as (x, Y) groups where Y is (n_traces, n_points).  The
+    collection is re-decimated to the visible x range whenever the x limits
+    change or update() is called (e.g. after the axes were resized).
+    Decimation bounds the points per trace, not the number of traces, so
+    large lots are better drawn by densityRenderer.
+    """
+    def __init__(self, ax, colors=None, linewidth=None):
+        self.ax = ax
+        self.groups = []
+        self.colors = colors
+        self.linewidth = linewidth if linewidth is not None else rcParams['lines.linewidth']
+
+        self.collection = LineCollection([], linewidths=self.linewidth)
+        ax.add_collection(self.collection)
+        self._cid = ax.callbacks.connect('xlim_changed', self.onXlimChanged)
+
+    def remove(self):
+        self.ax.callbacks.disconnect(self._cid)
+        self.collection.remove()
+
+    def setTraces(self, groups):
+        self.groups = []
+        self.addTraces(groups)
+
+    def addTraces(self, groups):
+        for x, Y in groups:
+            self.groups.append((x, Y))
+            self.ax.update_datalim([(np.min(x), np.nanmin(Y)), (np.max(x), np.nanmax(Y))])
+
+        self.collection.set_color(self.colors if self.colors is not None else traceColors(self.nTraces))
+        self.ax.autoscale_view()
+        self.update()
+
+    @property
+    def nTraces(self):
+        return sum(Y.shape[0] for x, Y in self.groups)
+
+    def onXlimChanged(self, ax):
+        self.update()
+
+    def update(self):
+        xMin, xMax = self.ax.get_xlim()
+        nColumns = max(int(self.ax.get_window_extent().width), 1)
+
+        segments = []
+        for x, Y in self.groups:
+            # Keep one point either side of the visible range
+            i0 = max(np.searchsorted(x, xMin, side='left') - 1, 0)
+            i1 = min(np.searchsorted(x, xMax, side='right') + 1, len(x))
+            if i1 - i0 < 1:
+                segments.extend(np.empty((Y.shape[0], 0, 2)))
+                continue
+
+            xd, yd = decimateMinMax(x[i0:i1], Y[:, i0:i1], nColumns)
+            seg = np.empty(yd.shape + (2,))
+            seg[..., 0] = xd
+            seg[..., 1] = yd
+            segments.extend(seg)
+
+        self.collection.set_segments(segments)
+
+
+class densityRenderer(object):
+    """
+    Rasterizes all traces of one axes into a 2-D histogram image.
+
+    The image resolution follows the pixel size of the axes so drawing cost
+    is independent of the number of traces.  Counts are log scaled so that
+    isolated outliers remain visible next to the bulk of the lot.
+    """
+    def __init__(self, ax, cmap='Blues', pixelsPerBin=2):
+        self.ax = ax
+        self.cmap = cmap
+        self.pixelsPerBin = pixelsPerBin
+        self.groups = []
+        self.image = None
+
+    def remove(self):
+        if self.image is not None:
+            self.image.remove()
+            self.image = None
+
+    @property
+    def nTraces(self):
+        return sum(Y.shape[0] for x, Y in self.groups)
+
+    def setTraces(self, groups):
+        self.groups = []
+        self.addTraces(groups)
+
+    def addTraces(self, groups):
+        self.groups.extend(groups)
+        self.update()
+
+    def update(self):
+        if len(self.groups) == 0:
+            return
+
+        bbox = self.ax.get_window_extent()
+        nx = max(int(bbox.width / self.pixelsPerBin), 16)
+        ny = max(int(bbox.height / self.pixelsPerBin), 16)
+
+        xMin = min(np.min(x) for x, Y in self.groups)
+        xMax = max(np.max(x) for x, Y in self.groups)
+        yMin = min(np.nanmin(Y) for x, Y in self.groups)
+        yMax = max(np.nanmax(Y) for x, Y in self.groups)
+        if yMax <= yMin:
+            yMax = yMin + 1.0
+        if xMax <= xMin:
+            xMax = xMin + 1.0
+
+        counts = np.zeros((nx, ny))
+        for x, Y in self.groups:
+            cols, lo, hi = columnRanges(x, Y, xMin, xMax, nx)
+            counts[cols] += columnHistogram(lo, hi, yMin, yMax, ny)
+
+        self.setCounts(counts, (xMin, xMax, yMin, yMax))
+
+    def setCounts(self, counts, extent):
+        """
+        Shows precomputed (nx, ny) trace counts covering extent
+        (xMin, xMax, yMin, yMax), e.g. from stackDensity()
+        """
+        img = np.log1p(counts.T)
+        img[counts.T == 0] = np.nan
+
+        self.remove()
+        self.image = self.ax.imshow(img, extent=extent, origin='lower',
+                                    aspect='auto', interpolation='nearest', cmap=self.cmap)
+        self.ax.set_xlim(extent[0], extent[1])
+        self.ax.set_ylim(extent[2], extent[3])
+
+
+def stackDensity(x, chunks, fmt, nx, ny, f=None):
+    """
+    Computes density counts for every S-parameter of a lot that is only
+    available in blocks, such as a lotstore.lotStore.
+
+    chunks is a callable returning an iterable of (n, n_freq, nports,
+    nports) complex blocks; it is called twice, once to find the value
+    range and once to count.  Returns (counts, extents) where counts is
+    (nports, nports, nx, ny) and extents holds the (xMin, xMax, yMin, yMax)
+    of each S-parameter.  f, the frequency in Hz, is only needed for
+    derived quantities.
+    """
+    f = x if f is None else f
+    yMin = None
+    yMax = None
+    for sChunk in chunks():
+        values = quantityValues(sChunk, f, fmt)
+        chunkMin = np.nanmin(values, axis=(0, 1))
+        chunkMax = np.nanmax(values, axis=(0, 1))
+        yMin = chunkMin if yMin is None else np.minimum(yMin, chunkMin)
+        yMax = chunkMax if yMax is None else np.maximum(yMax, chunkMax)
+
+    if yMin is None:
+        raise ValueError('No data')
+    yMax = np.where(yMax > yMin, yMax, yMin + 1.0)
+
+    nports = yMin.shape[0]
+    xMin = np.min(x)
+    xMax = np.max(x) if np.max(x) > xMin else xMin + 1.0
+    counts = np.zeros((nports, nports, nx, ny))
+
+    for sChunk in chunks():
+        values = quantityValues(sChunk, f, fmt)
+        for row in range(nports):
+            for col in range(nports):
+                cols, lo, hi = columnRanges(x, values[:, :, row, col], xMin, xMax, nx)
+                counts[row, col][cols] += columnHistogram(lo, hi, yMin[row, col], yMax[row, col], ny)
+
+    extents = [[(xMin, xMax, yMin[row, col], yMax[row, col]) for col in range(nports)]
+               for row in range(nports)]
+    return counts, extents
+
+
+def traceDensity(groups, nx, ny):
+    """
+    Same as stackDensity() for (x, Y) groups as returned by lotTraces(),
+    every S-parameter being counted over its own value range
+    """
+    nports = groups[0][1].shape[2]
+    yMin = np.min([np.nanmin(Y, axis=(0, 1)) for x, Y in groups], axis=0)
+    yMax = np.max([np.nanmax(Y, axis=(0, 1)) for x, Y in groups], axis=0)
+    yMax = np.where(yMax > yMin, yMax, yMin + 1.0)
+
+    xMin = min(np.min(x) for x, Y in groups)
+    xMax = max(np.max(x) for x, Y in groups)
+    if xMax <= xMin:
+        xMax = xMin + 1.0
+
+    counts = np.zeros((nports, nports, nx, ny))
+    for x, Y in groups:
+        for row in range(nports):
+            for col in range(nports):
+                cols, lo, hi = columnRanges(x, Y[:, :, row, col], xMin, xMax, nx)
+                counts[row, col][cols] += columnHistogram(lo, hi, yMin[row, col], yMax[row, col], ny)
+
+    extents = [[(xMin, xMax, yMin[row, col], yMax[row, col]) for col in range(nports)]
+               for row in range(nports)]
+    return counts, extents
+
+
+class overviewRenderer(object):
+    """
+    Draws every S-parameter of a lot as a small density tile of one image
+    on a single axes, optionally with a sparkline of the center trace.
+
+    Tile (row, col) covers col..col+1 horizontally and row..row+1
+    vertically in data coordinates, row 0 at the top.  Every tile is scaled
+    to its own value range, so the overview shows the shape of the traces
+    rather than comparable values; tileAt() maps a click to the tile to
+    show in full.
+    """
+    def __init__(self, ax, nports, cmap='Greys', lineColor='#0000ff', pixelsPerBin=2, border=1):
+        self.ax = ax
+        self.nports = nports
+        self.cmap = cmap
+        self.pixelsPerBin = pixelsPerBin
+        self.border = border    # Empty bins around every tile
+        self.groups = []
+        self.counts = None
+        self.extents = None
+        self.center = None
+        self.image = None
+
+        self.sparklines = LineCollection([], colors=lineColor, linewidths=1.0)
+        ax.add_collection(self.sparklines)
+
+        ticks = np.arange(nports) + 0.5
+        ax.set_xticks(ticks)
+        ax.set_xticklabels([str(k+1) for k in range(nports)])
+        ax.set_yticks(ticks)
+        ax.set_yticklabels([str(k+1) for k in range(nports)])
+        ax.tick_params(length=0)
+        ax.set_xlim(0, nports)
+        ax.set_ylim(nports, 0)
+
+    def remove(self):
+        if self.image is not None:
+            self.image.remove()
+            self.image = None
+        self.sparklines.remove()
+
+    @property
+    def nTraces(self):
+        return sum(Y.shape[0] for x, Y in self.groups)
+
+    def setTraces(self, groups):
+        self.groups = list(groups)
+        self.counts = None
+        self.update()
+
+    def update(self):
+        """
+        Recounts the traces if the tile size in pixels changed
+        """
+        if len(self.groups) == 0:
+            return
+
+        bbox = self.ax.get_window_extent()
+        nx = max(int(bbox.width / self.nports / self.pixelsPerBin) - 2*self.border, 4)
+        ny = max(int(bbox.height / self.nports / self.pixelsPerBin) - 2*self.border, 4)
+        if self.counts is not None and self.counts.shape[2:] == (nx, ny):
+            return
+        self.setCounts(*traceDensity(self.groups, nx, ny))
+
+    def setCounts(self, counts, extents):
+        """
+        Shows precomputed (nports, nports, nx, ny) counts with the extent
+        of every tile, e.g. from stackDensity()
+        """
+        self.counts = counts
+        self.extents = extents
+        n, b = self.nports, self.border
+        nx, ny = counts.shape[2:]
+
+        # Log scaled and normalized per tile, empty bins and borders blank
+        img = np.full((n, ny + 2*b, n, nx + 2*b), np.nan)
+        peak = np.log1p(counts.max(axis=(2, 3)))
+        np.maximum(peak, 1e-12, out=peak)
+        tiles = np.log1p(counts) / peak[:, :, None, None]
+        tiles[counts == 0] = np.nan
+        # (row, col, x, y) -> (row, y from the top, col, x)
+        img[:, b:b+ny, :, b:b+nx] = tiles.transpose(0, 3, 1, 2)[:, ::-1]
+
+        if self.image is not None:
+            self.image.remove()
+        self.image = self.ax.imshow(img.reshape(n*(ny + 2*b), n*(nx + 2*b)), extent=(0, n, n, 0),
+                                    aspect='auto', interpolation='nearest', cmap=self.cmap,
+                                    vmin=0, vmax=1, zorder=0)
+        self.ax.set_xlim(0, n)
+        self.ax.set_ylim(n, 0)
+        self.updateSparklines()
+
+    def setCenter(self, x, Y):
+        """
+        Sets the center trace, Y being (n_freq, nports, nports), or None
+        """
+        self.center = None if Y is None else (x, Y)
+        self.updateSparklines()
+
+    def updateSparklines(self):
+        if self.center is None or self.extents is None:
+            self.sparklines.set_segments([])
+            return
+
+        x, Y = self.center
+        n = self.nports
+        nx, ny = self.counts.shape[2:]
+        padX = self.border / (nx + 2*self.border)
+        padY = self.border / (ny + 2*self.border)
+
+        segments = []
+        for row in range(n):
+            for col in range(n):
+                xMin, xMax, yMin, yMax = self.extents[row][col]
+                u = (x - xMin) / (xMax - xMin)
+                v = np.clip((Y[:, row, col] - yMin) / (yMax - yMin), 0, 1)
+                seg = np.empty((len(x), 2))
+                seg[:, 0] = col + padX + (1 - 2*padX) * u
+                seg[:, 1] = row + 1 - padY - (1 - 2*padY) * v
+                segments.append(seg)
+        self.sparklines.set_segments(segments)
+
+    def tileAt(self, x, y):
+        """
+        (row, col) of the tile at data coordinates x, y, None outside
+        """
+        if x is None or y is None:
+            return None
+        row, col = int(np.floor(y)), int(np.floor(x))
+        if 0 <= row < self.nports and 0 <= col < self.nports:
+            return row, col
+        return None
+
+
+smithLimit = 1.1                            # Axis limits of a Smith chart
+_smithBackgrounds = collections.OrderedDict()
+
+
+def smithBackground(width, height, extent=(-smithLimit, smithLimit, -smithLimit, smithLimit),
+                    maxCached=16):
+    """
+    Returns the skrf Smith chart grid covering extent (xMin, xMax, yMin,
+    yMax) as a (height, width, 4) RGBA bitmap with transparent background.
+    Bitmaps are rendered offscreen once and cached by size and extent.
+    """
+    key = (int(width), int(height)) + tuple(np.round(extent, 6))
+    if key in _smithBackgrounds:
+        _smithBackgrounds.move_to_end(key)
+        return _smithBackgrounds[key]
+
+    fig = Figure(figsize=(width / 100.0, height / 100.0), dpi=100)
+    fig.patch.set_alpha(0)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.patch.set_alpha(0)
+    skrf.plotting.smith(ax=ax)
+    ax.set_aspect('auto')
+    ax.set_xlim(extent[0], extent[1])
+    ax.set_ylim(extent[2], extent[3])
+    ax.set_axis_off()
+    canvas.draw()
+
+    _smithBackgrounds[key] = np.array(canvas.buffer_rgba())
+    while len(_smithBackgrounds) > maxCached:
+        _smithBackgrounds.popitem(last=False)
+    return _smithBackgrounds[key]
+
+
+class smithRenderer(object):
+    """
+    Draws all reflection traces of one Smith chart as a single
+    LineCollection.
+
+    Traces are given as (n_traces, n_points, 2) arrays of Gamma-plane
+    coordinates, e.g. lotReflections()[k][:, :, row, col].  With
+    background=True the axes is set up as a Smith chart whose grid is a
+    single cached bitmap from smithBackground(), re-rendered only when the
+    pixel size or the limits of the axes change.  background=False only
+    adds traces on top of an existing chart.
+    """
+    def __init__(self, ax, colors=None, linewidth=None, background=True):
+        self.ax = ax
+        self.traces = []
+        self.colors = colors
+        self.linewidth = linewidth if linewidth is not None else rcParams['lines.linewidth']
+        self.image = None
+        self._key = None
+        self._cid = None
+
+        if background:
+            ax.grid(False)
+            ax.set_xticks([])
+            ax.set_yticks([])
+            ax.set_xlim(-smithLimit, smithLimit)
+            ax.set_ylim(-smithLimit, smithLimit)
+            ax.set_aspect('equal', adjustable='box')
+            for spine in ax.spines.values():
+                spine.set_visible(False)
+            self.image = ax.imshow(np.zeros((1, 1, 4)), extent=ax.get_xlim() + ax.get_ylim(),
+                                   origin='upper', aspect='equal', interpolation='nearest', zorder=0)
+            self._cid = [ax.callbacks.connect(event, self.onLimitsChanged)
+                         for event in ('xlim_changed', 'ylim_changed')]
+
+        self.collection = LineCollection([], linewidths=self.linewidth, zorder=2)
+        ax.add_collection(self.collection, autolim=False)
+        self.update()
+
+    def remove(self):
+        if self._cid is not None:
+            for cid in self._cid:
+                self.ax.callbacks.disconnect(cid)
+            self.image.remove()
+            # Axes.cla() keeps these, so restore them for rectangular plots
+            self.ax.set_aspect('auto')
+            for spine in self.ax.spines.values():
+                spine.set_visible(True)
+        self.collection.remove()
+
+    def setTraces(self, traces):
+        self.traces = []
+        self.addTraces(traces)
+
+    def addTraces(self, traces):
+        self.traces.extend(traces)
+        segments = [seg for gamma in self.traces for seg in gamma]
+        self.collection.set_segments(segments)
+        self.collection.set_color(self.colors if self.colors is not None else traceColors(self.nTraces))
+
+    @property
+    def nTraces(self):
+        return sum(gamma.shape[0] for gamma in self.traces)
+
+    def onLimitsChanged(self, ax):
+        self.update()
+
+    def update(self):
+        """
+        Swaps in the background bitmap matching the current pixel size and
+        limits of the axes
+        """
+        if self.image is None:
+            return
+        self.ax.apply_aspect()      # The box only becomes square when drawn
+        bbox = self.ax.get_window_extent()
+        extent = self.ax.get_xlim() + self.ax.get_ylim()
+        key = (max(int(round(bbox.width)), 1), max(int(round(bbox.height)), 1)) + extent
+        if key == self._key:
+            return
+        self._key = key
+        self.image.set_data(smithBackground(key[0], key[1], extent))
+        self.image.set_extent(extent)
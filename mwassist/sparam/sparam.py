@@ -12,6 +12,7 @@ from PyQt5.QtWidgets import (
     QAction,
     QActionGroup,
     QFileDialog,
+    QInputDialog,
     QMenu,
     QSizePolicy,
     QVBoxLayout,
@@ -31,70 +32,141 @@ import os
 import logging
 import skrf
 
-def calcNetworkStatistics(networks):
-    logger = logging.getLogger()
-    # Determine Overlapping frequency range and minimum step size
-    
-    freqMin = None
-    freqMax = None
-    freqStep = None
-    for net in networks:
-        if freqMin is None:
-            freqMin = net.frequency.start
-        else:
-            if freqMin < net.frequency.start:
-                freqMin = net.frequency.start
-                
-        if freqMax is None:
-            freqMax = net.frequency.stop
-        else:
-            if freqMax > net.frequency.stop:
-                freqMax = net.frequency.stop
+from mwassist.instrument import counter, span, traced
+from mwassist.sparam.cache import touchstoneCache
+from mwassist.sparam.derived import derivedQuantities, isDerived
+from mwassist.sparam.export import exportResults
+from mwassist.sparam.jobs import jobScheduler
+from mwassist.sparam.loader import touchstoneLoader
+from mwassist.sparam.lotstore import lotStore
+from mwassist.sparam.render import (
+    densityRenderer,
+    lotReflections,
+    lotTraces,
+    overviewRenderer,
+    quantityValues,
+    smithRenderer,
+    stackDensity,
+    traceRenderer,
+    traceValues,
+    wrappedBands
+    )
+from mwassist.sparam.stats import (
+    calcNetworkSummary,
+    calcRobustSummary,
+    derivedStatistics,
+    groupedStatistics,
+    parseGroupKey,
+    statisticsAccumulator
+    )
+from mwassist.sparam.touchstone import networkFromArrays, touchstoneExtension, writeNetwork
+from mwassist.sparam.watch import directoryScanner, directoryWatcher
+from mwassist.sparam.workspace import lotNameFromFiles, lotWorkspace
 
-        if freqStep is None:
-            freqStep = net.frequency.step
-        else:
-            if freqStep < net.frequency.step:
-                freqStep = net.frequency.step
-    
-    msg = 'Freq Min: {:g}, Max {:g}, Step {:g}'.format(freqMin, freqMax, freqStep)
-    logger.debug(msg)
-    print(msg)
-    
-    fStats = skrf.Frequency(freqMin, freqMax, (freqMax-freqMin)/freqStep+1, 'Hz')
-    fStats.unit = net.frequency.unit
-    
-    allS = []
-    for net in networks:
-        netTemp = net.interpolate(fStats)
-        allS.append(netTemp.s)
-
-    dataAvg           = skrf.network.Network()
-    dataAvg.frequency = fStats
-    
-    ## Rectangular domain
-    #dataAvg.s         = np.mean(allS, axis=0)
-    # Polar domain
-    dataAvg.s         = np.mean(np.abs(allS),axis=0) * np.exp(1j * np.mean(np.unwrap(np.angle(allS),axis=0),axis=0))
-
-    dataAvg.name      = 'Mean'
-    
-    return dataAvg
+# Functions run by sparamPlot.jobs in pool threads.  They only work on the
+# arguments they are given and never touch the widget.
+
+def loadJob(job, filelist, cache, error):
+    with span('loadData', files=len(filelist)):
+        loader = touchstoneLoader(filelist, cache=cache)
+        job.onCancel(loader.cancel)
+        return loader.run(progress=job.reportProgress, error=error)
+
+def watchJob(job, scanner, cache, error):
+    # Returns the new and modified files and {filename: Network} of those parsed
+    new, changed, nPending = scanner.scan()
+    files = new + changed
+    networks = {}
+    if len(files) > 0:
+        with span('watchLoad', files=len(files)):
+            loader = touchstoneLoader(files, cache=cache)
+            job.onCancel(loader.cancel)
+            for idx, arrays in loader.iterArrays(error=error):
+                networks[files[idx]] = networkFromArrays(arrays)
+    return new, changed, networks, nPending
+
+def statisticsJob(job, data, percentiles, specs, quantities, averaging):
+    return calcNetworkSummary(data, percentiles=percentiles, specs=specs, quantities=quantities,
+                              averaging=averaging)
+
+def robustJob(job, data, proportion, threshold, minFraction, averaging):
+    return calcRobustSummary(data, proportion=proportion, threshold=threshold, minFraction=minFraction,
+                             averaging=averaging)
+
+def derivedStatisticsJob(job, data, fmt, percentiles):
+    return derivedStatistics(data, fmt, percentiles=percentiles)
+
+def groupsJob(job, data, key):
+    return groupedStatistics(data, key)
+
+def groupsCsvJob(job, groups, filename):
+    groups.toCsv(filename)
+    return filename
+
+def lotTracesJob(job, networks, scale, fmt):
+    return lotTraces(networks, scale, fmt)
+
+def storeDensityJob(job, store, scale, fmt, nx, ny):
+    # Stop reading chunks once cancelled, the result is discarded anyway
+    chunks = lambda: (sChunk for start, sChunk in store.chunks() if not job.cancelled)
+    return stackDensity(store.frequency.f / scale, chunks, fmt, nx, ny, f=store.frequency.f)
+
+def storeCellDensityJob(job, store, row, col, scale, fmt, nx, ny):
+    # Only a single S-parameter is converted and counted
+    chunks = lambda: (sChunk[:, :, row:row+1, col:col+1] for start, sChunk in store.chunks() if not job.cancelled)
+    counts, extents = stackDensity(store.frequency.f / scale, chunks, fmt, nx, ny, f=store.frequency.f)
+    return counts[0, 0], extents[0][0]
+
+def lotStatisticsJob(job, lot, percentiles, averaging):
+    return calcNetworkSummary(lot.networks(), percentiles, averaging=averaging)
+
+def saveJob(job, net, filename):
+    return writeNetwork(net, filename)
+
+def exportJob(job, directory, name, summary, groups, names):
+    return exportResults(directory, name, summary=summary, groups=groups, names=names)
+
+class tracedCanvas(FigureCanvas):
+    """
+    Figure canvas recording the time of every full draw
+    """
+    def draw(self):
+        with span('canvas.draw'):
+            super().draw()
 
 class sparamPlot(QWidget):
     def __init__(self):
 
         # Setup Logger        
-        self.logger = logging.getLogger()
+        self.logger = logging.getLogger(__name__)
         self.logger.debug('sparamPlot.__init__()')
 
         super().__init__()
         
         # Set default options
         self.opt = {}
-        self.opt['format']  = 'db'
+        self.opt['format']  = 'db'          # 'db', 'phase', 'smith' or a key of derived.derivedQuantities
         self.opt['avgColor'] = '#0000ff'
         self.opt['avgLinewidth'] = 3.0
+        self.opt['bandColor'] = '#0000ff'
+        self.opt['plotBands'] = True        # Plot statistics as bands instead of individual traces
+        self.opt['percentiles'] = (5, 50, 95)
+        self.opt['center'] = 'mean'         # Center line: 'mean', 'median' or 'trimmed' (needs detectOutliers())
+        self.opt['averaging'] = 'polar'     # Phase averaging of the mean, 'polar' or 'circular'
+        self.opt['trimProportion'] = 0.1    # Fraction dropped at either end by the trimmed mean
+        self.opt['outlierMode'] = 'highlight'   # 'highlight' or 'hide' outliers found by detectOutliers()
+        self.opt['outlierThreshold'] = 3.5  # Robust z-score above which a point is flagged
+        self.opt['outlierFraction'] = 0.05  # Fraction of flagged points making a device an outlier
+        self.opt['outlierColor'] = '#ff0000'
+        self.opt['renderMode'] = 'auto'     # 'collection', 'density', 'skrf' or 'auto'
+        self.opt['densityThreshold'] = 50   # Lot size above which 'auto' switches to density
+        self.opt['collectionMaxTraces'] = 2000  # Lot size above which 'collection' switches to density as well
+        self.opt['layout'] = 'auto'         # 'grid', 'overview' or 'auto'
+        self.opt['overviewThreshold'] = 8   # Port count from which 'auto' shows the overview
+        self.opt['cache'] = True            # Keep parsed files in an on-disk cache
+        self.opt['cacheMaxBytes'] = 2*1024**3
+        self.opt['lotDtype'] = 'complex128' # Storage of workspace lots, 'complex64' halves it
+        self.opt['background'] = True       # Run loading, statistics and trace preparation in worker threads
         self.opt['plot_figure_size'] = (15,9)  # Not sure if this applys sine we're now in a QWidget?
         self.opt['plot_figure_dpi'] = 100
         
@@ -108,6 +180,37 @@ class sparamPlot(QWidget):
         
         self.ax = None
         self.axZoomed = None
+        self.renderers = {}     # Batched trace renderer of each axes
+        self.meanLines = {}     # Mean trace of each axes
+        self.bandArtists = {}   # Statistics bands of each axes
+        self.groupLines = {}    # Group mean traces of each axes
+        self.outlierArtists = {}    # Highlighted outlier traces of each axes
+        self.overlayLines = {}  # Center lines of overlaid lots of each axes
+        self.overview = None    # overviewRenderer if the overview layout is shown
+        self.overviewDetail = None  # (row, col) of the S-parameter shown in full over the overview
+        self.plotMode = None    # Render mode used by the last plotData()
+        self.plotFormat = None  # Format used by the current axes contents
+        self.background = None  # Canvas contents of the last un-zoomed draw
+        self._traceValues = {}  # Plotted trace data of the lot, by format
+        
+        self.data = []
+        self.store = None       # lotstore.lotStore used instead of self.data
+        self.dataAvg = None
+        self.dataStats = None
+        self.specs = []         # List of stats.specMask used for yield
+        self.groupStats = None  # stats.groupedSummary overlaid on the plot
+        self.robustStats = None # stats.robustSummary with median and outliers
+        self.accumulator = None
+        self.cache = None
+        self.jobs = jobScheduler(self)
+        self.watcher = None     # watch.directoryWatcher of the watched directory
+        self.scanner = None     # watch.directoryScanner run by the watch job
+        self.watchedFiles = {}  # Network loaded from each watched file
+        self.watchRescan = False
+        self.workspace = lotWorkspace()
+        self.lotName = None     # Workspace lot being plotted, None if not kept
+        self.loadName = None    # Lot name for the load in progress
+        self.overlays = []      # Workspace lots whose center lines are overlaid
         
 #         FigureCanvas.__init__(self, self.fig)
 #         self.setParent(parent)
@@ -116,7 +219,7 @@ class sparamPlot(QWidget):
 #                                    QSizePolicy.Expanding)
 #         FigureCanvas.updateGeometry(self)
 
-        self.canvas = FigureCanvas(self.fig)
+        self.canvas = tracedCanvas(self.fig)
         self.canvas.setParent(self)
         self.canvas.setSizePolicy( QSizePolicy.Expanding,
                                    QSizePolicy.Expanding)
@@ -125,6 +228,7 @@ class sparamPlot(QWidget):
         self.mpl_toolbar = NavigationToolbar(self.canvas, self)
         self.canvas.mpl_connect('key_press_event', self.on_key_press)
         self.canvas.mpl_connect('button_press_event', self.on_button_press)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
         
         # Now to construct the widget GUI:
         vbox = QVBoxLayout()
@@ -142,65 +246,638 @@ class sparamPlot(QWidget):
         self.logger.debug('you pressed {}'.format(event.button))
         if event.dblclick:
             self.logger.debug('Double click on: {:s}'.format(str(event.inaxes)))
-            self.toggleZoom(event.inaxes)
+            if self.overview is None:
+                self.toggleZoom(event.inaxes)
+            elif self.overviewDetail is not None:
+                if event.inaxes is not None:
+                    self.hideDetail()
+            elif event.inaxes is self.overview.ax:
+                tile = self.overview.tileAt(event.xdata, event.ydata)
+                if tile is not None:
+                    self.showDetail(*tile)
             # we want to allow other navigation modes as well. Only act in case
             # shift was pressed and the correct mouse button was used
             #if event.key != 'shift' or event.button != 1:
             #    return
                 
+    def on_draw(self, event):
+        # Keep a copy of the full figure so un-zooming can just blit it back
+        if self.axZoomed is None and self.overviewDetail is None:
+            self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+
     def toggleZoom(self, ax):
         """
         Toggles the enlargement of a sub-plot to entire figure window.
         
+        Only the zoomed axes is drawn when zooming in, and un-zooming restores
+        the saved full figure unless the zoomed axes was panned or zoomed in
+        the meantime.
+        
         Implementation inspired by:
         https://www.semipol.de/2015/09/04/matplotlib-interactively-zooming-to-a-subplot.html
         """
-        if ax is not None:
+        if ax is None:
+            return
+        
+        with span('toggleZoom', zoomIn=self.axZoomed is None):
             if self.axZoomed is None:
                 # Store pre-zoom information
-                self.axZoomed = (ax, ax.get_position())
+                self.axZoomed = (ax, ax.get_position(), ax.get_xlim(), ax.get_ylim())
                 ax.set_position([0.1, 0.1, 0.85, 0.65])
                 
                 # hide all the other axes...
                 for axTemp in self.fig.axes:
                     if axTemp is not ax:
                         axTemp.set_visible(False)
+                
+                # Re-decimate to the new axes size
+                if ax in self.renderers:
+                    self.renderers[ax].update()
+                
+                self.blitAxes(ax)
                     
             else:
                 # Restore axes position
-                self.axZoomed[0].set_position(self.axZoomed[1])
+                ax, position, xlim, ylim = self.axZoomed
+                ax.set_position(position)
                 self.axZoomed = None
                 
                 # Restore other axes
                 for axTemp in self.fig.axes:
                     axTemp.set_visible(True)
+                
+                if ax in self.renderers:
+                    self.renderers[ax].update()
+                
+                if (self.background is not None
+                    and tuple(ax.get_xlim()) == tuple(xlim)
+                    and tuple(ax.get_ylim()) == tuple(ylim)):
+                    self.canvas.restore_region(self.background)
+                    self.canvas.blit(self.fig.bbox)
+                else:
+                    self.canvas.draw()
             
-            self.canvas.draw()
             self.mpl_toolbar.update()           # Reset navigation history
             self.mpl_toolbar.push_current()     # Push current state into navigation stack
 
-    def loadData(self, filelist):
+    def showDetail(self, row, col, draw=True):
+        """
+        Hides the overview and plots a single S-parameter at full size.
+        
+        The traces of the whole lot are already prepared for the overview.
+        Lot stores only have low resolution tiles, so the density of that
+        S-parameter is counted first.
+        """
+        key = self.detailKey(row, col)
+        if self.store is not None and key not in self._traceValues:
+            scale, unit = self.frequencyScale()
+            nx, ny = self.densityResolution(1)
+            def onResult(values):
+                self._traceValues[key] = values
+                if self.overview is not None and self.overviewDetail is None:
+                    self.showDetail(row, col)
+            self.jobs.submit('detail', storeCellDensityJob, self.store, row, col, scale, self.valueFormat(), nx, ny,
+                             onResult=onResult,
+                             synchronous=not self.opt['background'])
+            return
+        
+        with span('showDetail'):
+            self.overviewDetail = (row, col)
+            self.overview.ax.set_visible(False)
+            self.ax[row][col] = self.fig.add_axes([0.1, 0.1, 0.85, 0.75])
+            self.plotAxesTraces(row, col)
+            self.plotAxesStatistics(row, col)
+            if self.ax[row][col] in self.renderers:
+                self.renderers[self.ax[row][col]].update()
+            
+            if draw:
+                self.blitAxes(self.ax[row][col])
+                self.mpl_toolbar.update()           # Reset navigation history
+                self.mpl_toolbar.push_current()     # Push current state into navigation stack
+
+    def hideDetail(self):
+        """
+        Removes the S-parameter shown by showDetail() and restores the
+        overview
+        """
+        row, col = self.overviewDetail
+        axTemp = self.ax[row][col]
+        for artists in (self.renderers, self.meanLines, self.bandArtists, self.groupLines,
+                        self.outlierArtists, self.overlayLines):
+            artists.pop(axTemp, None)
+        axTemp.remove()
+        self.ax[row][col] = None
+        self.overviewDetail = None
+        self.overview.ax.set_visible(True)
+        
+        if self.background is not None:
+            self.canvas.restore_region(self.background)
+            self.canvas.blit(self.fig.bbox)
+        else:
+            self.canvas.draw()
+        self.mpl_toolbar.update()           # Reset navigation history
+        self.mpl_toolbar.push_current()     # Push current state into navigation stack
+
+    def blitAxes(self, ax):
+        """
+        Draws only the figure background, titles and a single axes, then
+        blits the result instead of redrawing the entire figure.
+        """
+        if self.background is None:
+            self.canvas.draw()
+            return
+        
+        self.fig.draw_artist(self.fig.patch)
+        for text in self.fig.texts:
+            self.fig.draw_artist(text)
+        self.fig.draw_artist(ax)
+        self.canvas.blit(self.fig.bbox)
+
+    def loadData(self, filelist, background=True, name=None):
+        """
+        Loads a list of touchstone files as a new lot of the workspace,
+        named after their directory unless a name is given.
+        
+        With background=True the files are parsed in a worker thread using a
+        process pool and the data is plotted once loading completes.  Otherwise
+        this blocks until self.data is populated (useful from the console).
+        """
         self.logger.info('sparamPlot.loadData()')
         
+        filelist = list(filelist)
+        self.loadName = name if name is not None else lotNameFromFiles(filelist)
+        
+        # Submitting discards any load still in progress
+        self.jobs.submit('load', loadJob, filelist, self.getCache(), self.onLoadError,
+                         onResult=self.onLoadFinished if background else self.setLoadedData,
+                         onProgress=self.onLoadProgress,
+                         synchronous=not background)
+        
+    def loadStore(self, store):
+        """
+        Plots a memory-mapped lot store (a lotstore.lotStore or its path)
+        instead of a list of networks.  The store is never loaded as a
+        whole, so it is always drawn in density mode.
+        """
+        self.logger.info('sparamPlot.loadStore()')
+        
+        if not isinstance(store, lotStore):
+            store = lotStore(store)
+        self.logger.info('Opened {:s}'.format(repr(store)))
+        
+        self.jobs.discard('load')
+        self.setData([], store=store)
+        self.plotData()
+        
+    def setData(self, networks, store=None):
+        """
+        Replaces the loaded data, dropping all results derived from the
+        previous data including jobs still working on it
+        """
+        for key in list(self.jobs.jobs):
+            if key != 'load':
+                self.jobs.discard(key)
+        self.stopWatching()
+        
+        self.store = store
+        self.data = networks
         self.dataAvg = None
+        self.dataStats = None
+        self.groupStats = None
+        self.robustStats = None
+        self.accumulator = None
+        self._traceValues = {}
+        self.lotName = None
         
-        self.data = []
-        for fnameWithPath in filelist:
-            fname = os.path.basename(fnameWithPath)
-            self.logger.info('Loading: ' + fname)
-        
-            spnet = skrf.network.Network()
-            spnet.read_touchstone(fnameWithPath)
-            #spnet.name = fname
-            self.data.append(spnet)
+    def setLoadedData(self, networks):
+        self.setData(networks)
+        self.keepLot(self.loadName)
+        
+    def getCache(self):
+        """
+        Returns the touchstone cache, or None if caching is disabled
+        """
+        if not self.opt['cache']:
+            return None
+        if self.cache is None:
+            try:
+                self.cache = touchstoneCache(maxBytes=self.opt['cacheMaxBytes'])
+            except OSError:
+                self.logger.exception('Unable to create touchstone cache')
+                self.opt['cache'] = False
+        return self.cache
+        
+    def cancelLoad(self):
+        """
+        Cancels a background load.  Files parsed so far are still plotted.
+        """
+        if self.jobs.isRunning('load'):
+            self.logger.info('Cancelling load')
+            self.jobs.cancel('load')
+        
+    def onLoadProgress(self, nDone, nTotal, filename):
+        self.logger.debug('Loaded {:d}/{:d}: {:s}'.format(nDone, nTotal, os.path.basename(filename)))
+        if nDone == nTotal or nDone % max(nTotal // 10, 1) == 0:
+            self.logger.info('Loaded {:d} of {:d} files'.format(nDone, nTotal))
+        
+    def onLoadError(self, filename, message):
+        # Called from the load job's thread, so this must only log
+        self.logger.error('Failed to load {:s}: {:s}'.format(filename, message))
+        
+    def onLoadFinished(self, networks):
+        self.setLoadedData(networks)
+        self.plotData()
+        
+    def addNetwork(self, net, redraw=True):
+        """
+        Appends a single network to the loaded data, see addNetworks()
+        """
+        self.addNetworks([net], redraw=redraw)
+        
+    def addNetworks(self, networks, redraw=True):
+        """
+        Appends networks to the loaded data.
+        
+        If statistics have already been calculated the mean is updated
+        incrementally rather than recomputed over the whole lot, and the
+        full summary (percentiles and bands) is recalculated in the
+        background.  Only the new traces are added to the existing axes.
+        """
+        if self.store is not None:
+            self.logger.warning('Networks cannot be added to a lot store')
+            return
+        if len(networks) == 0:
+            return
+        
+        self.data.extend(networks)
+        lot = self.currentLot()
+        if lot is not None:
+            lot.addNetworks(networks)
+        
+        # Extend the cached trace data of the current format, drop the others
+        nports = self.maxPorts()
+        traceKey = self.traceKey(nports)
+        smithKey = ('smith', nports)
+        matching = [net for net in networks if net.nports == nports]
+        cached = self._traceValues
+        self._traceValues = {}
+        newTraces = None
+        if traceKey in cached:
+            scale, unit = self.frequencyScale()
+            newTraces = lotTraces(matching, scale, self.valueFormat())
+            self._traceValues[traceKey] = cached[traceKey] + newTraces
+        if smithKey in cached:
+            self._traceValues[smithKey] = cached[smithKey] + lotReflections(matching)
+        
+        if self.dataAvg is not None:
+            try:
+                if self.accumulator is None:
+                    self.accumulator = statisticsAccumulator(self.dataAvg.frequency, nports,
+                                                             self.opt['averaging'])
+                    self.accumulator.addNetworks(self.data[:-len(networks)])
+                self.accumulator.addNetworks(networks)
+                self.dataAvg = self.accumulator.mean()
+            except ValueError as e:
+                self.logger.warning('Mean not updated: {:s}'.format(str(e)))
+                self.accumulator = None
+            if self.dataStats is not None:
+                self.calcStatistics()
+        if self.robustStats is not None:
+            self.detectOutliers()
+        
+        if not redraw:
+            return
+        if newTraces is not None and self.canUpdateIncrementally():
+            self.appendTraces(networks, newTraces)
+        else:
+            self.plotData()
+            
+    @traced()
+    def appendTraces(self, networks, newTraces):
+        """
+        Adds the traces of newly appended networks to the existing axes.
+        newTraces are their (x, Y) groups as returned by lotTraces().
+        """
+        self.logger.info('sparamPlot.appendTraces()')
+        nports = len(self.ax)
+        for row in range(nports):
+            for col in range(nports):
+                axTemp = self.ax[row][col]
+                if self.isSmithAxes(row, col):
+                    if axTemp in self.renderers:
+                        gamma = lotReflections([net for net in networks if net.nports == self.maxPorts()])
+                        self.renderers[axTemp].addTraces([g[:, :, row, col] for g in gamma])
+                elif axTemp in self.renderers:
+                    self.renderers[axTemp].addTraces([(x, Y[:, :, row, col]) for x, Y in newTraces])
+                if self.dataAvg is not None:
+                    self.plotAxesStatistics(row, col)
+        
+        self.refreshCanvas()
+            
+    def watchDirectory(self, path=None, loadExisting=True):
+        """
+        Watches a directory for new and modified touchstone files.
+        
+        New files are appended to the lot as they appear and modified files
+        replace their earlier version.  With loadExisting=True a new lot is
+        started from all files already in the directory, otherwise only
+        files written from now on are added to the current lot.  Without a
+        path the user is asked for one.
+        """
+        try:
+            if path is None:
+                path = QFileDialog.getExistingDirectory(self, 'Watch directory')
+                if not path:
+                    return
             
+            if loadExisting or self.store is not None:
+                self.jobs.discard('load')
+                self.setData([])
+                self.keepLot(os.path.basename(os.path.normpath(path)))
+            self.stopWatching()
+            
+            self.logger.info('Watching {:s}'.format(path))
+            self.scanner = directoryScanner(path)
+            if not loadExisting:
+                self.scanner.prime()
+            self.watcher = directoryWatcher(path, self)
+            self.watcher.changed.connect(self.scanDirectory)
+            self.watcher.start()
+            self.scanDirectory()
+        except Exception:
+            self.logger.exception('sparamData.watchDirectory(): Exception occured')
+        
+    def stopWatching(self):
+        if self.watcher is None:
+            return
+        self.logger.info('Stopped watching {:s}'.format(self.watcher.path))
+        self.jobs.discard('watch')
+        self.watcher.stop()
+        self.watcher.deleteLater()
+        self.watcher = None
+        self.scanner = None
+        self.watchedFiles = {}
+        self.watchRescan = False
+        
+    def scanDirectory(self):
+        """
+        Loads the new and modified files of the watched directory in the
+        background.  Only one scan runs at a time; changes noticed meanwhile
+        are picked up by another scan once it is done.
+        """
+        if self.scanner is None:
+            return
+        if self.jobs.isRunning('watch'):
+            self.watchRescan = True
+            return
+        self.jobs.submit('watch', watchJob, self.scanner, self.getCache(), self.onLoadError,
+                         onResult=self.onWatchResult,
+                         synchronous=not self.opt['background'])
+        
+    def onWatchResult(self, result):
+        new, changed, networks, nPending = result
+        
+        added = []
+        replaced = 0
+        for fname in new + changed:
+            net = networks.get(fname)
+            if net is None:
+                continue
+            old = self.watchedFiles.get(fname)
+            self.watchedFiles[fname] = net
+            idx = next((k for k, n in enumerate(self.data) if n is old), None) if old is not None else None
+            if idx is None:
+                added.append(net)
+            else:
+                self.data[idx] = net
+                replaced += 1
+        
+        if replaced > 0:
+            # Running sums cannot drop a network, so start over
+            self.data.extend(added)
+            lot = self.currentLot()
+            if lot is not None:
+                lot.setNetworks(self.data)
+            self._traceValues = {}
+            self.accumulator = None
+            self.dataAvg = None
+            if self.dataStats is not None:
+                self.calcStatistics()
+            self.plotData()
+        elif len(added) > 0:
+            self.addNetworks(added)
+        
+        if replaced > 0 or len(added) > 0:
+            self.logger.info('{:d} new and {:d} modified files, {:d} devices'.format(
+                len(added), replaced, len(self.data)))
+        
+        # Files still being written are picked up by a later scan
+        if self.watcher is not None and (nPending > 0 or self.watchRescan):
+            self.watchRescan = False
+            self.watcher.trigger()
+        
     def calcStatistics(self):
+        """
+        Computes the statistical summary in a worker thread and plots it
+        when done
+        """
         try:
-            self.dataAvg = calcNetworkStatistics(self.data)
+            data = self.store if self.store is not None else list(self.data)
+            quantities = (self.opt['format'],) if isDerived(self.opt['format']) else ()
+            self.jobs.submit('statistics', statisticsJob, data, tuple(self.opt['percentiles']), list(self.specs),
+                             quantities, self.opt['averaging'],
+                             onResult=self.onStatisticsFinished,
+                             synchronous=not self.opt['background'])
+        except Exception:
+            self.logger.exception('sparamData.calcStatistics(): Exception occured')
+        
+    def onStatisticsFinished(self, summary):
+        self.dataStats = summary
+        self.dataAvg = self.dataStats.mean
+        self.cacheLotResults()
+        if self.accumulator is not None and self.accumulator.count != summary.count:
+            self.accumulator = None
+        if self.dataStats.passed is not None:
+            self.logger.info('Yield: {:d}/{:d} ({:.1f}%)'.format(
+                int(np.count_nonzero(self.dataStats.passed)),
+                self.dataStats.count,
+                100*self.dataStats.yieldFraction))
+        self.withTraces(self.updateStatistics, 'statistics')
+        
+    def detectOutliers(self):
+        """
+        Computes median, trimmed mean and outlier flags in a worker thread,
+        then highlights or hides the outliers
+        """
+        try:
+            data = self.store if self.store is not None else list(self.data)
+            self.jobs.submit('robust', robustJob, data, self.opt['trimProportion'],
+                             self.opt['outlierThreshold'], self.opt['outlierFraction'], self.opt['averaging'],
+                             onResult=self.onOutliersFinished,
+                             synchronous=not self.opt['background'])
+        except Exception:
+            self.logger.exception('sparamData.detectOutliers(): Exception occured')
+        
+    def onOutliersFinished(self, robust):
+        self.robustStats = robust
+        self.cacheLotResults()
+        names = self.store.names if self.store is not None else [net.name for net in self.data]
+        indices = robust.outlierIndices
+        self.logger.info('{:d} of {:d} devices are outliers{:s}'.format(
+            len(indices), robust.count,
+            ': ' + ', '.join(str(names[k]) for k in indices[:20]) if len(indices) > 0 else ''))
+        if self.store is not None and self.opt['outlierMode'] == 'hide':
+            self.logger.warning('Outliers of a lot store are highlighted but cannot be hidden from the density plot')
+        self._traceValues = {}
+        self.plotData()
+        
+    def outlierMask(self):
+        """
+        Boolean array marking the outliers among the loaded devices.  Devices
+        added after the outlier detection are not marked.
+        """
+        n = len(self.store) if self.store is not None else len(self.data)
+        mask = np.zeros(n, dtype=bool)
+        if self.robustStats is not None:
+            outliers = self.robustStats.outliers[:n]
+            mask[:len(outliers)] = outliers
+        return mask
+        
+    def hidingOutliers(self):
+        return (self.robustStats is not None and self.store is None
+                and self.opt['outlierMode'] == 'hide')
+        
+    def plottedNetworks(self, nports=None):
+        """
+        The networks drawn as traces: all of them, or those with nports
+        ports, without the outliers if they are hidden
+        """
+        mask = self.outlierMask() if self.hidingOutliers() else None
+        return [net for k, net in enumerate(self.data)
+                if (nports is None or net.nports == nports) and (mask is None or not mask[k])]
+        
+    def outlierNetworks(self):
+        if self.store is not None:
+            return [self.store.network(k) for k in np.flatnonzero(self.outlierMask())]
+        return [net for net, outlier in zip(self.data, self.outlierMask()) if outlier]
+        
+    def centerNetwork(self):
+        """
+        Network drawn as the center line: the polar mean (recomputed
+        without the outliers while they are hidden), median or trimmed mean
+        """
+        robust = self.robustStats
+        if robust is not None and self.opt['center'] == 'median':
+            return robust.median
+        if robust is not None and self.opt['center'] == 'trimmed':
+            return robust.trimmed
+        if self.hidingOutliers() and self.dataAvg is not None:
+            return robust.cleanMean
+        return self.dataAvg
+        
+    def setOutlierMode(self, item):
+        modes = {'Highlight': 'highlight', 'Hide': 'hide'}
+        self.opt['outlierMode'] = modes[item.text()]
+        if self.robustStats is not None:
+            self._traceValues = {}
             self.plotData()
+        
+    def setCenter(self, item):
+        centers = {'Mean': 'mean', 'Median': 'median', 'Trimmed mean': 'trimmed'}
+        self.opt['center'] = centers[item.text()]
+        if self.opt['center'] != 'mean' and self.robustStats is None:
+            self.detectOutliers()
+        else:
+            self.withTraces(self.updateStatistics, 'statistics')
+        
+    def setPlotLayout(self, item):
+        layouts = {'Auto': 'auto', 'Grid': 'grid', 'Overview': 'overview'}
+        self.opt['layout'] = layouts[item.text()]
+        self.overviewDetail = None
+        self.plotData()
+        
+    def setAveraging(self, item):
+        """
+        Switches between polar and circular phase averaging.  Statistics
+        already calculated, also those cached with workspace lots, are
+        recalculated.
+        """
+        modes = {'Polar': 'polar', 'Circular': 'circular'}
+        self.opt['averaging'] = modes[item.text()]
+        self.accumulator = None
+        for lot in self.workspace:
+            lot.results.pop('summary', None)
+            lot.results.pop('robust', None)
+        if self.dataStats is not None:
+            self.calcStatistics()
+        if self.robustStats is not None:
+            self.detectOutliers()
+        for name in self.overlays:
+            if name != self.lotName:
+                self.calcLotStatistics(name)
+        
+    def calcDerivedStatistics(self):
+        """
+        Adds the statistics of the current derived format to the existing
+        summary in a worker thread, unless they are already known
+        """
+        fmt = self.opt['format']
+        if self.dataStats is None or not isDerived(fmt) or fmt in self.dataStats.derived:
+            return
+        
+        summary = self.dataStats
+        def onResult(values):
+            summary.derived[fmt] = values
+            if summary is self.dataStats and self.opt['format'] == fmt:
+                self.withTraces(self.updateStatistics, 'statistics')
+        
+        data = self.store if self.store is not None else list(self.data)
+        self.jobs.submit('derivedStatistics', derivedStatisticsJob, data, fmt, summary.percentiles,
+                         onResult=onResult,
+                         synchronous=not self.opt['background'])
+        
+    def calcGroupedStatistics(self, key=None):
+        """
+        Computes mean and std per group of devices and overlays the group
+        means.  key is passed to stats.groupedStatistics(); if it is a string
+        it is parsed by stats.parseGroupKey().  Without a key the user is
+        asked for one.
+        """
+        try:
+            if key is None:
+                key, ok = QInputDialog.getText(self, 'Grouped statistics',
+                                               'Group by (regex on file name, comment:NAME or attr:NAME):')
+                if not ok or not key:
+                    return
+            if isinstance(key, str):
+                key = parseGroupKey(key)
+            data = self.store if self.store is not None else list(self.data)
+            self.jobs.submit('groups', groupsJob, data, key,
+                             onResult=self.onGroupsFinished,
+                             synchronous=not self.opt['background'])
         except Exception:
-            logging.exception('sparamData.calcStatistics(): Exception occured')
+            self.logger.exception('sparamData.calcGroupedStatistics(): Exception occured')
         
+    def onGroupsFinished(self, groups):
+        self.groupStats = groups
+        self.cacheLotResults()
+        self.logger.info('{:d} groups: {:s}'.format(len(groups), ', '.join(
+            '{}({:d})'.format(k, int(n)) for k, n in zip(groups.keys, groups.counts))))
+        self.withTraces(self.updateStatistics, 'groups')
+        
+    def saveGroupedStatistics(self):
+        try:
+            if self.groupStats is None:
+                self.logger.warning('Grouped statistics not calculated.')
+                return
+            filename = QFileDialog.getSaveFileName(self, 'Save grouped statistics',
+                                                   '', 'CSV Files (*.csv)')
+            if filename[0]:
+                self.jobs.submit('saveGroups', groupsCsvJob, self.groupStats, filename[0],
+                                 onResult=lambda fname: self.logger.info('Saved {:s}'.format(fname)),
+                                 synchronous=not self.opt['background'])
+        except Exception:
+            self.logger.exception('sparamData.saveGroupedStatistics(): Exception occured')
         
     def saveStatistics(self):
         try:
@@ -208,28 +885,380 @@ class sparamPlot(QWidget):
             if self.dataAvg is None:
                 self.logger.warning('Statistics not calculated.')
             else:
-                filename = QFileDialog.getSaveFileName(self, 'Save average', 
-                                                     '','S2P Files (*.S2P)')
-                self.dataAvg.write_touchstone(filename=filename[0])
+                ext = touchstoneExtension(self.dataAvg.nports)
+                filename = QFileDialog.getSaveFileName(self, 'Save average', '',
+                                                       '{:s} Files (*{:s})'.format(ext[1:].upper(), ext))
+                if filename[0]:
+                    self.jobs.submit('save', saveJob, self.dataAvg, filename[0],
+                                     onResult=lambda fname: self.logger.info('Saved {:s}'.format(fname)),
+                                     synchronous=not self.opt['background'])
         except Exception:
-            logging.exception('sparamData.saveStatistics(): Exception occured')
+            self.logger.exception('sparamData.saveStatistics(): Exception occured')
         
 
+    def exportStatistics(self):
+        """
+        Writes the mean, percentiles and group means as touchstone files
+        plus an .npz bundle of all statistics in the background
+        """
+        try:
+            if self.dataStats is None and self.groupStats is None:
+                self.logger.warning('Statistics not calculated.')
+                return
+            filename = QFileDialog.getSaveFileName(self, 'Export statistics (file name prefix)', 'lot', '')
+            if not filename[0]:
+                return
+            directory, name = os.path.split(filename[0])
+            names = self.store.names if self.store is not None else [net.name for net in self.data]
+            self.jobs.submit('export', exportJob, directory, os.path.splitext(name)[0],
+                             self.dataStats, self.groupStats, names,
+                             onResult=lambda written: self.logger.info('Exported {:d} files to {:s}'.format(
+                                 len(written), directory)),
+                             synchronous=not self.opt['background'])
+        except Exception:
+            self.logger.exception('sparamData.exportStatistics(): Exception occured')
+
+    def currentLot(self):
+        """
+        The workspace lot being plotted, None if it was not kept
+        """
+        return self.workspace.lots.get(self.lotName) if self.lotName is not None else None
+        
+    def keepLot(self, name=None):
+        """
+        Adds the plotted networks to the workspace as a lot so they stay
+        available after another lot is opened.  Results already calculated
+        are kept with the lot.  Without a name the user is asked for one.
+        Returns the name of the lot.
+        """
+        try:
+            if self.store is not None:
+                self.logger.warning('Lot stores cannot be kept in the workspace')
+                return None
+            if name is None:
+                name, ok = QInputDialog.getText(self, 'Keep lot', 'Lot name:', text=self.lotName or 'Lot')
+                if not ok or not name:
+                    return None
+            lot = self.workspace.addLot(name, self.data, dtype=self.opt['lotDtype'])
+            self.lotName = lot.name
+            self.cacheLotResults()
+            self.logger.info('Kept {:s}'.format(repr(lot)))
+            return lot.name
+        except Exception:
+            self.logger.exception('sparamData.keepLot(): Exception occured')
+        
+    def cacheLotResults(self):
+        """
+        Stores the statistics of the plotted lot with its workspace lot
+        """
+        lot = self.currentLot()
+        if lot is None:
+            return
+        for key, value in (('summary', self.dataStats), ('robust', self.robustStats),
+                           ('groups', self.groupStats)):
+            if value is not None:
+                lot.results[key] = value
+        
+    def openLot(self, name):
+        """
+        Plots a lot of the workspace.  Statistics cached with the lot are
+        restored instead of being recalculated.
+        """
+        try:
+            lot = self.workspace[name]
+            self.jobs.discard('load')
+            self.setData(lot.networks())
+            self.lotName = name
+            
+            self.dataStats = lot.results.get('summary')
+            self.dataAvg = self.dataStats.mean if self.dataStats is not None else None
+            self.robustStats = lot.results.get('robust')
+            self.groupStats = lot.results.get('groups')
+            
+            self.logger.info('Opened {:s}'.format(repr(lot)))
+            self.plotData()
+            self.calcDerivedStatistics()
+        except Exception:
+            self.logger.exception('sparamData.openLot(): Exception occured')
+        
+    def removeLot(self, name):
+        """
+        Drops a lot from the workspace.  If it is plotted it stays on
+        screen until another lot is opened.
+        """
+        self.workspace.removeLot(name)
+        if name == self.lotName:
+            self.lotName = None
+        if name in self.overlays:
+            self.setOverlays([overlay for overlay in self.overlays if overlay != name])
+        
+    def setOverlays(self, names):
+        """
+        Overlays the center lines of other workspace lots.  Lots without
+        cached statistics have them calculated once in the background.
+        """
+        self.overlays = [name for name in names if name in self.workspace]
+        for name in self.overlays:
+            if name != self.lotName and 'summary' not in self.workspace[name].results:
+                self.calcLotStatistics(name)
+        if self.ax is not None:
+            self.withTraces(self.updateStatistics, 'statistics')
+        
+    def calcLotStatistics(self, name):
+        """
+        Calculates the statistics of a workspace lot that is not plotted
+        """
+        lot = self.workspace[name]
+        version = lot.version
+        def onResult(summary):
+            # Dropped if the lot changed or was removed in the meantime
+            if self.workspace.lots.get(name) is lot and lot.version == version:
+                lot.results['summary'] = summary
+                if name in self.overlays and self.ax is not None:
+                    self.withTraces(self.updateStatistics, 'statistics')
+        
+        self.jobs.submit(('lotStatistics', name), lotStatisticsJob, lot, tuple(self.opt['percentiles']),
+                         self.opt['averaging'],
+                         onResult=onResult,
+                         synchronous=not self.opt['background'])
+        
+    def overlaySummaries(self):
+        """
+        (name, summary) of every overlaid lot whose statistics are known
+        """
+        result = []
+        for name in self.overlays:
+            lot = self.workspace.lots.get(name)
+            if name != self.lotName and lot is not None and 'summary' in lot.results:
+                result.append((name, lot.results['summary']))
+        return result
+        
+    def maxPorts(self):
+        """
+        Maximum port count of the loaded data
+        """
+        if self.store is not None:
+            return self.store.nports
+        
+        nports = 0
+        for net in self.data:
+            nports = max(nports, net.nports)
+        return nports
+
+    def resolveRenderMode(self):
+        if self.store is not None:
+            return 'density'
+        
+        mode = self.opt['renderMode']
+        if mode == 'auto' or (mode == 'skrf' and isDerived(self.opt['format'])):
+            mode = 'density' if len(self.data) > self.opt['densityThreshold'] else 'collection'
+        # A collection's drawing cost grows with the number of traces
+        if mode == 'collection' and len(self.data) > self.opt['collectionMaxTraces']:
+            mode = 'density'
+        return mode
+
+    def resolveLayout(self):
+        """
+        'grid' of one axes per S-parameter, or 'overview' of one tile per
+        S-parameter on a single axes for high port counts
+        """
+        nports = self.gridSize()
+        layout = self.opt['layout']
+        if nports < 2:
+            return 'grid'
+        if layout == 'auto':
+            return 'overview' if nports >= self.opt['overviewThreshold'] else 'grid'
+        return layout
+
+    def isSmithAxes(self, row, col, fmt=None):
+        if fmt is None:
+            fmt = self.opt['format']
+        return fmt == 'smith' and row == col
+
+    def bandsEnabled(self):
+        return self.dataStats is not None and self.opt['plotBands']
+
+    def frequencyScale(self):
+        """
+        All traces are scaled to the frequency unit of the first network
+        """
+        if self.store is not None:
+            freqRef = self.store.frequency
+        elif len(self.data) > 0:
+            freqRef = self.data[0].frequency
+        else:
+            freqRef = self.dataAvg.frequency
+        return freqRef.multiplier, freqRef.unit
+
+    def valueFormat(self):
+        """
+        Quantity plotted on rectangular axes: 'db', 'phase' or a derived
+        quantity
+        """
+        fmt = self.opt['format']
+        return fmt if fmt == 'phase' or isDerived(fmt) else 'db'
+
+    def isDeviceFormat(self, fmt=None):
+        """
+        True for derived quantities of the whole device such as K, which
+        are plotted on a single axes
+        """
+        if fmt is None:
+            fmt = self.opt['format']
+        return isDerived(fmt) and not derivedQuantities[fmt].perElement
+
+    def gridSize(self):
+        """
+        Rows (and columns) of the grid of axes
+        """
+        nports = self.maxPorts()
+        return 1 if nports > 0 and self.isDeviceFormat() else nports
+
+    def axesTitle(self, row, col):
+        if self.isDeviceFormat():
+            return derivedQuantities[self.opt['format']].label
+        return 'S{:d}{:d}'.format(row+1,col+1)
+
+    def axesLabel(self):
+        fmt = self.valueFormat()
+        if fmt == 'phase':
+            return 'Phase (deg)'
+        if isDerived(fmt):
+            return derivedQuantities[fmt].axisLabel
+        return 'Magnitude (dB)'
+
+    def traceKey(self, nports):
+        if self.store is not None:
+            return ('store', self.valueFormat())
+        return (self.valueFormat(), nports)
+
+    def detailKey(self, row, col):
+        return ('detail',) + self.traceKey(self.maxPorts()) + (row, col)
+
+    def densityResolution(self, nports):
+        """
+        Density bins of a single subplot, two pixels per bin
+        """
+        nx = max(int(self.fig.bbox.width / nports / 2), 16)
+        ny = max(int(self.fig.bbox.height / nports / 2), 16)
+        return nx, ny
+
+    def lotTraceValues(self, nports):
+        """
+        Returns the plotted quantity of the whole lot as a list of (x, Y)
+        groups, Y being (n_networks, n_freq, nports, nports).  Results are
+        cached per format until the data changes.
+        """
+        key = self.traceKey(nports)
+        if key not in self._traceValues:
+            scale, unit = self.frequencyScale()
+            self._traceValues[key] = lotTraces(self.plottedNetworks(nports),
+                                               scale, self.valueFormat())
+        return self._traceValues[key]
+
+    def lotReflectionValues(self, nports):
+        """
+        Returns the Gamma-plane coordinates of the whole lot as returned by
+        lotReflections(), cached until the data changes
+        """
+        key = ('smith', nports)
+        if key not in self._traceValues:
+            self._traceValues[key] = lotReflections(self.plottedNetworks(nports))
+        return self._traceValues[key]
+
+    def storeDensity(self):
+        """
+        Density counts of every S-parameter of self.store, computed in a
+        single chunked pass over the store and cached per format
+        """
+        key = self.traceKey(self.store.nports)
+        if key not in self._traceValues:
+            scale, unit = self.frequencyScale()
+            nx, ny = self.densityResolution(self.gridSize())
+            self._traceValues[key] = storeDensityJob(None, self.store, scale, self.valueFormat(), nx, ny)
+        return self._traceValues[key]
+
+    def withTraces(self, callback, purpose):
+        """
+        Calls callback in the GUI thread once the trace data of the current
+        format is available, preparing it in a worker thread if it is not
+        cached yet.  Requests of the same purpose replace each other, so a
+        burst of format changes only redraws once.
+        """
+        key = ('traces', purpose)
+        nports = self.maxPorts()
+        traceKey = self.traceKey(nports)
+        # The overview always draws the traces, also in place of skrf or bands
+        if (nports < 1 or traceKey in self._traceValues
+                or (self.resolveLayout() == 'grid'
+                    and (self.resolveRenderMode() == 'skrf' or self.bandsEnabled()))):
+            self.jobs.discard(key)
+            callback()
+            return
+        
+        scale, unit = self.frequencyScale()
+        if self.store is not None:
+            nx, ny = self.densityResolution(self.gridSize())
+            args = (storeDensityJob, self.store, scale, self.valueFormat(), nx, ny)
+        else:
+            args = (lotTracesJob, self.plottedNetworks(nports), scale, self.valueFormat())
+        
+        def onResult(values):
+            self._traceValues[traceKey] = values
+            callback()
+        self.jobs.submit(key, *args, onResult=onResult, synchronous=not self.opt['background'])
+
+    def fillRenderer(self, row, col, renderer):
+        """
+        Hands the lot's traces for one S-parameter to a batched renderer
+        """
+        if self.store is not None and self.overview is not None:
+            renderer.setCounts(*self._traceValues[self.detailKey(row, col)])
+        elif self.store is not None:
+            counts, extents = self.storeDensity()
+            renderer.setCounts(counts[row, col], extents[row][col])
+        else:
+            renderer.setTraces([(x, Y[:, :, row, col]) for x, Y in self.lotTraceValues(self.maxPorts())])
+
     def plotData(self):
-        self.logger.info('sparamPlot.plotData()')
+        """
+        Rebuilds the entire figure once the trace data is ready.  Format
+        changes and newly calculated statistics are handled incrementally by
+        updateFormat() and updateStatistics() where possible.
+        """
+        self.withTraces(self.drawFigure, 'plot')
+
+    @traced('plotData')
+    def drawFigure(self):
+        """
+        Rebuilds the entire figure from the prepared trace data
+        """
+        self.logger.info('sparamPlot.drawFigure()')
         
         self.fig.clf()
         self.ax = None
         self.axZoomed = None
+        self.overview = None
+        self.background = None
+        self.renderers = {}
+        self.meanLines = {}
+        self.bandArtists = {}
+        self.groupLines = {}
+        self.outlierArtists = {}
+        self.overlayLines = {}
         
         # Determine maximum port count
-        nports = 0
-        for net in self.data:
-            nports = max(nports, net.nports)
+        nports = self.maxPorts()
             
         if (nports < 1):
             self.logger.warning('Maximum port count less than 1')
             return
+        nports = self.gridSize()
+        
+        if self.resolveLayout() == 'overview':
+            self.drawOverview(nports)
+            return
+        self.overviewDetail = None
 
         # Create the plot axes and store handles
         self.ax = [[None for k1 in range(nports)] for k2 in range(nports)]
@@ -245,60 +1274,430 @@ class sparamPlot(QWidget):
 
                 #if self.opt['plot_phase']:
                 #        self.axb[row][col] = axTemp.twinx()
-                
-        def plotSmatrix(net, color=None, linewidth=None):
+        
+        self.plotMode = self.resolveRenderMode()
+        self.plotFormat = self.opt['format']
+        
+        # Do the plotting:
+        if self.plotMode == 'skrf':
+            bands = self.bandsEnabled()
+            for net in self.plottedNetworks():
+                # Smith charts still show the individual traces when plotting bands
+                self.plotSmatrix(net, nports, smithOnly=bands)
+            try:
+                self.plotSmatrix(self.dataAvg, nports,
+                                 color=self.opt['avgColor'],
+                                 linewidth=self.opt['avgLinewidth'])
+            except AttributeError:
+                pass
+            if bands:
+                for row in range(nports):
+                    for col in range(nports):
+                        self.plotAxesBands(row, col, self.ax[row][col].lines[-1].get_xdata())
             for row in range(nports):
                 for col in range(nports):
-                    axTemp = self.ax[row][col]
-
-                    self.logger.debug('Adding subplot')
-                    axTemp.grid(True)
-                
-                    axTemp.set_title('S{:d}{:d}'.format(row+1,col+1))
-                    
-                    # Now determine plot type:
-                    if   self.opt['format'] == 'db':
-                        net.plot_s_db(row,col, ax=axTemp, show_legend=False, color=color, linewidth=linewidth)
-                    elif self.opt['format'] == 'phase':
-                        net.plot_s_deg(row,col, ax=axTemp, show_legend=False, color=color, linewidth=linewidth)
-                    elif self.opt['format'] == 'smith':
-                        if row == col:
-                            net.plot_s_smith(row,col, ax=axTemp, show_legend=False, color=color, linewidth=linewidth)
-                        else:
-                            net.plot_s_db(row,col, ax=axTemp, show_legend=False, color=color, linewidth=linewidth)
-                    else:
-                        self.logger.warning('Unknown plot format {:s}'.format(self.opt['format']))
-                    
-                    
-        # Do the plotting:
-        for net in self.data:
-            plotSmatrix(net)
-        try:
-            plotSmatrix(self.dataAvg, 
-                        color=self.opt['avgColor'],
-                        linewidth=self.opt['avgLinewidth'])
-        except AttributeError:
-            pass
-            
+                    self.plotAxesOverlays(row, col)
+        else:
+            for row in range(nports):
+                for col in range(nports):
+                    self.plotAxesTraces(row, col)
+                    self.plotAxesStatistics(row, col)
         
         # Tidy up the layout                             
-        plotCaption = 'Caption'
         self.fig.tight_layout()
+        self.finishFigure()
+
+    def finishFigure(self):
+        """
+        Adds the caption and draws the figure once the axes are laid out
+        """
+        plotCaption = self.lotName if self.lotName is not None else 'Caption'
         self.fig.subplots_adjust(top = 0.9)
         st = self.fig.suptitle(plotCaption, fontsize='x-large')
         st.set_y(0.96)
         
+        # Layout changed the axes sizes, so re-decimate
+        for renderer in self.renderers.values():
+            renderer.update()
+        
         self.canvas.draw()
+        self.countArtists()
+        self.mpl_toolbar.update()           # Reset navigation history
+        self.mpl_toolbar.push_current()     # Push current state into navigation stack
+
+    def drawOverview(self, nports):
+        """
+        Draws the lot as one density tile per S-parameter on a single axes,
+        with a sparkline of the center line.  A double click on a tile
+        shows that S-parameter in full (showDetail()).
+        """
+        self.ax = [[None for k1 in range(nports)] for k2 in range(nports)]
+        mode = self.resolveRenderMode()
+        self.plotMode = 'collection' if mode == 'skrf' else mode
+        self.plotFormat = self.opt['format']
+        
+        axTemp = self.fig.add_subplot(1, 1, 1)
+        renderer = overviewRenderer(axTemp, nports, lineColor=self.opt['avgColor'])
+        if self.store is not None:
+            renderer.setCounts(*self.storeDensity())
+        else:
+            renderer.setTraces(self.lotTraceValues(self.maxPorts()))
+        
+        center = self.centerNetwork()
+        if center is not None:
+            scale, unit = self.frequencyScale()
+            renderer.setCenter(center.frequency.f / scale,
+                               quantityValues(center.s, center.frequency.f, self.valueFormat()))
+        
+        axTemp.set_title('{:s}, each S-parameter scaled to its own range'.format(self.axesLabel()))
+        axTemp.set_xlabel('Column (port j of Sij)')
+        axTemp.set_ylabel('Row (port i of Sij)')
+        self.overview = renderer
+        self.renderers[axTemp] = renderer
+        
+        self.fig.subplots_adjust(left=0.08, right=0.97, bottom=0.08)
+        if self.overviewDetail is not None:
+            row, col = self.overviewDetail
+            self.overviewDetail = None
+            if max(row, col) < nports:
+                self.showDetail(row, col, draw=False)
+        self.finishFigure()
+
+    def countArtists(self):
+        """
+        Records the number of devices, artists and rendered traces of the
+        current figure with the instrumentation
+        """
+        artists = 0
+        for axTemp in self.fig.axes:
+            artists += (len(axTemp.lines) + len(axTemp.collections)
+                        + len(axTemp.images) + len(axTemp.patches))
+        traces = sum(renderer.nTraces for renderer in self.renderers.values())
+        counter('plot', devices=len(self.store) if self.store is not None else len(self.data),
+                artists=artists, traces=traces)
+
+    def plotSmatrix(self, net, nports, color=None, linewidth=None, smithOnly=False):
+        """
+        Plots a single network using the skrf plotting functions
+        """
+        self.logger.debug('Plotting {:s}'.format(str(net.name)))
+        for row in range(nports):
+            for col in range(nports):
+                if smithOnly and not self.isSmithAxes(row, col):
+                    continue
+                
+                axTemp = self.ax[row][col]
+
+                axTemp.grid(True)
+            
+                axTemp.set_title('S{:d}{:d}'.format(row+1,col+1))
+                
+                # Now determine plot type:
+                if   self.opt['format'] == 'db':
+                    net.plot_s_db(row,col, ax=axTemp, show_legend=False, color=color, linewidth=linewidth)
+                elif self.opt['format'] == 'phase':
+                    net.plot_s_deg(row,col, ax=axTemp, show_legend=False, color=color, linewidth=linewidth)
+                elif self.opt['format'] == 'smith':
+                    if row == col:
+                        net.plot_s_smith(row,col, ax=axTemp, show_legend=False, color=color, linewidth=linewidth)
+                    else:
+                        net.plot_s_db(row,col, ax=axTemp, show_legend=False, color=color, linewidth=linewidth)
+                else:
+                    self.logger.warning('Unknown plot format {:s}'.format(self.opt['format']))
+
+    def plotAxesTraces(self, row, col):
+        """
+        Draws the traces of the whole lot on a single axes.  Rectangular
+        plots use one batched renderer, Smith charts a cached background and
+        one collection of all reflection traces.
+        """
+        axTemp = self.ax[row][col]
+        axTemp.grid(True)
+        axTemp.set_title(self.axesTitle(row, col))
+        
+        if self.isSmithAxes(row, col):
+            renderer = smithRenderer(axTemp)
+            # Lot stores are too large for individual Smith chart traces
+            if self.store is None:
+                renderer.setTraces([g[:, :, row, col] for g in self.lotReflectionValues(self.maxPorts())])
+            self.renderers[axTemp] = renderer
+            return
+        
+        scale, unit = self.frequencyScale()
+        axTemp.set_xlabel('Frequency ({:s})'.format(unit))
+        axTemp.set_ylabel(self.axesLabel())
+        
+        if self.bandsEnabled():
+            return
+        
+        if self.plotMode == 'density':
+            renderer = densityRenderer(axTemp)
+        else:
+            renderer = traceRenderer(axTemp)
+        self.fillRenderer(row, col, renderer)
+        self.renderers[axTemp] = renderer
+
+    def plotAxesStatistics(self, row, col):
+        """
+        (Re)draws the mean trace, statistics bands and highlighted outliers
+        of a single axes
+        """
+        axTemp = self.ax[row][col]
+        
+        for artist in ([self.meanLines.pop(axTemp, None)] + self.bandArtists.pop(axTemp, [])
+                       + self.groupLines.pop(axTemp, []) + self.outlierArtists.pop(axTemp, [])
+                       + self.overlayLines.pop(axTemp, [])):
+            if artist is not None:
+                artist.remove()
+        
+        if self.robustStats is not None and self.opt['outlierMode'] == 'highlight':
+            self.plotAxesOutliers(row, col)
+        
+        if self.groupStats is not None:
+            self.plotAxesGroups(row, col)
+        
+        self.plotAxesOverlays(row, col)
+        
+        center = self.centerNetwork()
+        if center is None:
+            return
+        
+        if self.isSmithAxes(row, col):
+            s = center.s[:, row, col]
+            self.meanLines[axTemp], = axTemp.plot(s.real, s.imag,
+                                                  color=self.opt['avgColor'],
+                                                  linewidth=self.opt['avgLinewidth'])
+            return
+        
+        scale, unit = self.frequencyScale()
+        x = center.frequency.f / scale
+        if isDerived(self.valueFormat()):
+            y = quantityValues(center.s, center.frequency.f, self.valueFormat())[:, row, col]
+        else:
+            y = traceValues(center.s[:, row, col], self.valueFormat())
+        self.meanLines[axTemp], = axTemp.plot(x, y,
+                                              color=self.opt['avgColor'],
+                                              linewidth=self.opt['avgLinewidth'])
+        
+        if self.bandsEnabled():
+            self.plotAxesBands(row, col, x)
+
+    def plotAxesOutliers(self, row, col):
+        """
+        Draws the traces of the outliers on top of the lot
+        """
+        axTemp = self.ax[row][col]
+        key = ('outliers',) + self.traceKey(self.maxPorts())
+        if key not in self._traceValues:
+            networks = self.outlierNetworks()
+            scale, unit = self.frequencyScale()
+            self._traceValues[key] = (networks, lotTraces(networks, scale, self.valueFormat()))
+        networks, groups = self._traceValues[key]
+        if len(networks) == 0:
+            return
+        
+        if self.isSmithAxes(row, col):
+            renderer = smithRenderer(axTemp, colors=[self.opt['outlierColor']], background=False)
+            renderer.setTraces([g[:, :, row, col] for g in lotReflections(networks)])
+            self.outlierArtists[axTemp] = [renderer]
+            return
+        
+        renderer = traceRenderer(axTemp, colors=[self.opt['outlierColor']])
+        renderer.addTraces([(x, Y[:, :, row, col]) for x, Y in groups])
+        self.outlierArtists[axTemp] = [renderer]
+
+    def plotAxesGroups(self, row, col):
+        """
+        Draws the mean of every group of self.groupStats, with a legend on
+        the first axes
+        """
+        axTemp = self.ax[row][col]
+        groups = self.groupStats
+        if groups.mean.shape[2] <= max(row, col):
+            return
+        
+        scale, unit = self.frequencyScale()
+        x = groups.frequency.f / scale
+        values = quantityValues(groups.mean, groups.frequency.f, self.valueFormat())
+        lines = []
+        for g in range(len(groups)):
+            s = groups.mean[g, :, row, col]
+            label = '{} ({:d})'.format(groups.keys[g], int(groups.counts[g]))
+            if self.isSmithAxes(row, col):
+                line, = axTemp.plot(s.real, s.imag, color='C{:d}'.format(g % 10), linewidth=1.5, label=label)
+            else:
+                line, = axTemp.plot(x, values[g, :, row, col],
+                                    color='C{:d}'.format(g % 10), linewidth=1.5, label=label)
+            lines.append(line)
+        
+        if row == 0 and col == 0 and len(lines) <= 20:
+            lines.append(axTemp.legend(handles=lines, fontsize='small'))
+        self.groupLines[axTemp] = lines
+
+    def plotAxesOverlays(self, row, col):
+        """
+        Draws the mean of every overlaid workspace lot from its cached
+        statistics, with a legend on the first axes
+        """
+        axTemp = self.ax[row][col]
+        scale, unit = self.frequencyScale()
+        lines = []
+        for k, (name, summary) in enumerate(self.overlaySummaries()):
+            mean = summary.mean
+            if mean.nports <= max(row, col):
+                continue
+            color = 'C{:d}'.format((k+1) % 10)
+            if self.isSmithAxes(row, col):
+                s = mean.s[:, row, col]
+                line, = axTemp.plot(s.real, s.imag, color=color, linewidth=1.5, label=name)
+            else:
+                try:
+                    y = quantityValues(mean.s, mean.frequency.f, self.valueFormat())[:, row, col]
+                except ValueError:
+                    continue    # Device quantity of a lot that is not a two-port
+                line, = axTemp.plot(mean.frequency.f / scale, y, color=color, linewidth=1.5, label=name)
+            lines.append(line)
+        
+        # The group means own the legend if there are any
+        if row == 0 and col == 0 and len(lines) > 0 and self.groupStats is None:
+            lines.append(axTemp.legend(handles=lines, fontsize='small'))
+        self.overlayLines[axTemp] = lines
+
+    def plotAxesBands(self, row, col, x):
+        """
+        Shades min/max and outer percentile bands underneath the mean trace
+        """
+        axTemp = self.ax[row][col]
+        stats = self.dataStats
+        
+        if self.opt['format'] == 'phase':
+            values = stats.phase
+        elif self.isSmithAxes(row, col):
+            return
+        elif isDerived(self.opt['format']):
+            values = stats.derived.get(self.opt['format'])
+            if values is None:
+                return
+        else:
+            values = stats.db
+        
+        pLo = min(stats.percentiles, default=None)
+        pHi = max(stats.percentiles, default=None)
+        bands = [('min', 'max', 0.15)]
+        if pLo is not None and pHi > pLo:
+            bands.append((stats.percentileKey(pLo), stats.percentileKey(pHi), 0.3))
+        
+        artists = []
+        for keyLo, keyHi, alpha in bands:
+            lo = values[keyLo][:,row,col]
+            hi = values[keyHi][:,row,col]
+            # Phase traces are wrapped to +-180, so the bands are too
+            pieces = wrappedBands(lo, hi) if self.opt['format'] == 'phase' else [(lo, hi)]
+            for pieceLo, pieceHi in pieces:
+                artists.append(axTemp.fill_between(x, pieceLo, pieceHi, color=self.opt['bandColor'],
+                                                   alpha=alpha, linewidth=0, zorder=1))
+        self.bandArtists[axTemp] = artists
+
+    def canUpdateIncrementally(self):
+        """
+        True if the existing axes can be reused instead of calling plotData()
+        """
+        return (self.ax is not None
+                and self.overview is None
+                and self.plotMode != 'skrf'
+                and self.plotMode == self.resolveRenderMode()
+                and len(self.ax) == self.gridSize())
+
+    def refreshCanvas(self):
+        self.canvas.draw_idle()
         self.mpl_toolbar.update()           # Reset navigation history
         self.mpl_toolbar.push_current()     # Push current state into navigation stack
+
+    @traced()
+    def updateStatistics(self):
+        """
+        Adds the mean trace and bands to the existing axes.  The individual
+        traces are only removed (bands) or redrawn (statistics cleared) where
+        needed.
+        """
+        if not self.canUpdateIncrementally():
+            self.plotData()
+            return
+        
+        self.logger.info('sparamPlot.updateStatistics()')
+        bands = self.bandsEnabled()
+        nports = len(self.ax)
+        for row in range(nports):
+            for col in range(nports):
+                axTemp = self.ax[row][col]
+                if not self.isSmithAxes(row, col):
+                    if bands and axTemp in self.renderers:
+                        self.renderers.pop(axTemp).remove()
+                    elif not bands and axTemp not in self.renderers:
+                        self.plotAxesTraces(row, col)
+                self.plotAxesStatistics(row, col)
         
+        self.refreshCanvas()
+
+    @traced()
+    def updateFormat(self):
+        """
+        Switches the plot format on the existing axes.  Rectangular axes
+        keep their artists and only have their data swapped.  Axes switching
+        to or from a Smith chart are cleared and redrawn.
+        """
+        if not self.canUpdateIncrementally():
+            self.plotData()
+            return
+        
+        self.logger.info('sparamPlot.updateFormat()')
+        oldFormat = self.plotFormat
+        self.plotFormat = self.opt['format']
+        
+        scale, unit = self.frequencyScale()
+        nports = len(self.ax)
+        for row in range(nports):
+            for col in range(nports):
+                axTemp = self.ax[row][col]
+                wasSmith = self.isSmithAxes(row, col, oldFormat)
+                isSmith = self.isSmithAxes(row, col)
+                
+                if wasSmith and isSmith:
+                    continue
+                
+                if wasSmith or isSmith:
+                    renderer = self.renderers.pop(axTemp, None)
+                    if renderer is not None:
+                        renderer.remove()
+                    self.meanLines.pop(axTemp, None)
+                    self.bandArtists.pop(axTemp, None)
+                    self.groupLines.pop(axTemp, None)
+                    self.outlierArtists.pop(axTemp, None)
+                    self.overlayLines.pop(axTemp, None)
+                    axTemp.cla()
+                    self.plotAxesTraces(row, col)
+                    self.plotAxesStatistics(row, col)
+                    continue
+                
+                axTemp.set_title(self.axesTitle(row, col))
+                axTemp.set_ylabel(self.axesLabel())
+                self.plotAxesStatistics(row, col)
+                axTemp.relim()
+                if axTemp in self.renderers:
+                    self.fillRenderer(row, col, self.renderers[axTemp])
+                else:
+                    axTemp.autoscale_view()
+        
+        self.refreshCanvas()
+
     def menuOptionsCreate(self):
         # Create options Menu
         self.menuOptions = QMenu('Options', self)
 
         # Create Format subMenu
         menuFormat = self.menuOptions.addMenu('&Format')
-        ag = QActionGroup(self, exclusive=True)
+        ag = QActionGroup(self)
+        ag.setExclusive(True)
         a = ag.addAction(QAction('dB', self, checkable=True))
         if self.opt['format'] == 'db':
             a.setChecked(True)
@@ -311,44 +1710,167 @@ class sparamPlot(QWidget):
         if self.opt['format'] == 'smith':
             a.setChecked(True)
         menuFormat.addAction(a)
+        menuFormat.addSeparator()
+        for key, quantity in derivedQuantities.items():
+            a = ag.addAction(QAction(quantity.label, self, checkable=True))
+            if self.opt['format'] == key:
+                a.setChecked(True)
+            menuFormat.addAction(a)
         menuFormat.triggered[QAction].connect(self.setFormat)
         
+        menuLayout = self.menuOptions.addMenu('&Layout')
+        ag = QActionGroup(self)
+        ag.setExclusive(True)
+        for label, layout in (('Auto', 'auto'), ('Grid', 'grid'), ('Overview', 'overview')):
+            a = ag.addAction(QAction(label, self, checkable=True))
+            a.setChecked(self.opt['layout'] == layout)
+            menuLayout.addAction(a)
+        menuLayout.triggered[QAction].connect(self.setPlotLayout)
+        
         # Create statistics subMenu
         menuStatistics = self.menuOptions.addMenu('&Statistics')
         menuStatisticsCalc = menuStatistics.addAction('&Calculate')
         menuStatisticsCalc.triggered.connect(self.calcStatistics)
         menuStatisticsSave = menuStatistics.addAction('&Save')
         menuStatisticsSave.triggered.connect(self.saveStatistics)
+        menuStatisticsExport = menuStatistics.addAction('E&xport...')
+        menuStatisticsExport.triggered.connect(self.exportStatistics)
+        menuStatisticsGroups = menuStatistics.addAction('Calculate &grouped...')
+        menuStatisticsGroups.triggered.connect(lambda checked: self.calcGroupedStatistics())
+        menuStatisticsGroupsSave = menuStatistics.addAction('Save g&rouped...')
+        menuStatisticsGroupsSave.triggered.connect(self.saveGroupedStatistics)
+        menuStatisticsOutliers = menuStatistics.addAction('Detect &outliers')
+        menuStatisticsOutliers.triggered.connect(self.detectOutliers)
+        
+        menuOutliers = menuStatistics.addMenu('Outlier &display')
+        ag = QActionGroup(self)
+        ag.setExclusive(True)
+        for label, mode in (('Highlight', 'highlight'), ('Hide', 'hide')):
+            a = ag.addAction(QAction(label, self, checkable=True))
+            a.setChecked(self.opt['outlierMode'] == mode)
+            menuOutliers.addAction(a)
+        menuOutliers.triggered[QAction].connect(self.setOutlierMode)
+        
+        menuCenter = menuStatistics.addMenu('Center &line')
+        ag = QActionGroup(self)
+        ag.setExclusive(True)
+        for label, center in (('Mean', 'mean'), ('Median', 'median'), ('Trimmed mean', 'trimmed')):
+            a = ag.addAction(QAction(label, self, checkable=True))
+            a.setChecked(self.opt['center'] == center)
+            menuCenter.addAction(a)
+        menuCenter.triggered[QAction].connect(self.setCenter)
+        
+        menuAveraging = menuStatistics.addMenu('&Averaging')
+        ag = QActionGroup(self)
+        ag.setExclusive(True)
+        for label, mode in (('Polar', 'polar'), ('Circular', 'circular')):
+            a = ag.addAction(QAction(label, self, checkable=True))
+            a.setChecked(self.opt['averaging'] == mode)
+            menuAveraging.addAction(a)
+        menuAveraging.triggered[QAction].connect(self.setAveraging)
+        
+        menuLots = self.menuOptions.addMenu('L&ots')
+        menuLotsKeep = menuLots.addAction('&Keep current lot...')
+        menuLotsKeep.triggered.connect(lambda checked: self.keepLot())
+        self.menuLotsOpen = menuLots.addMenu('&Open')
+        self.menuLotsOpen.aboutToShow.connect(self.menuLotsUpdate)
+        self.menuLotsOpen.triggered[QAction].connect(lambda item: self.openLot(item.data()))
+        self.menuLotsOverlay = menuLots.addMenu('O&verlay')
+        self.menuLotsOverlay.aboutToShow.connect(self.menuLotsUpdate)
+        self.menuLotsOverlay.triggered[QAction].connect(self.toggleOverlay)
+        self.menuLotsRemove = menuLots.addMenu('&Remove')
+        self.menuLotsRemove.aboutToShow.connect(self.menuLotsUpdate)
+        self.menuLotsRemove.triggered[QAction].connect(lambda item: self.removeLot(item.data()))
+        menuLots.addSeparator()
+        a = QAction('&Compact storage (complex64)', self, checkable=True)
+        menuLots.addAction(a)
+        a.setChecked(self.opt['lotDtype'] == 'complex64')
+        a.toggled.connect(lambda checked: self.opt.update(lotDtype='complex64' if checked else 'complex128'))
+        
+        menuWatch = self.menuOptions.addAction('&Watch directory...')
+        menuWatch.triggered.connect(lambda checked: self.watchDirectory())
+        menuWatchStop = self.menuOptions.addAction('S&top watching')
+        menuWatchStop.triggered.connect(self.stopWatching)
+        
+        menuCancel = self.menuOptions.addAction('Cancel &load')
+        menuCancel.triggered.connect(self.cancelLoad)
 
         return self.menuOptions
 
+    def menuLotsUpdate(self):
+        """
+        Fills the lot submenus with the lots of the workspace.  The lot name
+        is kept as action data since the text may contain '&'.
+        """
+        for menu in (self.menuLotsOpen, self.menuLotsOverlay, self.menuLotsRemove):
+            menu.clear()
+            for name in self.workspace.names:
+                a = menu.addAction(name.replace('&', '&&'))
+                a.setData(name)
+                if menu is self.menuLotsOpen:
+                    a.setCheckable(True)
+                    a.setChecked(name == self.lotName)
+                elif menu is self.menuLotsOverlay:
+                    a.setCheckable(True)
+                    a.setChecked(name in self.overlays)
+                    a.setEnabled(name != self.lotName)
+            if len(self.workspace) == 0:
+                menu.addAction('(none)').setEnabled(False)
+        
+    def toggleOverlay(self, item):
+        name = item.data()
+        if name in self.overlays:
+            self.setOverlays([overlay for overlay in self.overlays if overlay != name])
+        else:
+            self.setOverlays(self.overlays + [name])
+        
+    def formatLabel(self):
+        """
+        Format menu text of the current format
+        """
+        fmt = self.opt['format']
+        if isDerived(fmt):
+            return derivedQuantities[fmt].label
+        return {'db': 'dB', 'phase': 'Phase', 'smith': 'Smith'}.get(fmt)
+
     def setFormat(self, item):
         try:
             message = item.text() +" is triggered"
-            logging.debug(message)
+            self.logger.debug(message)
             
             if   item.text() == 'dB':
-                self.opt['format'] = 'db'
+                fmt = 'db'
             elif item.text() == 'Phase':
-                self.opt['format'] = 'phase'
+                fmt = 'phase'
             elif item.text() == 'Smith':
-                self.opt['format'] = 'smith'
-                
-            self.plotData()
+                fmt = 'smith'
+            else:
+                fmt = next(key for key, quantity in derivedQuantities.items() if quantity.label == item.text())
+            
+            if self.isDeviceFormat(fmt) and self.maxPorts() not in (0, 2):
+                self.logger.warning('{:s} is only defined for two-port networks'.format(item.text()))
+                for action in item.actionGroup().actions():
+                    if action.text() == self.formatLabel():
+                        action.setChecked(True)
+                return
+            
+            self.opt['format'] = fmt
+            self.withTraces(self.updateFormat, 'format')
+            self.calcDerivedStatistics()
             
         except Exception as e:
-            logging.exception('sparamData.menuHandler(): Exception!')
+            self.logger.exception('sparamData.menuHandler(): Exception!')
         
     def menuHandler(self, item):
         try:
             message = item.text() +" is triggered"
-            logging.debug(message)
+            self.logger.debug(message)
             print(message)
             
-            logging.debug('Selected {:s}'.format(item.text()))
+            self.logger.debug('Selected {:s}'.format(item.text()))
             if item.text() == 'Test1':
-                logging.debug('Selected Test1')
+                self.logger.debug('Selected Test1')
             
         except Exception as e:
-            logging.exception('sparamData.menuHandler(): Exception!')
+            self.logger.exception('sparamData.menuHandler(): Exception!')
         
\ No newline at end of file
@@ -0,0 +1,964 @@
+'''
+Statistics over lots of S-parameter networks
+
+All networks are interpolated onto a common frequency grid and stacked into a
+single (n_networks, n_freq, nports, nports) complex array which the
+statistics are then computed on.
+
+Means are taken in the polar domain, with the phase either unwrapped across
+the lot ('polar' averaging, polarMean()) or averaged as a circular quantity
+('circular', circularStatistics()).
+
+@author: khershberger
+'''
+
+import logging
+import re
+import warnings
+
+import numpy as np
+import skrf
+
+from mwassist.instrument import span
+from mwassist.sparam.derived import derivedValues
+
+
+def commonFrequency(networks):
+    """
+    Determines the overlapping frequency range of all networks.  The step
+    size used is the largest (coarsest) step of any network.
+    """
+    logger = logging.getLogger(__name__)
+
+    if len(networks) < 1:
+        raise ValueError('No networks given')
+
+    freqMin  = max(net.frequency.start for net in networks)
+    freqMax  = min(net.frequency.stop for net in networks)
+    freqStep = max(net.frequency.step for net in networks)
+
+    msg = 'Freq Min: {:g}, Max {:g}, Step {:g}'.format(freqMin, freqMax, freqStep)
+    logger.debug(msg)
+
+    if freqMax < freqMin:
+        raise ValueError('Networks have no overlapping frequency range')
+
+    npoints = 1 if freqStep == 0 else int(round((freqMax-freqMin)/freqStep)) + 1
+
+    fStats = skrf.Frequency(freqMin, freqMax, npoints, 'Hz')
+    fStats.unit = networks[-1].frequency.unit
+
+    return fStats
+
+
+def interpolationWeights(fSource, fTarget):
+    """
+    Returns the (index, weight) pair for linear interpolation from the
+    fSource grid onto fTarget, so that
+
+        s[idx]*(1-weight) + s[idx+1]*weight
+
+    gives the interpolated value.  Points outside fSource are clamped.
+    """
+    if len(fSource) < 2:
+        return np.zeros(len(fTarget), dtype=int), np.zeros(len(fTarget))
+
+    idx = np.searchsorted(fSource, fTarget, side='right') - 1
+    np.clip(idx, 0, len(fSource)-2, out=idx)
+
+    weight = (fTarget - fSource[idx]) / (fSource[idx+1] - fSource[idx])
+    np.clip(weight, 0.0, 1.0, out=weight)
+
+    return idx, weight
+
+
+def stackNetworks(networks, frequency, out=None, dtype=complex):
+    """
+    Interpolates all networks onto frequency and writes them into a single
+    (n_networks, n_freq, nports, nports) array.
+
+    The interpolation weights are computed once per distinct frequency grid
+    and shared between all networks measured on that grid.  If out is given
+    it is filled in place, otherwise a new array of the given dtype is
+    allocated.
+    """
+    f = frequency.f
+    nports = networks[0].nports
+    shape = (len(networks), len(f), nports, nports)
+
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape:
+        raise ValueError('Output array has shape {:s}, expected {:s}'.format(str(out.shape), str(shape)))
+
+    weightCache = {}
+    for k, net in enumerate(networks):
+        if net.nports != nports:
+            raise ValueError('Network {:s} has {:d} ports, expected {:d}'.format(str(net.name), net.nports, nports))
+
+        fNet = net.frequency.f
+        if len(fNet) == len(f) and np.array_equal(fNet, f):
+            out[k] = net.s
+            continue
+
+        key = fNet.tobytes()
+        if key not in weightCache:
+            idx, weight = interpolationWeights(fNet, f)
+            weightCache[key] = (idx, idx+1, weight[:, None, None])
+        idxLo, idxHi, weight = weightCache[key]
+
+        s = net.s
+        out[k]  = s[idxLo]
+        out[k] += (s[idxHi] - s[idxLo]) * weight
+
+    return out
+
+
+def polarMean(allS):
+    """
+    Mean of a stacked S-parameter array taken in the polar domain.
+
+    Magnitudes are averaged directly, phases are unwrapped along the network
+    axis (as np.unwrap(np.angle(allS), axis=0) would) and then averaged.
+    The stack is walked one network at a time using a handful of
+    (n_freq, nports, nports) work buffers so no full-size temporaries are
+    created.
+    """
+    n = allS.shape[0]
+    shape = allS.shape[1:]
+
+    magSum    = np.zeros(shape)
+    phaseSum  = np.zeros(shape)
+    phaseUnwr = np.empty(shape)
+    phasePrev = np.empty(shape)
+    phase     = np.empty(shape)
+    work      = np.empty(shape)
+
+    for k in range(n):
+        s = allS[k]
+        np.abs(s, out=work)
+        magSum += work
+
+        np.arctan2(s.imag, s.real, out=phase)
+        if k == 0:
+            phaseUnwr[...] = phase
+        else:
+            # Wrap the phase step into [-pi, pi) and accumulate it
+            np.subtract(phase, phasePrev, out=work)
+            work += np.pi
+            np.mod(work, 2*np.pi, out=work)
+            work -= np.pi
+            phaseUnwr += work
+        phaseSum += phaseUnwr
+
+        phase, phasePrev = phasePrev, phase
+
+    magSum   /= n
+    phaseSum /= n
+
+    return magSum * np.exp(1j * phaseSum)
+
+
+averagingModes = ('polar', 'circular')
+
+
+def circularStatistics(allS, maxBytes=64*1024**2):
+    """
+    Circular mean and variance of a stacked S-parameter array.
+
+    Magnitudes are averaged directly and phases through the mean resultant
+    vector R = mean(s/|s|): the mean phase is angle(R) and the circular
+    variance 1 - |R| (0 if all phases agree, 1 if they cancel out).  Unlike
+    polarMean() the result does not depend on the order of the networks and
+    stays correct for phases spread over more than pi.
+
+    The stack is processed in frequency chunks so that the temporaries stay
+    within about maxBytes; allS may be memory-mapped.  Returns (mean,
+    variance) of shape (n_freq, nports, nports).
+    """
+    shape = allS.shape[1:]
+    magMean = np.empty(shape)
+    resultant = np.empty(shape, dtype=complex)
+
+    # The chunk, its magnitude and its unit phasors are held at once
+    for sl in frequencySlices(allS, maxBytes // 3):
+        s = np.asarray(allS[:, sl])
+        mag = np.abs(s)
+        magMean[sl] = np.mean(mag, axis=0, dtype=float)
+        # Zero magnitudes give zero phasors and do not pull the phase
+        np.maximum(mag, np.finfo(mag.dtype).tiny, out=mag)
+        resultant[sl] = np.mean(s / mag, axis=0, dtype=complex)
+
+    length = np.abs(resultant)
+    return magMean * np.exp(1j*np.angle(resultant)), 1 - length
+
+
+def stackMean(allS, averaging='polar', maxBytes=64*1024**2):
+    """
+    Mean of a stack with the given averaging mode, see averagingModes
+    """
+    if averaging == 'circular':
+        return circularStatistics(allS, maxBytes)[0]
+    if averaging != 'polar':
+        raise ValueError('Unknown averaging mode {:s}'.format(str(averaging)))
+    return polarMean(allS)
+
+
+def lotStack(networks):
+    """
+    Returns (frequency, allS) for either a list of Networks, which are
+    interpolated onto their common frequency range, or a lotstore.lotStore,
+    whose memory-mapped array is used as is.
+    """
+    if isinstance(networks, (list, tuple)):
+        fStats = commonFrequency(networks)
+        return fStats, stackNetworks(networks, fStats)
+    else:
+        return networks.frequency, networks.s
+
+
+def calcNetworkStatistics(networks, averaging='polar', maxBytes=64*1024**2):
+    with span('calcNetworkStatistics', averaging=averaging) as sp:
+        fStats, allS = lotStack(networks)
+        sp.set(devices=allS.shape[0], points=allS.shape[1])
+
+        dataAvg           = skrf.network.Network()
+        dataAvg.frequency = fStats
+
+        ## Rectangular domain
+        #dataAvg.s         = np.mean(allS, axis=0)
+        # Polar domain
+        dataAvg.s         = stackMean(allS, averaging, maxBytes)
+
+    dataAvg.name      = 'Mean'
+
+    return dataAvg
+
+
+class specMask(object):
+    """
+    Pass/fail limit on the dB magnitude of one S-parameter over a frequency
+    range.  Ports are numbered from 1, so specMask(2, 1, ...) applies to S21.
+    Either limit may be None.
+    """
+    def __init__(self, row, col, fStart, fStop, lower=None, upper=None):
+        self.row = row
+        self.col = col
+        self.fStart = fStart
+        self.fStop = fStop
+        self.lower = lower
+        self.upper = upper
+
+    def __repr__(self):
+        return 'specMask(S{:d}{:d}, {:g}-{:g} Hz, lower={}, upper={})'.format(
+            self.row, self.col, self.fStart, self.fStop, self.lower, self.upper)
+
+    def check(self, f, db):
+        """
+        Returns a boolean array with one entry per network which is True
+        where the network is within the limits over the whole range.
+        """
+        fMask = (f >= self.fStart) & (f <= self.fStop)
+        values = db[:, fMask, self.row-1, self.col-1]
+
+        passed = np.ones(db.shape[0], dtype=bool)
+        if self.lower is not None:
+            passed &= np.all(values >= self.lower, axis=1)
+        if self.upper is not None:
+            passed &= np.all(values <= self.upper, axis=1)
+        return passed
+
+
+class statisticsSummary(object):
+    """
+    Results of summarizeStack() / calcNetworkSummary().
+
+    db and phase are dictionaries of (n_freq, nports, nports) arrays keyed
+    by 'std', 'min', 'max' and 'p<N>' for each requested percentile.  db
+    also holds 'mean', the mean of the dB values.  Phases are in degrees,
+    measured around the phase of the mean; with circular averaging phase
+    also holds the circular variance 'circvar' (between 0 and 1).  passed
+    holds one pass/fail entry per network (None if no specs were given).
+    derived holds the statistics of derived quantities keyed by format,
+    e.g. derived['groupdelay']['p95'], see derivedStatistics().
+    """
+    def __init__(self, frequency, count, percentiles, averaging='polar'):
+        self.frequency = frequency
+        self.count = count
+        self.percentiles = tuple(percentiles)
+        self.averaging = averaging
+        self.mean = None
+        self.db = {}
+        self.phase = {}
+        self.specs = []
+        self.passed = None
+        self.derived = {}
+
+    @property
+    def yieldFraction(self):
+        if self.passed is None or len(self.passed) == 0:
+            return None
+        return np.count_nonzero(self.passed) / len(self.passed)
+
+    @staticmethod
+    def percentileKey(p):
+        return 'p{:g}'.format(p)
+
+    def network(self, key):
+        """
+        Returns the given statistic as a Network, e.g. network('p95') or
+        network('max').  The magnitude is taken from db[key] and the phase
+        from phase[key].
+        """
+        net           = skrf.network.Network()
+        net.frequency = self.frequency
+        net.s         = 10**(self.db[key]/20) * np.exp(1j * np.radians(self.phase[key]))
+        net.name      = key.capitalize()
+        return net
+
+
+def percentileStatistics(x, percentiles):
+    """
+    Computes min, max and the given percentiles of x along axis 0 with a
+    single partitioning pass.  Returns a dictionary keyed like
+    statisticsSummary.db.
+    """
+    q = [0.0] + list(percentiles) + [100.0]
+    values = np.percentile(x, q, axis=0)
+
+    result = {'min': values[0], 'max': values[-1]}
+    for p, v in zip(percentiles, values[1:-1]):
+        result[statisticsSummary.percentileKey(p)] = v
+    return result
+
+
+def summarizeStack(allS, frequency, percentiles=(5, 50, 95), specs=None, averaging='polar'):
+    """
+    Computes the full statistical summary of a stacked S-parameter array
+    """
+    summary = statisticsSummary(frequency, allS.shape[0], percentiles, averaging)
+
+    circularVariance = None
+    if averaging == 'circular':
+        sMean, circularVariance = circularStatistics(allS)
+    else:
+        sMean = stackMean(allS, averaging)
+
+    summary.mean           = skrf.network.Network()
+    summary.mean.frequency = frequency
+    summary.mean.s         = sMean
+    summary.mean.name      = 'Mean'
+
+    # Magnitude statistics in dB
+    db = np.abs(allS)
+    np.maximum(db, np.finfo(float).tiny, out=db)
+    np.log10(db, out=db)
+    db *= 20
+
+    summary.db = percentileStatistics(db, percentiles)
+    summary.db['mean'] = np.mean(db, axis=0)
+    summary.db['std'] = np.std(db, axis=0)
+
+    # Specs are checked against dB magnitude before db is reused below
+    summary.specs = list(specs) if specs is not None else []
+    if len(summary.specs) > 0:
+        summary.passed = np.ones(allS.shape[0], dtype=bool)
+        for spec in summary.specs:
+            summary.passed &= spec.check(frequency.f, db)
+
+    # Phase statistics as deviation around the mean phase
+    phaseMean = np.angle(sMean)
+    phase = db
+    np.arctan2(allS.imag, allS.real, out=phase)
+    phase -= phaseMean
+    phase += np.pi
+    np.mod(phase, 2*np.pi, out=phase)
+    phase -= np.pi
+    np.degrees(phase, out=phase)
+
+    summary.phase = percentileStatistics(phase, percentiles)
+    summary.phase['std'] = np.std(phase, axis=0)
+    phaseMeanDeg = np.degrees(phaseMean)
+    for key in summary.phase:
+        if key != 'std':
+            summary.phase[key] += phaseMeanDeg
+    summary.phase['mean'] = phaseMeanDeg
+    if circularVariance is not None:
+        summary.phase['circvar'] = circularVariance
+
+    return summary
+
+
+def frequencySlices(allS, maxBytes):
+    """
+    Splits the frequency axis of a stack into slices holding at most
+    maxBytes of S-parameter data each
+    """
+    nFreq = allS.shape[1]
+    bytesPerFreq = allS.shape[0] * allS.shape[2] * allS.shape[3] * allS.itemsize
+    step = max(int(maxBytes // max(bytesPerFreq, 1)), 1)
+    for f0 in range(0, nFreq, step):
+        yield slice(f0, min(f0+step, nFreq))
+
+
+def summarizeStackChunked(allS, frequency, percentiles=(5, 50, 95), specs=None, maxBytes=256*1024**2,
+                          averaging='polar'):
+    """
+    Same as summarizeStack() but processes the stack in frequency chunks of
+    at most maxBytes, so allS may be a memory-mapped array much larger than
+    the available memory.  All statistics are independent between
+    frequencies, so the result is identical.
+    """
+    if allS.nbytes <= maxBytes:
+        return summarizeStack(np.asarray(allS), frequency, percentiles=percentiles, specs=specs,
+                              averaging=averaging)
+
+    parts = []
+    for sl in frequencySlices(allS, maxBytes):
+        fChunk = skrf.Frequency.from_f(frequency.f[sl], unit='hz')
+        fChunk.unit = frequency.unit
+        parts.append(summarizeStack(np.asarray(allS[:, sl]), fChunk, percentiles=percentiles, specs=specs,
+                                    averaging=averaging))
+
+    summary = statisticsSummary(frequency, allS.shape[0], percentiles, averaging)
+    summary.specs = parts[0].specs
+
+    summary.mean           = skrf.network.Network()
+    summary.mean.frequency = frequency
+    summary.mean.s         = np.concatenate([part.mean.s for part in parts])
+    summary.mean.name      = 'Mean'
+
+    for key in parts[0].db:
+        summary.db[key] = np.concatenate([part.db[key] for part in parts])
+    for key in parts[0].phase:
+        summary.phase[key] = np.concatenate([part.phase[key] for part in parts])
+
+    if parts[0].passed is not None:
+        summary.passed = np.logical_and.reduce([part.passed for part in parts])
+
+    return summary
+
+
+def nanStatistics(x, percentiles):
+    """
+    Mean, std, min, max and percentiles of x along axis 0 ignoring NaN, as
+    a dictionary keyed like statisticsSummary.db
+    """
+    q = [0.0] + list(percentiles) + [100.0]
+    with warnings.catch_warnings():
+        # Frequencies where every value is NaN stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        values = np.nanpercentile(x, q, axis=0)
+        result = {'min': values[0], 'max': values[-1],
+                  'mean': np.nanmean(x, axis=0), 'std': np.nanstd(x, axis=0)}
+    for p, v in zip(percentiles, values[1:-1]):
+        result[statisticsSummary.percentileKey(p)] = v
+    return result
+
+
+def summarizeDerived(allS, frequency, fmt, percentiles=(5, 50, 95), maxBytes=256*1024**2):
+    """
+    Statistics of the derived quantity fmt (a key of
+    derived.derivedQuantities) over a stack, processed in frequency chunks
+    of at most maxBytes
+    """
+    f = frequency.f
+    nFreq = allS.shape[1]
+    parts = []
+    for sl in frequencySlices(allS, maxBytes):
+        # One extra point either side keeps derivatives along frequency exact
+        lo = max(sl.start - 1, 0)
+        hi = min(sl.stop + 1, nFreq)
+        values = derivedValues(np.asarray(allS[:, lo:hi]), f[lo:hi], fmt)
+        parts.append(nanStatistics(values[:, sl.start-lo:sl.stop-lo], percentiles))
+
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def derivedStatistics(networks, fmt, percentiles=(5, 50, 95), maxBytes=256*1024**2):
+    """
+    Returns the statistics of a derived quantity of a list of Networks or a
+    lotstore.lotStore, e.g. to add to an existing statisticsSummary.derived
+    """
+    with span('derivedStatistics', quantity=fmt) as sp:
+        fStats, allS = lotStack(networks)
+        sp.set(devices=allS.shape[0], points=allS.shape[1])
+        return summarizeDerived(allS, fStats, fmt, percentiles=percentiles, maxBytes=maxBytes)
+
+
+def calcNetworkSummary(networks, percentiles=(5, 50, 95), specs=None, maxBytes=256*1024**2, quantities=(),
+                       averaging='polar'):
+    """
+    Returns a statisticsSummary of a list of Networks (interpolated onto
+    their common frequency range) or of a lotstore.lotStore.  The
+    statistics of the derived quantities listed in quantities (keys of
+    derived.derivedQuantities) are computed from the same stack.
+    averaging is one of averagingModes.
+    """
+    with span('calcNetworkStatistics', averaging=averaging) as sp:
+        fStats, allS = lotStack(networks)
+        sp.set(devices=allS.shape[0], points=allS.shape[1])
+        summary = summarizeStackChunked(allS, fStats, percentiles=percentiles, specs=specs, maxBytes=maxBytes,
+                                        averaging=averaging)
+        for fmt in quantities:
+            summary.derived[fmt] = summarizeDerived(allS, fStats, fmt, percentiles=percentiles, maxBytes=maxBytes)
+        return summary
+
+
+def partitionMedian(x):
+    """
+    Median along axis 0 using a partial sort (np.partition) instead of a
+    full sort
+    """
+    n = x.shape[0]
+    lo = (n - 1) // 2
+    hi = n // 2
+    part = np.partition(x, [lo, hi] if hi != lo else lo, axis=0)
+    if hi == lo:
+        return part[lo]
+    return 0.5 * (part[lo] + part[hi])
+
+
+def trimmedMean(x, proportion=0.1):
+    """
+    Mean along axis 0 after dropping the proportion of smallest and of
+    largest values.  Only the two cut points are partitioned, the values in
+    between are not sorted.
+    """
+    n = x.shape[0]
+    k = int(proportion * n)
+    if k == 0 or n - 2*k < 1:
+        return np.mean(x, axis=0)
+    part = np.partition(x, [k, n-k-1], axis=0)
+    return np.mean(part[k:n-k], axis=0)
+
+
+def robustScores(x, floor, method='mad'):
+    """
+    Absolute z-scores of x along axis 0.  'mad' uses the median and the
+    median absolute deviation scaled to match the std of normal data,
+    'zscore' the mean and std.  The spread is limited to floor so that
+    identical measurements do not produce infinite scores.
+    """
+    if method == 'zscore':
+        center = np.mean(x, axis=0)
+        spread = np.std(x, axis=0)
+    elif method == 'mad':
+        center = partitionMedian(x)
+        spread = partitionMedian(np.abs(x - center)) / 0.6745
+    else:
+        raise ValueError('Unknown outlier method {:s}'.format(method))
+    return np.abs(x - center) / np.maximum(spread, floor)
+
+
+class robustSummary(object):
+    """
+    Results of calcRobustSummary().
+
+    median, trimmed and cleanMean are Networks: the median and trimmed mean
+    of magnitude and of phase around the polar mean, and the polar mean of
+    the devices not flagged as outliers.
+
+    A point (frequency and S-parameter) of a device is flagged if its
+    z-score exceeds threshold.  flagged holds the number of devices flagged
+    at each (n_freq, nports, nports) point, fractions the fraction of
+    flagged points of each device and scores its largest z-score.  A
+    device is an outlier if more than minFraction of its points are
+    flagged; with thousands of points per device a few points beyond any
+    threshold are expected even for good devices.
+    """
+    def __init__(self, frequency, count, proportion, threshold, minFraction, method):
+        self.frequency = frequency
+        self.count = count
+        self.proportion = proportion
+        self.threshold = threshold
+        self.minFraction = minFraction
+        self.method = method
+        self.median = None
+        self.trimmed = None
+        self.cleanMean = None
+        self.scores = None
+        self.fractions = None
+        self.outliers = None
+        self.flagged = None
+
+    @property
+    def outlierIndices(self):
+        return np.flatnonzero(self.outliers)
+
+
+def summarizeRobust(allS, frequency, proportion=0.1, threshold=3.5, minFraction=0.05, method='mad',
+                    dbFloor=0.01, phaseFloor=0.1, maxBytes=64*1024**2, averaging='polar'):
+    """
+    Computes a robustSummary of a stack in frequency chunks of at most
+    maxBytes.  Scores are taken on the dB magnitude and on the phase (in
+    degrees) around the mean (see stackMean()); dbFloor and phaseFloor are
+    the least spread assumed for either.
+    """
+    n = allS.shape[0]
+    shape = allS.shape[1:]
+    summary = robustSummary(frequency, n, proportion, threshold, minFraction, method)
+
+    median = np.empty(shape, dtype=complex)
+    trimmed = np.empty(shape, dtype=complex)
+    summary.scores = np.zeros(n)
+    summary.flagged = np.zeros(shape, dtype=int)
+    nFlagged = np.zeros(n, dtype=int)
+
+    slices = list(frequencySlices(allS, maxBytes))
+    for sl in slices:
+        sChunk = np.asarray(allS[:, sl])
+        phaseMean = np.angle(stackMean(sChunk, averaging, maxBytes))
+
+        mag = np.abs(sChunk)
+        phase = np.angle(sChunk) - phaseMean
+        phase += np.pi
+        np.mod(phase, 2*np.pi, out=phase)
+        phase -= np.pi
+
+        median[sl] = partitionMedian(mag) * np.exp(1j*(phaseMean + partitionMedian(phase)))
+        trimmed[sl] = trimmedMean(mag, proportion) * np.exp(1j*(phaseMean + trimmedMean(phase, proportion)))
+
+        np.maximum(mag, np.finfo(float).tiny, out=mag)
+        db = 20*np.log10(mag)
+        z = robustScores(db, dbFloor, method)
+        np.maximum(z, robustScores(np.degrees(phase), phaseFloor, method), out=z)
+
+        flags = z > threshold
+        np.maximum(summary.scores, z.reshape(n, -1).max(axis=1), out=summary.scores)
+        summary.flagged[sl] = np.count_nonzero(flags, axis=0)
+        nFlagged += np.count_nonzero(flags.reshape(n, -1), axis=1)
+
+    summary.fractions = nFlagged / max(np.prod(shape), 1)
+    summary.outliers = summary.fractions > minFraction
+    keep = ~summary.outliers
+
+    summary.median = skrf.network.Network(frequency=frequency, s=median, name='Median')
+    summary.trimmed = skrf.network.Network(frequency=frequency, s=trimmed, name='Trimmed mean')
+
+    # Second pass over the kept devices only
+    clean = np.empty(shape, dtype=complex)
+    if np.any(keep):
+        for sl in slices:
+            clean[sl] = stackMean(np.asarray(allS[:, sl])[keep], averaging, maxBytes)
+    else:
+        clean[...] = np.nan
+    summary.cleanMean = skrf.network.Network(frequency=frequency, s=clean, name='Mean without outliers')
+
+    return summary
+
+
+def calcRobustSummary(networks, proportion=0.1, threshold=3.5, minFraction=0.05, method='mad',
+                      maxBytes=64*1024**2, averaging='polar'):
+    """
+    Returns a robustSummary of a list of Networks (interpolated onto their
+    common frequency range) or of a lotstore.lotStore
+    """
+    with span('calcRobustStatistics') as sp:
+        fStats, allS = lotStack(networks)
+        sp.set(devices=allS.shape[0], points=allS.shape[1])
+        return summarizeRobust(allS, fStats, proportion=proportion, threshold=threshold,
+                               minFraction=minFraction, method=method, maxBytes=maxBytes,
+                               averaging=averaging)
+
+
+def filenameField(pattern, group=1):
+    """
+    Returns a key extractor for groupedStatistics() taking the given regex
+    group of the file name, e.g. filenameField(r'_W(\\d+)_') for the wafer.
+    Devices not matching are grouped under None.
+    """
+    regex = re.compile(pattern)
+    def key(name, comments):
+        match = regex.search(name or '')
+        return match.group(group) if match is not None else None
+    return key
+
+
+def commentField(field):
+    """
+    Returns a key extractor for groupedStatistics() reading 'field = value'
+    or 'field: value' from the touchstone comments, e.g. commentField('Temp')
+    """
+    regex = re.compile(r'^\s*' + re.escape(field) + r'\s*[=:]\s*(.*?)\s*$', re.MULTILINE | re.IGNORECASE)
+    def key(name, comments):
+        match = regex.search(comments or '')
+        return match.group(1) if match is not None else None
+    return key
+
+
+def parseGroupKey(text):
+    """
+    Builds a groupedStatistics() key from a short description as used on
+    the command line and in the GUI: 'comment:NAME' for a comment field,
+    'attr:NAME' for a lot store attribute, anything else is a regex on the
+    file name whose first group is the key.
+    """
+    if text.startswith('comment:'):
+        return commentField(text[len('comment:'):])
+    if text.startswith('attr:'):
+        return text[len('attr:'):]
+    return filenameField(text)
+
+
+def deviceKeys(networks, key):
+    """
+    Applies a key extractor to every device of a list of Networks or a
+    lotstore.lotStore.  key is called as key(name, comments); for a store it
+    may also be the name of a per-device attribute.
+    """
+    if isinstance(networks, (list, tuple)):
+        return [key(net.name, net.comments) for net in networks]
+    if isinstance(key, str):
+        return networks.attribute(key)
+    return [key(device['name'], device.get('comments', '')) for device in networks.devices]
+
+
+class groupedSummary(object):
+    """
+    Results of groupedStatistics(), one row per group.
+
+    keys holds the group keys and counts the number of devices in each.
+    mean is the (n_groups, n_freq, nports, nports) polar mean, db and phase
+    are dictionaries of the same shape keyed by 'mean' and 'std', phases in
+    degrees.  db['mean'] is the mean of the dB values, not the dB of mean.
+    """
+    def __init__(self, frequency, keys, counts):
+        self.frequency = frequency
+        self.keys = list(keys)
+        self.counts = counts
+        self.mean = None
+        self.db = {}
+        self.phase = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def network(self, k):
+        """
+        Returns the mean of group k (an index into keys) as a Network
+        """
+        net           = skrf.network.Network()
+        net.frequency = self.frequency
+        net.s         = self.mean[k]
+        net.name      = str(self.keys[k])
+        return net
+
+    def pivot(self, row, col, quantity='db', statistic='mean'):
+        """
+        Returns an (n_groups, n_freq) table of one statistic of S(row, col),
+        ports numbered from 1, e.g. pivot(2, 1) for the mean dB of S21 of
+        every group
+        """
+        values = self.db if quantity == 'db' else self.phase
+        return values[statistic][:, :, row-1, col-1]
+
+    def toCsv(self, filename):
+        """
+        Writes the table in long format with one line per group, frequency
+        and S-parameter
+        """
+        nGroups, nFreq, nports = self.mean.shape[:3]
+        with open(filename, 'w') as fh:
+            fh.write('group,count,frequency_hz,parameter,db_mean,db_std,phase_mean,phase_std\n')
+            for g in range(nGroups):
+                for row in range(nports):
+                    for col in range(nports):
+                        param = 'S{:d}{:d}'.format(row+1, col+1)
+                        for k in range(nFreq):
+                            fh.write('{},{:d},{:.10g},{:s},{:.6g},{:.6g},{:.6g},{:.6g}\n'.format(
+                                self.keys[g], int(self.counts[g]), self.frequency.f[k], param,
+                                self.db['mean'][g, k, row, col], self.db['std'][g, k, row, col],
+                                self.phase['mean'][g, k, row, col], self.phase['std'][g, k, row, col]))
+
+
+def segmentStatistics(s, starts, counts):
+    """
+    Per-group statistics of a stack s already sorted by group, the groups
+    starting at the indices starts.  All reductions are segment sums
+    (np.add.reduceat) over the network axis.  Returns (mean, dbMean, dbStd,
+    phaseMean, phaseStd) with phases in radians.  mean is the complex polar
+    mean, dbMean the mean of the dB values that dbStd is taken around.
+    """
+    n = counts.reshape((-1,) + (1,)*(s.ndim-1)).astype(float)
+
+    mag = np.abs(s)
+    np.maximum(mag, np.finfo(float).tiny, out=mag)
+
+    magMean = np.add.reduceat(mag, starts, axis=0) / n
+    # Circular mean of the phase through the sum of unit phasors
+    phaseMean = np.angle(np.add.reduceat(s / mag, starts, axis=0))
+
+    db = 20*np.log10(mag)
+    dbMean = np.add.reduceat(db, starts, axis=0) / n
+    dev = db - np.repeat(dbMean, counts, axis=0)
+    dbStd = np.sqrt(np.add.reduceat(dev*dev, starts, axis=0) / n)
+
+    dev = np.angle(s) - np.repeat(phaseMean, counts, axis=0)
+    dev += np.pi
+    np.mod(dev, 2*np.pi, out=dev)
+    dev -= np.pi
+    phaseStd = np.sqrt(np.add.reduceat(dev*dev, starts, axis=0) / n)
+
+    return magMean * np.exp(1j*phaseMean), dbMean, dbStd, phaseMean, phaseStd
+
+
+def groupedStatistics(networks, key, maxBytes=256*1024**2):
+    """
+    Mean and standard deviation of a lot split into groups by key, a
+    function key(name, comments) such as filenameField() or commentField()
+    (or, for a lotstore.lotStore, the name of a device attribute).
+
+    The lot is stacked once, sorted by group and reduced with segment sums,
+    so the cost does not depend on the number of groups.  Memory-mapped
+    stores are processed in frequency chunks of at most maxBytes.  Returns
+    a groupedSummary.
+    """
+    with span('groupedStatistics') as sp:
+        fStats, allS = lotStack(networks)
+        keys = deviceKeys(networks, key)
+
+        try:
+            groups = sorted(set(keys))
+        except TypeError:
+            groups = list(dict.fromkeys(keys))      # Unorderable keys, e.g. None mixed with strings
+        index = {k: g for g, k in enumerate(groups)}
+        codes = np.array([index[k] for k in keys], dtype=int)
+
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes, minlength=len(groups))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        sp.set(devices=allS.shape[0], points=allS.shape[1], groups=len(groups))
+
+        summary = groupedSummary(fStats, groups, counts)
+        shape = (len(groups),) + allS.shape[1:]
+        summary.mean = np.empty(shape, dtype=complex)
+        for values in (summary.db, summary.phase):
+            values['mean'] = np.empty(shape)
+            values['std'] = np.empty(shape)
+
+        for sl in frequencySlices(allS, maxBytes):
+            sSorted = np.asarray(allS[:, sl])[order]
+            (summary.mean[:, sl], summary.db['mean'][:, sl], summary.db['std'][:, sl],
+             summary.phase['mean'][:, sl], summary.phase['std'][:, sl]) = segmentStatistics(sSorted, starts, counts)
+
+        summary.phase['mean'] = np.degrees(summary.phase['mean'])
+        summary.phase['std'] = np.degrees(summary.phase['std'])
+
+    return summary
+
+
+class statisticsAccumulator(object):
+    """
+    Incrementally accumulated statistics on a fixed frequency grid.
+
+    Networks are fed in one at a time with add().  Only running sums are
+    kept, so memory use is independent of how many networks have been
+    added.  The mean is computed in the polar domain, identical to
+    polarMean() for the same sequence of networks, and a Welford running
+    variance is kept for both magnitude and unwrapped phase.  With
+    averaging='circular' the phase is averaged through the sum of unit
+    phasors as in circularStatistics() instead, and phaseVariance() is the
+    circular variance.
+    """
+    def __init__(self, frequency, nports, averaging='polar'):
+        if averaging not in averagingModes:
+            raise ValueError('Unknown averaging mode {:s}'.format(str(averaging)))
+        self.frequency = frequency
+        self.nports = nports
+        self.averaging = averaging
+        self.reset()
+
+    def reset(self):
+        shape = (len(self.frequency), self.nports, self.nports)
+
+        self.count     = 0
+        self.magMean   = np.zeros(shape)
+        self.magM2     = np.zeros(shape)
+        self.phaseMean = np.zeros(shape)
+        self.phaseM2   = np.zeros(shape)
+        self.phaseUnwr = np.zeros(shape)
+        self.phasePrev = np.zeros(shape)
+        self.resultant = np.zeros(shape, dtype=complex)   # Sum of unit phasors
+
+        self._weightCache = {}
+
+    def _interpolate(self, net):
+        f = self.frequency.f
+        fNet = net.frequency.f
+
+        if net.nports != self.nports:
+            raise ValueError('Network {:s} has {:d} ports, expected {:d}'.format(str(net.name), net.nports, self.nports))
+        if fNet[0] > f[0] or fNet[-1] < f[-1]:
+            raise ValueError('Network {:s} does not cover the statistics frequency range'.format(str(net.name)))
+
+        if len(fNet) == len(f) and np.array_equal(fNet, f):
+            return net.s
+
+        key = fNet.tobytes()
+        if key not in self._weightCache:
+            idx, weight = interpolationWeights(fNet, f)
+            self._weightCache[key] = (idx, idx+1, weight[:, None, None])
+        idxLo, idxHi, weight = self._weightCache[key]
+
+        s = net.s
+        return s[idxLo] + (s[idxHi] - s[idxLo]) * weight
+
+    def add(self, net):
+        """
+        Adds a single network to the statistics
+        """
+        s = self._interpolate(net)
+        mag = np.abs(s)
+
+        self.count += 1
+        running = [(self.magMean, self.magM2, mag)]
+
+        if self.averaging == 'circular':
+            self.resultant += s / np.maximum(mag, np.finfo(mag.dtype).tiny)
+        else:
+            phase = np.angle(s)
+            if self.count == 1:
+                self.phaseUnwr[...] = phase
+            else:
+                step = np.mod(phase - self.phasePrev + np.pi, 2*np.pi) - np.pi
+                self.phaseUnwr += step
+            self.phasePrev[...] = phase
+            running.append((self.phaseMean, self.phaseM2, self.phaseUnwr))
+
+        for mean, m2, x in running:
+            delta = x - mean
+            mean += delta / self.count
+            m2 += delta * (x - mean)
+
+    def addNetworks(self, networks):
+        for net in networks:
+            self.add(net)
+
+    def magVariance(self):
+        return self.magM2 / max(self.count - 1, 1)
+
+    def phaseVariance(self):
+        if self.averaging == 'circular':
+            return 1 - np.abs(self.resultant) / max(self.count, 1)
+        return self.phaseM2 / max(self.count - 1, 1)
+
+    def mean(self):
+        """
+        Returns the current polar mean as a Network
+        """
+        if self.count == 0:
+            raise ValueError('No networks have been added')
+
+        if self.averaging == 'circular':
+            phaseMean = np.angle(self.resultant)
+        else:
+            phaseMean = self.phaseMean
+
+        dataAvg           = skrf.network.Network()
+        dataAvg.frequency = self.frequency
+        dataAvg.s         = self.magMean * np.exp(1j * phaseMean)
+        dataAvg.name      = 'Mean'
+
+        return dataAvg
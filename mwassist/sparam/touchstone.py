@@ -0,0 +1,311 @@
+'''
+Fast touchstone v1 (.sNp) parser and writer
+
+Reads a file straight into numpy arrays using a single vectorized pass over
+the numeric data instead of skrf's line-by-line reader.  A skrf Network is
+only built on request through networkFromArrays().  Files are written the
+same way, formatting a block of frequency points in one operation.
+
+@author: khershberger
+'''
+
+import io
+import os
+import re
+import warnings
+
+import numpy as np
+import skrf
+
+
+frequencyMultipliers = {'hz': 1.0, 'khz': 1e3, 'mhz': 1e6, 'ghz': 1e9, 'thz': 1e12}
+frequencyUnits = {'hz': 'Hz', 'khz': 'kHz', 'mhz': 'MHz', 'ghz': 'GHz', 'thz': 'THz'}
+
+_reOption  = re.compile(r'^[ \t]*#(.*)$', re.MULTILINE)
+_reComment = re.compile(r'!(.*)')
+_reKeyword = re.compile(r'^[ \t]*\[', re.MULTILINE)
+_rePorts   = re.compile(r'\.s(\d+)p$', re.IGNORECASE)
+_rePortZ0  = re.compile(r'^port impedance', re.IGNORECASE | re.MULTILINE)
+
+
+def portsFromFilename(filename):
+    match = _rePorts.search(filename)
+    if match is None:
+        raise ValueError('Unable to determine port count from {:s}'.format(filename))
+    return int(match.group(1))
+
+
+def parseOptionLine(line):
+    """
+    Parses the text following '#' in the option line.  Returns a
+    dictionary with unit, parameter, format and resistance, using the
+    touchstone defaults for missing fields.  Unknown tokens, e.g. an
+    unsupported unit, raise ValueError so the loader falls back to skrf.
+    """
+    options = {'unit': 'ghz', 'parameter': 's', 'format': 'ma', 'resistance': 50.0}
+
+    tokens = line.lower().split()
+    k = 0
+    while k < len(tokens):
+        token = tokens[k]
+        if token in frequencyMultipliers:
+            options['unit'] = token
+        elif token in ('s', 'y', 'z', 'g', 'h'):
+            options['parameter'] = token
+        elif token in ('ma', 'db', 'ri'):
+            options['format'] = token
+        elif token == 'r' and k+1 < len(tokens):
+            options['resistance'] = float(tokens[k+1])
+            k += 1
+        else:
+            raise ValueError('Unknown option line token {:s}'.format(token))
+        k += 1
+
+    return options
+
+
+def parseTouchstoneText(text, nports):
+    """
+    Parses the contents of a touchstone v1 file.  Returns (f, s, z0,
+    options, comments) with f in Hz and s of shape (n_freq, nports, nports).
+    """
+    if '[' in text and _reKeyword.search(text) is not None:
+        raise ValueError('Touchstone v2 keywords are not supported')
+
+    comments = '\n'.join(c.strip() for c in _reComment.findall(text))
+    if _rePortZ0.search(comments) is not None:
+        raise ValueError('Per-frequency port impedances are not supported')
+    text = _reComment.sub('', text)
+
+    match = _reOption.search(text)
+    options = parseOptionLine(match.group(1) if match is not None else '')
+    text = _reOption.sub('', text)
+
+    if options['parameter'] not in ('s', 'y', 'z'):
+        raise ValueError('{:s}-parameters are not supported'.format(options['parameter'].upper()))
+
+    nValues = 1 + 2*nports*nports
+    values = None
+
+    # One- and two-port files have one row per line, which np.loadtxt reads
+    # fastest.  Anything else (wrapped rows, noise data) is read as a flat
+    # stream of numbers.
+    if nports <= 2:
+        try:
+            data = np.loadtxt(io.StringIO(text), ndmin=2)
+            if data.shape[1] == nValues:
+                values = data.ravel()
+        except ValueError:
+            pass
+
+    if values is None:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            try:
+                values = np.fromstring(text, sep=' ')
+            except (DeprecationWarning, ValueError):
+                raise ValueError('Unable to parse numeric data')
+
+    nRows = len(values) // nValues
+
+    # Two-port files may be followed by noise parameters, which start where
+    # the frequency stops increasing
+    if nports == 2 and nRows > 1:
+        freqs = values[:nRows*nValues:nValues]
+        noiseStart = np.flatnonzero(np.diff(freqs) <= 0)
+        if len(noiseStart) > 0:
+            nRows = noiseStart[0] + 1
+
+    if nRows == 0 or (nports != 2 and len(values) != nRows*nValues):
+        raise ValueError('Number of values does not match a {:d}-port file'.format(nports))
+
+    data = values[:nRows*nValues].reshape(nRows, nValues)
+    f = data[:, 0] * frequencyMultipliers[options['unit']]
+
+    a = data[:, 1::2].reshape(nRows, nports, nports)
+    b = data[:, 2::2].reshape(nRows, nports, nports)
+
+    if options['format'] == 'ri':
+        s = a + 1j*b
+    elif options['format'] == 'ma':
+        s = a * np.exp(1j*np.radians(b))
+    else:
+        s = 10**(a/20) * np.exp(1j*np.radians(b))
+
+    # Two-port data is listed as S11 S21 S12 S22
+    if nports == 2:
+        s = s.transpose(0, 2, 1)
+
+    r = options['resistance']
+    z0 = np.full((nRows, nports), r, dtype=complex)
+    if options['parameter'] == 'z':
+        s = skrf.network.z2s(s * r, z0)
+    elif options['parameter'] == 'y':
+        s = skrf.network.y2s(s / r, z0)
+
+    return f, np.ascontiguousarray(s), z0, options, comments
+
+
+def readTouchstoneArrays(filename):
+    """
+    Reads a touchstone v1 file into the same dictionary of arrays that
+    loader.readTouchstoneArrays() returns
+    """
+    nports = portsFromFilename(filename)
+    with open(filename, 'r') as fh:
+        text = fh.read()
+
+    f, s, z0, options, comments = parseTouchstoneText(text, nports)
+
+    return {'filename': filename,
+            'f':        f,
+            'unit':     frequencyUnits[options['unit']],
+            's':        s,
+            'z0':       z0,
+            'comments': comments}
+
+
+def networkFromArrays(arrays):
+    """
+    Builds a skrf Network from a dictionary returned by readTouchstoneArrays()
+    """
+    freq = skrf.Frequency.from_f(arrays['f'], unit='hz')
+    freq.unit = arrays['unit']
+
+    spnet = skrf.network.Network()
+    spnet.frequency = freq
+    spnet.s = arrays['s']
+    spnet.z0 = arrays['z0']
+    spnet.comments = arrays.get('comments', '')
+    spnet.name = os.path.splitext(os.path.basename(arrays['filename']))[0]
+
+    return spnet
+
+
+def touchstoneExtension(nports):
+    return '.s{:d}p'.format(nports)
+
+
+def touchstoneFilename(filename, nports):
+    """
+    Replaces any .sNp extension of filename by the one matching nports
+    """
+    base, ext = os.path.splitext(filename)
+    if _rePorts.search(ext) is None:
+        base = filename
+    return base + touchstoneExtension(nports)
+
+
+def recordFormat(nports, precision):
+    """
+    printf style format of one frequency point: the frequency followed by
+    the nports*nports pairs, wrapped after four pairs and at the end of
+    each matrix row for three or more ports
+    """
+    value = '%.{:d}e'.format(precision)
+    parts = ['%.12g']
+    for n in range(nports*nports):
+        column = n % nports
+        if nports > 2 and n > 0 and (column == 0 or column % 4 == 0):
+            parts.append('\n')
+        else:
+            parts.append(' ')
+        parts.append(value + ' ' + value)
+    parts.append('\n')
+    return ''.join(parts)
+
+
+def touchstoneRecords(f, s, unit='GHz', fmt='ri'):
+    """
+    Returns the numbers of the data lines of s as a (n_freq, 1 + 2*nports**2)
+    array: the frequency in unit followed by the value pairs in file order
+    """
+    nports = s.shape[-1]
+
+    # Two-port data is listed as S11 S21 S12 S22
+    sOrdered = s.transpose(0, 2, 1) if nports == 2 else s
+    sOrdered = sOrdered.reshape(len(f), -1)
+
+    data = np.empty((len(f), 1 + 2*nports*nports))
+    data[:, 0] = np.asarray(f) / frequencyMultipliers[unit.lower()]
+    if fmt == 'ri':
+        data[:, 1::2] = sOrdered.real
+        data[:, 2::2] = sOrdered.imag
+    elif fmt == 'ma':
+        data[:, 1::2] = np.abs(sOrdered)
+        data[:, 2::2] = np.degrees(np.angle(sOrdered))
+    elif fmt == 'db':
+        mag = np.abs(sOrdered)
+        np.maximum(mag, np.finfo(mag.dtype).tiny, out=mag)
+        data[:, 1::2] = 20*np.log10(mag)
+        data[:, 2::2] = np.degrees(np.angle(sOrdered))
+    else:
+        raise ValueError('Unknown touchstone format {:s}'.format(fmt))
+    return data
+
+
+def iterTouchstoneText(f, s, z0=50.0, unit='GHz', fmt='ri', comments='', precision=9, blockSize=1024):
+    """
+    Yields the contents of a touchstone v1 file of s (n_freq, nports,
+    nports) at the frequencies f in Hz, header first and then blockSize
+    frequency points at a time.  fmt is 'ri', 'ma' or 'db'.
+
+    Each block is formatted by a single % operation on a repeated record
+    format, so the Python objects created at once are bounded by the
+    block rather than by the file.
+    """
+    if fmt not in ('ri', 'ma', 'db'):
+        raise ValueError('Unknown touchstone format {:s}'.format(fmt))
+
+    header = ''.join('! {:s}\n'.format(line) for line in comments.splitlines() if line.strip())
+    header += '# {:s} S {:s} R {:g}\n'.format(frequencyUnits[unit.lower()], fmt.upper(), z0)
+    yield header
+
+    record = recordFormat(s.shape[-1], precision)
+    for k in range(0, len(f), blockSize):
+        data = touchstoneRecords(f[k:k+blockSize], s[k:k+blockSize], unit=unit, fmt=fmt)
+        yield (record * len(data)) % tuple(data.ravel().tolist())
+
+
+def formatTouchstoneText(f, s, z0=50.0, unit='GHz', fmt='ri', comments='', precision=9):
+    """
+    Returns the contents of a touchstone v1 file as one string, see
+    iterTouchstoneText()
+    """
+    return ''.join(iterTouchstoneText(f, s, z0=z0, unit=unit, fmt=fmt, comments=comments, precision=precision))
+
+
+def writeTouchstone(filename, f, s, z0=50.0, unit='GHz', fmt='ri', comments='', precision=9):
+    """
+    Writes s (n_freq, nports, nports) as a touchstone v1 file, block by
+    block.  The extension of filename is corrected to .sNp.  Returns the
+    file name.
+    """
+    filename = touchstoneFilename(filename, s.shape[-1])
+    blocks = iterTouchstoneText(np.asarray(f), s, z0=z0, unit=unit, fmt=fmt, comments=comments,
+                                precision=precision)
+    with open(filename, 'w') as fh:
+        fh.writelines(blocks)
+    return filename
+
+
+def writeNetwork(net, filename, fmt='ri', precision=9):
+    """
+    Writes a skrf Network with writeTouchstone().  The v1 option line only
+    holds a single real reference impedance, so networks with complex,
+    per-port or frequency dependent z0 are written by skrf instead, which
+    lists the port impedances as comments.  Returns the file name.
+    """
+    filename = touchstoneFilename(filename, net.nports)
+    z0 = np.asarray(net.z0)
+    if z0.size > 0 and (np.any(z0.imag != 0) or np.any(z0 != z0.flat[0])):
+        text = net.write_touchstone(filename=os.path.splitext(os.path.basename(filename))[0],
+                                    return_string=True, form=fmt, write_z0=True)
+        with open(filename, 'w') as fh:
+            fh.write(text)
+        return filename
+
+    z0 = float(z0.flat[0].real) if z0.size > 0 else 50.0
+    comments = getattr(net, 'comments', '') or ''
+    return writeTouchstone(filename, net.frequency.f, net.s, z0=z0, unit=net.frequency.unit,
+                           fmt=fmt, comments=comments, precision=precision)
@@ -0,0 +1,165 @@
+'''
+Directory watch mode
+
+Picks up touchstone files as they are written into a directory, e.g. by a
+VNA during an automated measurement.  directoryWatcher turns file system
+notifications into a single debounced changed signal; directoryScanner
+finds the files that are new or were modified since the last scan.  The
+scanner does no Qt work, so the sparam widget runs it in a background job
+together with the parsing.
+
+@author: khershberger
+'''
+
+import logging
+import os
+import re
+import time
+
+from PyQt5.QtCore import (
+    QFileSystemWatcher,
+    QObject,
+    QTimer,
+    pyqtSignal
+    )
+
+
+touchstonePattern = r'\.s\d+p$'
+
+
+def directorySignatures(path, pattern):
+    """
+    Returns {path: (mtime_ns, size)} of every file of the directory whose
+    name matches the compiled regex pattern
+    """
+    result = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not pattern.search(entry.name):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue    # Removed while scanning
+            result[entry.path] = (st.st_mtime_ns, st.st_size)
+    return result
+
+
+class directoryScanner(object):
+    """
+    Tracks the touchstone files of a directory by (mtime, size).
+
+    scan() returns the files added or modified since the previous scan.
+    Files modified less than settle seconds ago may still be being
+    written; they are held back and reported by a later scan.
+    """
+    def __init__(self, path, pattern=touchstonePattern, settle=1.0):
+        self.path = path
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.settle = settle
+        self.known = {}         # Signature of every file already reported
+
+    def signatures(self):
+        """
+        Returns {path: (mtime_ns, size)} of every matching file
+        """
+        return directorySignatures(self.path, self.pattern)
+
+    def prime(self):
+        """
+        Marks all files currently in the directory as already reported
+        """
+        self.known.update(self.signatures())
+
+    def scan(self):
+        """
+        Returns (new, changed, nPending): sorted lists of the settled files
+        that are new or modified, and the number of files still settling
+        """
+        new = []
+        changed = []
+        nPending = 0
+        now = time.time()
+        for fname, signature in sorted(self.signatures().items()):
+            previous = self.known.get(fname)
+            if previous == signature:
+                continue
+            if signature[1] == 0 or now - signature[0]*1e-9 < self.settle:
+                nPending += 1
+                continue
+            self.known[fname] = signature
+            if previous is None:
+                new.append(fname)
+            else:
+                changed.append(fname)
+        return new, changed, nPending
+
+
+class directoryWatcher(QObject):
+    """
+    Emits changed once a burst of modifications of a directory has been
+    quiet for debounce milliseconds.
+
+    QFileSystemWatcher is not notified of changes on most network shares,
+    so the matching files are additionally polled every poll milliseconds
+    (0 disables polling).  A poll only emits changed if a file was added,
+    removed or modified since the previous poll.
+    """
+    changed = pyqtSignal()
+
+    def __init__(self, path, parent=None, debounce=500, poll=5000, pattern=touchstonePattern):
+        super().__init__(parent)
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.polled = None      # Signatures seen by the previous poll
+
+        self.debounceTimer = QTimer(self)
+        self.debounceTimer.setSingleShot(True)
+        self.debounceTimer.setInterval(debounce)
+        self.debounceTimer.timeout.connect(self.changed)
+
+        self.pollTimer = QTimer(self)
+        self.pollTimer.setInterval(poll)
+        self.pollTimer.timeout.connect(self.onPoll)
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.onDirectoryChanged)
+
+    def start(self):
+        if not self.watcher.addPath(self.path):
+            self.logger.warning('File system notifications unavailable for {:s}, polling only'.format(self.path))
+        if self.pollTimer.interval() > 0:
+            self.polled = self.pollSignatures()
+            self.pollTimer.start()
+
+    def stop(self):
+        self.debounceTimer.stop()
+        self.pollTimer.stop()
+        if len(self.watcher.directories()) > 0:
+            self.watcher.removePaths(self.watcher.directories())
+
+    def trigger(self):
+        """
+        (Re)starts the debounce timer, e.g. to scan again while files are
+        still settling
+        """
+        self.debounceTimer.start()
+
+    def onDirectoryChanged(self, path):
+        self.trigger()
+
+    def pollSignatures(self):
+        try:
+            return directorySignatures(self.path, self.pattern)
+        except OSError as e:
+            self.logger.debug('Polling {:s} failed: {:s}'.format(self.path, str(e)))
+            return None
+
+    def onPoll(self):
+        signatures = self.pollSignatures()
+        if signatures != self.polled:
+            self.polled = signatures
+            self.changed.emit()
@@ -0,0 +1,233 @@
+'''
+Workspace of several named lots
+
+Keeps lots in memory side by side so they can be compared without
+reloading and reparsing.  Devices are stored as plain arrays rather than
+skrf Networks: identical frequency grids are stored once and shared by all
+devices and lots measured on them, and S-parameters may be kept as
+complex64 to halve their size.  Only the lot being plotted also exists as a
+list of Networks.
+
+Anything computed from a lot (statistics, outliers, groups) is cached with
+that lot and dropped only when that lot changes, so switching between lots
+or overlaying them recomputes nothing.  Nothing here uses Qt.
+
+@author: khershberger
+'''
+
+import collections
+import logging
+import os
+
+import numpy as np
+import skrf
+
+
+lotDevice = collections.namedtuple('lotDevice', 'name frequency s z0 comments')
+
+
+class frequencyPool(object):
+    """
+    Stores every distinct frequency grid once.  intern() returns the shared
+    copy of a grid, which must not be modified.
+    """
+    def __init__(self):
+        self.grids = {}
+
+    def __len__(self):
+        return len(self.grids)
+
+    @property
+    def nbytes(self):
+        return sum(grid.f.nbytes for grid in self.grids.values())
+
+    def intern(self, frequency):
+        key = (frequency.unit, frequency.f.tobytes())
+        grid = self.grids.get(key)
+        if grid is None:
+            grid = frequency.copy()
+            self.grids[key] = grid
+        return grid
+
+    def prune(self, used):
+        """
+        Drops the grids not in used, an iterable of interned grids
+        """
+        used = set(id(grid) for grid in used)
+        self.grids = {key: grid for key, grid in self.grids.items() if id(grid) in used}
+
+
+class workspaceLot(object):
+    """
+    A named lot of a lotWorkspace.
+
+    devices holds one lotDevice per network.  results caches whatever was
+    computed from the lot, keyed by the caller (e.g. 'summary'); it is
+    cleared and version incremented by every change of the devices.
+    """
+    def __init__(self, name, pool, dtype=complex):
+        self.name = name
+        self.pool = pool
+        self.dtype = np.dtype(dtype)
+        self.devices = []
+        self.results = {}
+        self.version = 0
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __repr__(self):
+        return 'workspaceLot({:s}: {:d} devices, {:s}, {:.1f} MB)'.format(
+            self.name, len(self), self.dtype.name, self.nbytes / 1024**2)
+
+    @property
+    def nports(self):
+        return max((device.s.shape[-1] for device in self.devices), default=0)
+
+    @property
+    def names(self):
+        return [device.name for device in self.devices]
+
+    @property
+    def grids(self):
+        return [device.frequency for device in self.devices]
+
+    @property
+    def nbytes(self):
+        """
+        Size of the device arrays, the shared frequency grids not included
+        """
+        return sum(device.s.nbytes + device.z0.nbytes for device in self.devices)
+
+    def compact(self, net):
+        z0 = np.asarray(net.z0)
+        if z0.size > 0 and np.all(z0 == z0.flat[0]):
+            z0 = np.array(z0.flat[0])   # Same impedance everywhere, e.g. 50 Ohm
+        return lotDevice(net.name, self.pool.intern(net.frequency),
+                         np.array(net.s, dtype=self.dtype), z0, getattr(net, 'comments', ''))
+
+    def changed(self):
+        self.version += 1
+        self.results = {}
+
+    def setNetworks(self, networks):
+        self.devices = [self.compact(net) for net in networks]
+        self.changed()
+
+    def addNetworks(self, networks):
+        self.devices.extend(self.compact(net) for net in networks)
+        self.changed()
+
+    def network(self, k):
+        """
+        Builds a skrf Network of a single device
+        """
+        device        = self.devices[k]
+        net           = skrf.network.Network()
+        net.frequency = device.frequency
+        net.s         = device.s
+        net.z0        = device.z0
+        net.name      = device.name
+        net.comments  = device.comments
+        return net
+
+    def networks(self):
+        return [self.network(k) for k in range(len(self))]
+
+
+class lotWorkspace(object):
+    """
+    Named lots sharing one frequencyPool.  Lots are kept in the order they
+    were added.  dtype is the default storage type of new lots.
+    """
+    def __init__(self, dtype=complex):
+        self.logger = logging.getLogger(__name__)
+        self.lots = collections.OrderedDict()
+        self.pool = frequencyPool()
+        self.dtype = dtype
+
+    def __len__(self):
+        return len(self.lots)
+
+    def __contains__(self, name):
+        return name in self.lots
+
+    def __getitem__(self, name):
+        return self.lots[name]
+
+    def __iter__(self):
+        return iter(self.lots.values())
+
+    def __repr__(self):
+        return 'lotWorkspace({:d} lots, {:d} devices, {:d} frequency grids, {:.1f} MB)'.format(
+            len(self), sum(len(lot) for lot in self), len(self.pool), self.nbytes / 1024**2)
+
+    @property
+    def names(self):
+        return list(self.lots.keys())
+
+    @property
+    def nbytes(self):
+        return sum(lot.nbytes for lot in self) + self.pool.nbytes
+
+    def uniqueName(self, name):
+        """
+        name, or name with a numeric suffix if a lot of that name exists
+        """
+        candidate = name
+        k = 2
+        while candidate in self.lots:
+            candidate = '{:s} ({:d})'.format(name, k)
+            k += 1
+        return candidate
+
+    def addLot(self, name, networks, dtype=None, replace=False):
+        """
+        Adds a lot of networks under name, renamed to be unique unless
+        replace is set.  Returns the workspaceLot.
+        """
+        if not replace:
+            name = self.uniqueName(name)
+        lot = workspaceLot(name, self.pool, dtype if dtype is not None else self.dtype)
+        lot.setNetworks(networks)
+        self.lots[name] = lot
+        self.prune()
+        self.logger.debug('Added {:s}'.format(repr(lot)))
+        return lot
+
+    def removeLot(self, name):
+        del self.lots[name]
+        self.prune()
+
+    def renameLot(self, name, newName):
+        """
+        Renames a lot, keeping its position.  Returns the new name, made
+        unique if needed.
+        """
+        if newName == name:
+            return name
+        newName = self.uniqueName(newName)
+        lot = self.lots[name]
+        lot.name = newName
+        self.lots = collections.OrderedDict((newName if key == name else key, value)
+                                            for key, value in self.lots.items())
+        return newName
+
+    def prune(self):
+        """
+        Drops frequency grids no longer used by any lot
+        """
+        self.pool.prune(grid for lot in self for grid in lot.grids)
+
+
+def lotNameFromFiles(filelist):
+    """
+    Default lot name for a list of files: the name of their common
+    directory, or of the file itself for a single file
+    """
+    if len(filelist) == 0:
+        return 'Lot'
+    if len(filelist) == 1:
+        return os.path.splitext(os.path.basename(filelist[0]))[0]
+    directory = os.path.commonpath([os.path.dirname(os.path.abspath(fname)) for fname in filelist])
+    return os.path.basename(directory) or directory
@@ -0,0 +1,8 @@
+'''
+Tests of mwassist
+
+Run with python -m pytest from the repository root.  Numerical results are
+checked against skrf, numpy and scipy as the reference implementations.
+
+@author: khershberger
+'''
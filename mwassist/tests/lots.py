@@ -0,0 +1,36 @@
+'''
+Synthetic lots shared by the tests
+
+@author: khershberger
+'''
+
+import numpy as np
+import skrf
+
+
+def randomStack(nNetworks=20, nFreq=31, nports=2, ripple=0.05, phaseSpread=0.2, seed=0):
+    """
+    (n, n_freq, nports, nports) S-parameters scattered around a common
+    response by ripple (relative magnitude) and phaseSpread (radians)
+    """
+    rng = np.random.default_rng(seed)
+    shape = (nNetworks, nFreq, nports, nports)
+    base = 0.5 * np.exp(1j*np.linspace(0, 6, nFreq))[:, None, None] * np.ones((nports, nports))
+    mag = 1 + ripple*rng.standard_normal(shape)
+    phase = phaseSpread*rng.standard_normal(shape)
+    return base * mag * np.exp(1j*phase)
+
+
+def randomLot(nNetworks=20, nFreq=31, nports=2, names=None, seed=0, **kwargs):
+    """
+    The networks of randomStack() on a common GHz grid
+    """
+    s = randomStack(nNetworks, nFreq, nports, seed=seed, **kwargs)
+    freq = skrf.Frequency(1, 2, nFreq, unit='GHz')
+    networks = []
+    for k in range(nNetworks):
+        net = skrf.Network(frequency=freq, s=s[k])
+        net.name = names[k] if names is not None else 'dev{:03d}'.format(k)
+        net.comments = ''
+        networks.append(net)
+    return networks
@@ -0,0 +1,44 @@
+'''
+statisticsAccumulator against calcNetworkStatistics and numpy
+
+@author: khershberger
+'''
+
+import numpy as np
+import pytest
+import skrf
+
+from mwassist.sparam.stats import calcNetworkStatistics, statisticsAccumulator
+from mwassist.tests.lots import randomLot
+
+
+def test_matches_network_statistics():
+    networks = randomLot(25, phaseSpread=0.4)
+    acc = statisticsAccumulator(networks[0].frequency, 2)
+    acc.addNetworks(networks)
+    np.testing.assert_allclose(acc.mean().s, calcNetworkStatistics(networks).s, atol=1e-12)
+
+    allS = np.stack([net.s for net in networks])
+    phase = np.unwrap(np.angle(allS), axis=0)
+    np.testing.assert_allclose(acc.magVariance(), np.abs(allS).var(axis=0, ddof=1), atol=1e-12)
+    np.testing.assert_allclose(acc.phaseVariance(), phase.var(axis=0, ddof=1), atol=1e-12)
+
+
+def test_interpolates_onto_grid():
+    networks = randomLot(5, nFreq=41)
+    grid = skrf.Frequency(1.1, 1.9, 17, unit='GHz')
+    acc = statisticsAccumulator(grid, 2)
+    acc.addNetworks(networks)
+    np.testing.assert_allclose(acc.mean().s, calcNetworkStatistics([net.interpolate(grid) for net in networks]).s,
+                               atol=1e-12)
+
+
+def test_rejects_networks_off_grid():
+    networks = randomLot(2)
+    acc = statisticsAccumulator(skrf.Frequency(0.5, 2, 11, unit='GHz'), 2)
+    with pytest.raises(ValueError):
+        acc.add(networks[0])
+    with pytest.raises(ValueError):
+        statisticsAccumulator(networks[0].frequency, 2).add(randomLot(1, nports=3)[0])
+    with pytest.raises(ValueError):
+        acc.mean()
@@ -0,0 +1,103 @@
+'''
+Content-hash index and LRU eviction of the touchstone cache
+
+@author: khershberger
+'''
+
+import os
+
+import numpy as np
+
+from mwassist.sparam.cache import touchstoneCache
+from mwassist.sparam.loader import readTouchstoneArrays
+from mwassist.tests.lots import randomLot
+
+
+def writeDevice(tmp_path, name, seed=0, nFreq=21):
+    filename = os.path.join(str(tmp_path), name + '.s2p')
+    with open(filename, 'w') as fh:
+        fh.write(randomLot(1, nFreq, seed=seed)[0].write_touchstone(return_string=True, form='ri'))
+    return filename
+
+
+def cacheDevice(cache, filename):
+    arrays = readTouchstoneArrays(filename)
+    cache.put(filename, arrays)
+    return arrays
+
+
+def test_roundtrip_and_persistence(tmp_path):
+    fname = writeDevice(tmp_path, 'a')
+    cache = touchstoneCache(str(tmp_path / 'cache'))
+    assert cache.get(fname) is None
+    arrays = cacheDevice(cache, fname)
+    cache.save()
+
+    cached = touchstoneCache(str(tmp_path / 'cache')).get(fname)
+    for key in ('f', 's', 'z0'):
+        np.testing.assert_array_equal(cached[key], arrays[key])
+    assert cached['unit'] == arrays['unit']
+
+
+def test_unchanged_file_not_rehashed(tmp_path, monkeypatch):
+    fname = writeDevice(tmp_path, 'a')
+    cache = touchstoneCache(str(tmp_path / 'cache'))
+    cacheDevice(cache, fname)
+
+    hashed = []
+    contentHash = touchstoneCache.contentHash
+    monkeypatch.setattr(touchstoneCache, 'contentHash',
+                        staticmethod(lambda filename: hashed.append(filename) or contentHash(filename)))
+    assert cache.get(fname) is not None
+    assert hashed == []
+
+    # Same size, new contents and mtime
+    st = os.stat(fname)
+    with open(fname, 'r+') as fh:
+        text = fh.read()
+        fh.seek(0)
+        fh.write(text[:-2] + ('1' if text[-2] != '1' else '2') + text[-1:])
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert os.stat(fname).st_size == st.st_size
+    assert cache.get(fname) is None
+    assert len(hashed) == 1
+
+
+def test_size_change_invalidates(tmp_path):
+    fname = writeDevice(tmp_path, 'a')
+    cache = touchstoneCache(str(tmp_path / 'cache'))
+    cacheDevice(cache, fname)
+
+    st = os.stat(fname)
+    writeDevice(tmp_path, 'a', nFreq=31)
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert cache.get(fname) is None
+
+
+def test_identical_contents_share_entry(tmp_path):
+    first = writeDevice(tmp_path, 'a')
+    second = writeDevice(tmp_path, 'b')
+    cache = touchstoneCache(str(tmp_path / 'cache'))
+    cacheDevice(cache, first)
+    assert cache.get(second) is not None
+    assert len(cache.entries) == 1
+
+
+def test_evicts_least_recently_used(tmp_path):
+    names = [writeDevice(tmp_path, name, seed=k) for k, name in enumerate('abc')]
+    cache = touchstoneCache(str(tmp_path / 'cache'))
+    cacheDevice(cache, names[0])
+    entryBytes = cache.totalBytes
+    cache.maxBytes = 2*entryBytes + entryBytes // 2
+
+    cacheDevice(cache, names[1])
+    hashes = [cache.lookupHash(name) for name in names[:2]]
+    cache.entries[hashes[0]]['atime'] = 2.0
+    cache.entries[hashes[1]]['atime'] = 1.0
+
+    cacheDevice(cache, names[2])
+    assert cache.totalBytes <= cache.maxBytes
+    assert cache.get(names[0]) is not None
+    assert cache.get(names[1]) is None
+    assert cache.get(names[2]) is not None
+    assert not os.path.exists(cache.entryPath(hashes[1]))
@@ -0,0 +1,62 @@
+'''
+Circular averaging against scipy.stats.circmean/circvar
+
+@author: khershberger
+'''
+
+import numpy as np
+import scipy.stats
+
+from mwassist.sparam.stats import circularStatistics, statisticsAccumulator
+from mwassist.tests.lots import randomLot, randomStack
+
+
+def assertSameAngle(actual, desired, atol=1e-9):
+    np.testing.assert_allclose(np.angle(np.exp(1j*(actual - desired))), 0, atol=atol)
+
+
+def test_matches_scipy():
+    # Phases spread over more than pi, where the polar mean breaks down
+    s = randomStack(50, phaseSpread=1.5)
+    mean, variance = circularStatistics(s)
+    phase = np.angle(s)
+    np.testing.assert_allclose(np.abs(mean), np.abs(s).mean(axis=0), atol=1e-12)
+    assertSameAngle(np.angle(mean), scipy.stats.circmean(phase, high=np.pi, low=-np.pi, axis=0))
+    np.testing.assert_allclose(variance, scipy.stats.circvar(phase, high=np.pi, low=-np.pi, axis=0), atol=1e-12)
+
+
+def test_order_independent():
+    s = randomStack(40, phaseSpread=1.5)
+    order = np.random.default_rng(1).permutation(len(s))
+    mean, variance = circularStatistics(s)
+    meanShuffled, varianceShuffled = circularStatistics(s[order])
+    np.testing.assert_allclose(meanShuffled, mean, atol=1e-12)
+    np.testing.assert_allclose(varianceShuffled, variance, atol=1e-12)
+
+
+def test_chunked_equals_unchunked():
+    s = randomStack(20, nFreq=101, phaseSpread=1.0)
+    mean, variance = circularStatistics(s)
+    meanChunked, varianceChunked = circularStatistics(s, maxBytes=s.nbytes // 5)
+    np.testing.assert_allclose(meanChunked, mean)
+    np.testing.assert_allclose(varianceChunked, variance)
+
+
+def test_zero_magnitude_ignored():
+    s = randomStack(10, phaseSpread=0.1)
+    mean = circularStatistics(s)[0]
+    s = np.concatenate([s, np.zeros_like(s[:1])])
+    meanWithZero = circularStatistics(s)[0]
+    assertSameAngle(np.angle(meanWithZero), np.angle(mean))
+
+
+def test_accumulator_matches_stack():
+    networks = randomLot(30, phaseSpread=1.5)
+    allS = np.stack([net.s for net in networks])
+    acc = statisticsAccumulator(networks[0].frequency, 2, averaging='circular')
+    acc.addNetworks(networks)
+    mean, variance = circularStatistics(allS)
+    np.testing.assert_allclose(acc.mean().s, mean, atol=1e-12)
+    np.testing.assert_allclose(acc.phaseVariance(), variance, atol=1e-12)
+    np.testing.assert_allclose(acc.magVariance(), np.abs(allS).var(axis=0, ddof=1), atol=1e-12)
+
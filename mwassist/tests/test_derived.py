@@ -0,0 +1,78 @@
+'''
+Derived quantities against skrf
+
+@author: khershberger
+'''
+
+import numpy as np
+import pytest
+import skrf
+
+from mwassist.sparam import derived
+from mwassist.sparam.stats import summarizeDerived
+from mwassist.tests.lots import randomLot, randomStack
+
+
+def lot():
+    # Wide enough a spread that some points are potentially unstable
+    networks = randomLot(20, ripple=0.3, phaseSpread=1.0)
+    for net in networks:
+        net.s[:, 1, 0] *= 4
+    return networks
+
+
+def test_stability_and_gain_match_skrf():
+    networks = lot()
+    s = np.stack([net.s for net in networks])
+    k = derived.rollettK(s)[..., 0, 0]
+    gain = derived.maxGain(s)[..., 0, 0]
+    delta = derived.deltaMagnitude(s)[..., 0, 0]
+    assert np.any((k > 1) & (delta < 1)) and np.any((k > 1) & (delta > 1)) and np.any(k < 1)
+
+    for n, net in enumerate(networks):
+        np.testing.assert_allclose(k[n], net.stability, rtol=1e-12)
+        delta = net.s[:, 0, 0]*net.s[:, 1, 1] - net.s[:, 0, 1]*net.s[:, 1, 0]
+        np.testing.assert_allclose(derived.deltaMagnitude(net.s)[:, 0, 0], np.abs(delta), rtol=1e-12)
+        # MAG only where unconditionally stable, skrf only checks K
+        stable = (k[n] > 1) & (np.abs(delta) < 1)
+        reference = np.where(stable, net.max_gain, net.max_stable_gain)
+        np.testing.assert_allclose(10**(gain[n]/10), reference, rtol=1e-12)
+
+
+def test_mu_agrees_with_k_delta_test():
+    # mu > 1 is equivalent to K > 1 and |Delta| < 1 (Edwards and Sinsky)
+    s = np.stack([net.s for net in lot()])
+    mu = derived.muFactor(s)[..., 0, 0]
+    k = derived.rollettK(s)[..., 0, 0]
+    delta = derived.deltaMagnitude(s)[..., 0, 0]
+    np.testing.assert_array_equal(mu > 1, (k > 1) & (delta < 1))
+
+
+def test_per_element_match_skrf():
+    net = randomLot(1, phaseSpread=1.0)[0]
+    np.testing.assert_allclose(derived.vswr(net.s), net.s_vswr, rtol=1e-12)
+    np.testing.assert_allclose(derived.returnLoss(net.s), -net.s_db, rtol=1e-12)
+    for row in range(2):
+        for col in range(2):
+            reference = net.s[:, row, col]
+            tau = skrf.Network(frequency=net.frequency, s=reference).group_delay[:, 0, 0]
+            np.testing.assert_allclose(1e-9*derived.groupDelay(net.s, net.f)[:, row, col], tau,
+                                       rtol=1e-9, atol=1e-21)
+
+
+def test_device_quantities_require_two_ports():
+    with pytest.raises(ValueError):
+        derived.rollettK(randomStack(1, nports=3))
+
+
+def test_chunked_derived_statistics():
+    s = randomStack(15, nFreq=101, phaseSpread=0.5)
+    frequency = skrf.Frequency(1, 2, 101, unit='GHz')
+    for fmt in ('groupdelay', 'k', 'mag'):
+        whole = summarizeDerived(s, frequency, fmt)
+        chunked = summarizeDerived(s, frequency, fmt, maxBytes=s.nbytes // 6)
+        values = derived.derivedValues(s, frequency.f, fmt)
+        np.testing.assert_allclose(whole['mean'], np.nanmean(values, axis=0), rtol=1e-12)
+        np.testing.assert_allclose(whole['p95'], np.nanpercentile(values, 95, axis=0), rtol=1e-12)
+        for key in whole:
+            np.testing.assert_allclose(chunked[key], whole[key], rtol=1e-12, atol=1e-15)
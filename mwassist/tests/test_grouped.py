@@ -0,0 +1,63 @@
+'''
+Grouped statistics against per-group numpy and scipy reductions
+
+@author: khershberger
+'''
+
+import numpy as np
+import scipy.stats
+
+from mwassist.instrument import tracer
+from mwassist.sparam.stats import filenameField, groupedStatistics, lotStack
+from mwassist.tests.lots import randomLot
+
+
+def groupedLot():
+    names = ['W{:d}_dev{:03d}'.format(k % 3, k) for k in range(30)]
+    return randomLot(30, names=names, ripple=0.05, phaseSpread=0.3)
+
+
+def test_matches_per_group_reductions():
+    networks = groupedLot()
+    groups = groupedStatistics(networks, filenameField(r'W(\d)_'))
+    assert groups.keys == ['0', '1', '2']
+    assert list(groups.counts) == [10, 10, 10]
+
+    f, allS = lotStack(networks)
+    for g, key in enumerate(groups.keys):
+        s = allS[[k for k, net in enumerate(networks) if net.name.startswith('W' + key)]]
+        db = 20*np.log10(np.abs(s))
+        np.testing.assert_allclose(groups.db['mean'][g], db.mean(axis=0), atol=1e-12)
+        np.testing.assert_allclose(groups.db['std'][g], db.std(axis=0), atol=1e-12)
+
+        phaseMean = np.degrees(scipy.stats.circmean(np.angle(s), high=np.pi, low=-np.pi, axis=0))
+        wrapped = (groups.phase['mean'][g] - phaseMean + 180) % 360 - 180
+        np.testing.assert_allclose(wrapped, 0, atol=1e-9)
+        np.testing.assert_allclose(np.abs(groups.mean[g]), np.abs(s).mean(axis=0), atol=1e-12)
+
+
+def test_chunked_equals_unchunked():
+    networks = groupedLot()
+    key = filenameField(r'W(\d)_')
+    whole = groupedStatistics(networks, key)
+    chunked = groupedStatistics(networks, key, maxBytes=2000)
+    np.testing.assert_allclose(chunked.mean, whole.mean)
+    for values, reference in ((chunked.db, whole.db), (chunked.phase, whole.phase)):
+        for name in ('mean', 'std'):
+            np.testing.assert_allclose(values[name], reference[name])
+
+
+def test_unmatched_devices_grouped_under_none():
+    networks = groupedLot()
+    networks[0].name = 'unknown'
+    groups = groupedStatistics(networks, filenameField(r'W(\d)_'))
+    assert None in groups.keys
+    assert int(groups.counts[groups.keys.index(None)]) == 1
+
+
+def test_traced():
+    tracer.clear()
+    groupedStatistics(groupedLot(), filenameField(r'W(\d)_'))
+    entry = tracer.summary()['groupedStatistics']
+    assert entry['count'] == 1
+    assert entry['values'] == {'devices': 30, 'points': 31, 'groups': 3}
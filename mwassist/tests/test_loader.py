@@ -0,0 +1,44 @@
+'''
+Parallel touchstone loading
+
+@author: khershberger
+'''
+
+import os
+
+import numpy as np
+
+from mwassist.sparam.loader import touchstoneLoader
+from mwassist.tests.lots import randomLot
+
+
+def writeFiles(tmp_path, n):
+    filelist = []
+    for net in randomLot(n):
+        filename = os.path.join(str(tmp_path), net.name + '.s2p')
+        with open(filename, 'w') as fh:
+            fh.write(net.write_touchstone(return_string=True, form='ri'))
+        filelist.append(filename)
+    return filelist
+
+
+def test_parallel_matches_serial(tmp_path):
+    filelist = writeFiles(tmp_path, 12)
+    filelist.insert(5, os.path.join(str(tmp_path), 'missing.s2p'))
+    errors = []
+    parallel = touchstoneLoader(filelist, maxWorkers=2, serialThreshold=0).run(
+        error=lambda fname, message: errors.append(fname))
+    serial = touchstoneLoader(filelist, maxWorkers=1).run()
+
+    assert errors == [filelist[5]]
+    assert [net.name for net in parallel] == [net.name for net in serial] == ['dev{:03d}'.format(k) for k in range(12)]
+    for a, b in zip(parallel, serial):
+        np.testing.assert_array_equal(a.s, b.s)
+
+
+def test_cancel_stops_loading(tmp_path):
+    filelist = writeFiles(tmp_path, 40)
+    loader = touchstoneLoader(filelist, maxWorkers=2, serialThreshold=0)
+    loaded = list(loader.iterArrays(progress=lambda nDone, nTotal, fname: loader.cancel()))
+    assert loader.cancelled
+    assert len(loaded) == 1
@@ -0,0 +1,42 @@
+'''
+Lot store creation
+
+@author: khershberger
+'''
+
+import os
+
+import numpy as np
+import skrf
+
+from mwassist.sparam.lotstore import createLotStore
+
+
+def writeLot(directory, nFiles=12):
+    """
+    A lot whose first file has its own grid and impedance, followed by
+    devices on a finer 50 Ohm grid
+    """
+    rng = np.random.default_rng(0)
+    filelist = []
+    for k in range(nFiles):
+        nFreq, z0 = (31, 75) if k == 0 else (51, 50)
+        freq = skrf.Frequency(1, 2, nFreq, unit='GHz')
+        s = 0.1 * (rng.standard_normal((nFreq, 2, 2)) + 1j*rng.standard_normal((nFreq, 2, 2)))
+        net = skrf.Network(frequency=freq, s=s, z0=z0, name='dev{:02d}'.format(k))
+        net.write_touchstone(os.path.join(directory, net.name))
+        filelist.append(os.path.join(directory, net.name + '.s2p'))
+    return filelist
+
+
+def test_reference_is_first_file(tmp_path):
+    filelist = writeLot(str(tmp_path))
+
+    stores = [createLotStore(str(tmp_path / 'store{:d}'.format(k)), filelist, maxWorkers=4)
+              for k in range(3)]
+
+    for store in stores:
+        assert len(store.frequency) == 31
+        assert store.z0 == [75.0, 75.0]
+        assert store.names == [os.path.splitext(os.path.basename(fname))[0] for fname in filelist]
+        np.testing.assert_array_equal(store.s, stores[0].s)
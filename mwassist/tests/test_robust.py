@@ -0,0 +1,58 @@
+'''
+Robust statistics against numpy and scipy.stats
+
+@author: khershberger
+'''
+
+import numpy as np
+import pytest
+import scipy.stats
+import skrf
+
+from mwassist.sparam.stats import partitionMedian, polarMean, robustScores, summarizeRobust, trimmedMean
+from mwassist.tests.lots import randomStack
+
+
+@pytest.mark.parametrize('n', [1, 2, 7, 8, 41])
+def test_median_and_trimmed_mean(n):
+    x = np.random.default_rng(n).standard_normal((n, 5, 3))
+    np.testing.assert_allclose(partitionMedian(x), np.median(x, axis=0), rtol=1e-12)
+    for proportion in (0.0, 0.1, 0.25, 0.4):
+        np.testing.assert_allclose(trimmedMean(x, proportion), scipy.stats.trim_mean(x, proportion, axis=0),
+                                   rtol=1e-12, atol=1e-15)
+
+
+def test_scores():
+    x = np.random.default_rng(0).standard_normal((50, 4))
+    mad = scipy.stats.median_abs_deviation(x, axis=0, scale='normal')
+    reference = np.abs(x - np.median(x, axis=0)) / mad
+    # 0.6745 rounds the normal quartile 0.67449
+    np.testing.assert_allclose(robustScores(x, 1e-9), reference, rtol=1e-4)
+    np.testing.assert_allclose(robustScores(x, 1e-9, method='zscore'), np.abs(scipy.stats.zscore(x, axis=0)),
+                               rtol=1e-12)
+    # Identical values score 0 instead of NaN
+    assert np.all(robustScores(np.ones((5, 2)), 0.1) == 0)
+    with pytest.raises(ValueError):
+        robustScores(x, 1e-9, method='iqr')
+
+
+def test_outlier_devices():
+    s = randomStack(30, nFreq=61, ripple=0.02, phaseSpread=0.02)
+    s[[4, 17]] *= 3
+    frequency = skrf.Frequency(1, 2, 61, unit='GHz')
+    summary = summarizeRobust(s, frequency)
+    np.testing.assert_array_equal(summary.outlierIndices, [4, 17])
+
+    keep = np.ones(30, dtype=bool)
+    keep[[4, 17]] = False
+    np.testing.assert_allclose(summary.cleanMean.s, polarMean(s[keep]), rtol=1e-12)
+    np.testing.assert_allclose(np.abs(summary.median.s), np.median(np.abs(s), axis=0), rtol=1e-12)
+    np.testing.assert_allclose(np.abs(summary.trimmed.s), scipy.stats.trim_mean(np.abs(s), 0.1, axis=0),
+                               rtol=1e-12)
+
+    chunked = summarizeRobust(s, frequency, maxBytes=s.nbytes // 4)
+    np.testing.assert_array_equal(chunked.outliers, summary.outliers)
+    np.testing.assert_array_equal(chunked.flagged, summary.flagged)
+    np.testing.assert_allclose(chunked.scores, summary.scores)
+    for name in ('median', 'trimmed', 'cleanMean'):
+        np.testing.assert_allclose(getattr(chunked, name).s, getattr(summary, name).s)
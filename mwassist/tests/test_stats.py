@@ -0,0 +1,74 @@
+'''
+Stacked statistics against numpy reductions
+
+@author: khershberger
+'''
+
+import numpy as np
+import skrf
+
+from mwassist.sparam.stats import calcNetworkStatistics, lotStack, polarMean, specMask, summarizeStack, \
+    summarizeStackChunked
+from mwassist.tests.lots import randomLot, randomStack
+
+
+def frequency(nFreq=31):
+    return skrf.Frequency(1, 2, nFreq, unit='GHz')
+
+
+def test_polar_mean_matches_unwrapped_reference():
+    s = randomStack(25, phaseSpread=0.5)
+    phase = np.unwrap(np.angle(s), axis=0)
+    reference = np.abs(s).mean(axis=0) * np.exp(1j*phase.mean(axis=0))
+    np.testing.assert_allclose(polarMean(s), reference, atol=1e-12)
+
+
+def test_stack_matches_networks():
+    networks = randomLot(12)
+    f, allS = lotStack(networks)
+    np.testing.assert_array_equal(allS, np.stack([net.s for net in networks]))
+    np.testing.assert_allclose(calcNetworkStatistics(networks).s, polarMean(allS))
+
+
+def test_summary_matches_numpy():
+    s = randomStack(40, ripple=0.1)
+    summary = summarizeStack(s, frequency(), percentiles=(5, 50, 95))
+    db = 20*np.log10(np.abs(s))
+
+    np.testing.assert_allclose(summary.db['mean'], db.mean(axis=0), atol=1e-12)
+    np.testing.assert_allclose(summary.db['std'], db.std(axis=0), atol=1e-12)
+    for key, q in (('min', 0), ('p5', 5), ('p50', 50), ('p95', 95), ('max', 100)):
+        np.testing.assert_allclose(summary.db[key], np.percentile(db, q, axis=0), atol=1e-12)
+
+    phaseMean = np.angle(polarMean(s))
+    deviation = np.degrees(np.angle(s * np.exp(-1j*phaseMean)))
+    np.testing.assert_allclose(summary.phase['std'], deviation.std(axis=0), atol=1e-9)
+    np.testing.assert_allclose(summary.phase['p50'], np.percentile(deviation, 50, axis=0) + np.degrees(phaseMean),
+                               atol=1e-9)
+
+
+def test_chunked_equals_unchunked():
+    s = randomStack(30, nFreq=101)
+    specs = [specMask(2, 1, 1.2e9, 1.8e9, lower=-6.5)]
+    for averaging in ('polar', 'circular'):
+        whole = summarizeStack(s, frequency(101), specs=specs, averaging=averaging)
+        chunked = summarizeStackChunked(s, frequency(101), specs=specs, maxBytes=s.nbytes // 7,
+                                        averaging=averaging)
+        np.testing.assert_allclose(chunked.mean.s, whole.mean.s)
+        assert sorted(chunked.db) == sorted(whole.db)
+        assert sorted(chunked.phase) == sorted(whole.phase)
+        for key in whole.db:
+            np.testing.assert_allclose(chunked.db[key], whole.db[key])
+        for key in whole.phase:
+            np.testing.assert_allclose(chunked.phase[key], whole.phase[key])
+        np.testing.assert_array_equal(chunked.passed, whole.passed)
+
+
+def test_spec_mask():
+    s = randomStack(10)
+    s[3, 20, 1, 0] = 0.01
+    summary = summarizeStack(s, frequency(), specs=[specMask(2, 1, 1.5e9, 2e9, lower=-20)])
+    expected = np.ones(10, dtype=bool)
+    expected[3] = False
+    np.testing.assert_array_equal(summary.passed, expected)
+    assert summary.yieldFraction == 0.9
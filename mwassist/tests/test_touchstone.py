@@ -0,0 +1,183 @@
+'''
+Fast touchstone parser against skrf
+
+@author: khershberger
+'''
+
+import os
+
+import numpy as np
+import pytest
+import skrf
+
+from mwassist.sparam import loader, touchstone
+
+
+def randomNetwork(nports, unit='GHz', nFreq=11, seed=0):
+    rng = np.random.default_rng(seed + nports)
+    freq = skrf.Frequency(1, 2, nFreq, unit=unit)
+    s = 0.5 * (rng.standard_normal((nFreq, nports, nports))
+               + 1j*rng.standard_normal((nFreq, nports, nports)))
+    return skrf.Network(frequency=freq, s=s, name='dut')
+
+
+def writeNetwork(tmp_path, net, name, **kwargs):
+    """
+    Writes net with skrf as name.sNp, which is the only extension the
+    loaders accept whatever the parameter type or version
+    """
+    filename = os.path.join(str(tmp_path), name + '.s{:d}p'.format(net.nports))
+    with open(filename, 'w') as fh:
+        fh.write(net.write_touchstone(return_string=True, **kwargs))
+    return filename
+
+
+def assertMatchesSkrf(filename):
+    arrays = touchstone.readTouchstoneArrays(filename)
+    reference = skrf.Network(filename)
+    np.testing.assert_allclose(arrays['f'], reference.frequency.f, rtol=1e-12)
+    np.testing.assert_allclose(arrays['s'], reference.s, rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(arrays['z0'], reference.z0, rtol=1e-12)
+    return arrays
+
+
+@pytest.mark.parametrize('nports', [1, 2, 3, 4, 5, 6])
+@pytest.mark.parametrize('form', ['ri', 'ma', 'db'])
+def test_formats_match_skrf(tmp_path, nports, form):
+    net = randomNetwork(nports)
+    assertMatchesSkrf(writeNetwork(tmp_path, net, 'dut', form=form))
+
+
+@pytest.mark.parametrize('unit', ['Hz', 'kHz', 'MHz', 'GHz'])
+def test_units_match_skrf(tmp_path, unit):
+    net = randomNetwork(2, unit=unit)
+    arrays = assertMatchesSkrf(writeNetwork(tmp_path, net, 'dut'))
+    assert arrays['unit'] == unit
+
+
+def test_text_matches_file(tmp_path):
+    filename = writeNetwork(tmp_path, randomNetwork(3), 'dut')
+    with open(filename, 'r') as fh:
+        f, s, z0, options, comments = touchstone.parseTouchstoneText(fh.read(), 3)
+    reference = skrf.Network(filename)
+    np.testing.assert_allclose(f, reference.frequency.f, rtol=1e-12)
+    np.testing.assert_allclose(s, reference.s, rtol=1e-9, atol=1e-12)
+
+
+def test_z_parameters_with_noise(tmp_path):
+    net = randomNetwork(2)
+    filename = writeNetwork(tmp_path, net, 'dut', parameter='Z', form='ri')
+    # Noise parameters: frequency, NFmin, |Gamma_opt|, angle, Rn
+    with open(filename, 'a') as fh:
+        for fGHz in (1.0, 1.5, 2.0):
+            fh.write('{:g} 0.5 0.3 45 0.2\n'.format(fGHz))
+
+    reference = skrf.Network(filename)
+    assert reference.noisy
+    arrays = assertMatchesSkrf(filename)
+    assert arrays['s'].shape == (11, 2, 2)
+
+
+@pytest.mark.parametrize('options', [{'version': '2.0'}, {'parameter': 'G'}, {'parameter': 'H'}])
+def test_fallback_to_skrf(tmp_path, options):
+    net = randomNetwork(2)
+    filename = writeNetwork(tmp_path, net, 'dut', **options)
+    with pytest.raises(ValueError):
+        touchstone.readTouchstoneArrays(filename)
+
+    arrays = loader.readTouchstoneArrays(filename)
+    reference = skrf.Network(filename)
+    np.testing.assert_allclose(arrays['f'], reference.frequency.f)
+    np.testing.assert_allclose(arrays['s'], reference.s)
+
+
+def test_terahertz(tmp_path):
+    # skrf does not read THz option lines, so compare with the values written
+    filename = os.path.join(str(tmp_path), 'dut.s1p')
+    with open(filename, 'w') as fh:
+        fh.write('# THz S RI R 50\n0.1 0.5 0.1\n0.25 0.4 -0.2\n')
+    arrays = loader.readTouchstoneArrays(filename)
+    np.testing.assert_allclose(arrays['f'], [1e11, 2.5e11])
+    np.testing.assert_allclose(arrays['s'][:, 0, 0], [0.5+0.1j, 0.4-0.2j])
+    assert arrays['unit'] == 'THz'
+    assert touchstone.networkFromArrays(arrays).frequency.unit.lower() == 'thz'
+
+
+def test_unknown_option_rejected():
+    with pytest.raises(ValueError):
+        touchstone.parseTouchstoneText('# PHz S RI R 50\n1 0.5 0.1\n', 1)
+
+
+@pytest.mark.parametrize('fmt', ['ri', 'ma', 'db'])
+@pytest.mark.parametrize('nports', [1, 2, 3, 4, 6])
+def test_writer_round_trip(tmp_path, nports, fmt):
+    net = randomNetwork(nports, unit='MHz')
+    filename = touchstone.writeTouchstone(os.path.join(str(tmp_path), 'dut.s1p'), net.f, net.s, z0=75,
+                                          unit='MHz', fmt=fmt, comments='lot A\nwafer 3')
+    assert filename.endswith('dut.s{:d}p'.format(nports))
+
+    arrays = touchstone.readTouchstoneArrays(filename)
+    reference = skrf.Network(filename)
+    for s in (arrays['s'], reference.s):
+        np.testing.assert_allclose(s, net.s, rtol=1e-8, atol=1e-12)
+    np.testing.assert_allclose(arrays['f'], net.f, rtol=1e-12)
+    np.testing.assert_allclose(reference.z0, 75)
+    assert 'wafer 3' in arrays['comments']
+
+
+@pytest.mark.parametrize('nports', [3, 4, 6])
+def test_writer_wraps_rows(tmp_path, nports):
+    net = randomNetwork(nports, nFreq=3)
+    text = touchstone.formatTouchstoneText(net.f, net.s)
+    rows = [line.split() for line in text.splitlines() if not line.startswith(('!', '#'))]
+    # One line per matrix row of at most four pairs, the first led by the frequency
+    linesPerRow = (nports + 3) // 4
+    assert len(rows) == 3 * nports * linesPerRow
+    for k, row in enumerate(rows):
+        pairs = (len(row) - (1 if k % (nports*linesPerRow) == 0 else 0)) // 2
+        assert pairs <= 4
+
+
+def test_write_network_keeps_unit_and_comments(tmp_path):
+    net = randomNetwork(2, unit='kHz')
+    net.comments = 'bias 5 V'
+    filename = touchstone.writeNetwork(net, os.path.join(str(tmp_path), 'dut.s2p'), fmt='ma')
+    reference = skrf.Network(filename)
+    np.testing.assert_allclose(reference.s, net.s, rtol=1e-8, atol=1e-12)
+    assert reference.frequency.unit.lower() == 'khz'
+    assert 'bias 5 V' in reference.comments
+
+
+def test_write_network_terahertz(tmp_path):
+    net = randomNetwork(2, unit='THz')
+    filename = touchstone.writeNetwork(net, os.path.join(str(tmp_path), 'dut.s2p'))
+    arrays = touchstone.readTouchstoneArrays(filename)
+    np.testing.assert_allclose(arrays['f'], net.f, rtol=1e-12)
+    np.testing.assert_allclose(arrays['s'], net.s, rtol=1e-8, atol=1e-12)
+    assert arrays['unit'] == 'THz'
+
+
+@pytest.mark.parametrize('z0', [[50, 75], [50+5j, 50+5j], 'frequency'])
+def test_write_network_keeps_port_impedances(tmp_path, z0):
+    net = randomNetwork(2)
+    if z0 == 'frequency':
+        z0 = np.linspace(40, 60, len(net.f))[:, None] * np.ones(2)
+    net.z0 = z0
+    filename = touchstone.writeNetwork(net, os.path.join(str(tmp_path), 'dut.s2p'))
+
+    # Too much for a v1 option line, so the fast parser hands over to skrf
+    with pytest.raises(ValueError):
+        touchstone.readTouchstoneArrays(filename)
+    arrays = loader.readTouchstoneArrays(filename)
+    np.testing.assert_allclose(arrays['z0'], net.z0, rtol=1e-12)
+    np.testing.assert_allclose(arrays['s'], net.s, rtol=1e-9, atol=1e-12)
+
+
+def test_writer_blocks_join_to_file():
+    net = randomNetwork(3, nFreq=25)
+    text = touchstone.formatTouchstoneText(net.f, net.s, fmt='ma')
+    blocks = list(touchstone.iterTouchstoneText(net.f, net.s, fmt='ma', blockSize=4))
+    assert len(blocks) == 1 + 7
+    assert ''.join(blocks) == text
+    f, s, z0, options, comments = touchstone.parseTouchstoneText(text, 3)
+    np.testing.assert_allclose(s, net.s, rtol=1e-8, atol=1e-12)
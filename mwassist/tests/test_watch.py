@@ -0,0 +1,75 @@
+'''
+Directory scanning and polling of watch mode
+
+@author: khershberger
+'''
+
+import os
+import time
+
+import pytest
+
+from mwassist.sparam.watch import directoryScanner
+
+
+def writeFile(path, text='# GHz S RI R 50\n', age=10):
+    with open(path, 'w') as f:
+        f.write(text)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def test_scanner_reports_new_and_changed(tmp_path):
+    first = writeFile(tmp_path / 'a.s2p')
+    writeFile(tmp_path / 'notes.txt')
+    scanner = directoryScanner(str(tmp_path))
+    assert scanner.scan() == ([first], [], 0)
+    assert scanner.scan() == ([], [], 0)
+
+    second = writeFile(tmp_path / 'b.S2P')
+    writeFile(first, '# GHz S RI R 50\n1 0 0 0 0 0 0 0 0\n')
+    assert scanner.scan() == ([second], [first], 0)
+
+
+def test_scanner_holds_back_settling_files(tmp_path):
+    scanner = directoryScanner(str(tmp_path), settle=60)
+    fname = writeFile(tmp_path / 'a.s2p', age=0)
+    assert scanner.scan() == ([], [], 1)
+    writeFile(fname, age=120)
+    assert scanner.scan() == ([fname], [], 0)
+
+
+def test_prime_skips_existing(tmp_path):
+    writeFile(tmp_path / 'a.s2p')
+    scanner = directoryScanner(str(tmp_path))
+    scanner.prime()
+    assert scanner.scan() == ([], [], 0)
+
+
+def test_poll_emits_only_on_change(tmp_path):
+    QtCore = pytest.importorskip('PyQt5.QtCore')
+    from mwassist.sparam.watch import directoryWatcher
+
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    fname = writeFile(tmp_path / 'a.s2p')
+    watcher = directoryWatcher(str(tmp_path), poll=60000)
+    emitted = []
+    watcher.changed.connect(lambda: emitted.append(True))
+    watcher.start()
+    try:
+        watcher.onPoll()
+        watcher.onPoll()
+        assert emitted == []
+
+        writeFile(fname, '# GHz S RI R 50\n1 0 0 0 0 0 0 0 0\n')
+        watcher.onPoll()
+        watcher.onPoll()
+        assert emitted == [True]
+
+        os.remove(fname)
+        watcher.onPoll()
+        assert emitted == [True, True]
+    finally:
+        watcher.stop()
+    app.processEvents()
@@ -8,6 +8,11 @@ setup(name = 'pysmith',
       authon = 'Kyle Hershberger',
       version = '0.1.0',
       packages = find_packages(),
+      entry_points = {
+          'console_scripts': ['mwassist = mwassist.cli:main',
+                              'mwassist-benchmark = mwassist.benchmark:main'],
+          'gui_scripts': ['mwassist-gui = mwassist.gui.gui:main'],
+          },
       install_requires = [
           'matplotlib',
           'numpy',